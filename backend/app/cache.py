@@ -0,0 +1,265 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+import json
+import threading
+import time
+
+from app.config import settings
+
+class CacheBackend(ABC):
+    """Interface mínima usada pelo ResponseCache (valores são strings JSON)"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: int):
+        ...
+
+    @abstractmethod
+    def incr(self, key: str) -> int:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    # Used from request handlers; backends whose client blocks override them with a non-blocking one
+    async def get_async(self, key: str) -> Optional[str]:
+        return self.get(key)
+
+    async def set_async(self, key: str, value: str, ttl: int):
+        self.set(key, value, ttl)
+
+    async def incr_async(self, key: str) -> int:
+        return self.incr(key)
+
+class NullCache(CacheBackend):
+    def get(self, key: str) -> Optional[str]:
+        return None
+
+    def set(self, key: str, value: str, ttl: int):
+        pass
+
+    def incr(self, key: str) -> int:
+        return 0
+
+    def delete(self, key: str):
+        pass
+
+class MemoryCache(CacheBackend):
+    """LRU em processo com TTL, para testes e execução em um único nó"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value, expires_at = self._entries.get(key, ("0", None))
+            value = str(int(value) + 1)
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            return int(value)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class RedisCache(CacheBackend):
+    def __init__(self, url: str):
+        import redis  # optional dependency, only needed for this backend
+        import redis.asyncio
+        # The blocking client serves jobs and thread callbacks; request handlers use the asyncio one
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.async_client = redis.asyncio.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: str, ttl: int):
+        self.client.set(key, value, ex=ttl or None)
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(key))
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        return await self.async_client.get(key)
+
+    async def set_async(self, key: str, value: str, ttl: int):
+        await self.async_client.set(key, value, ex=ttl or None)
+
+    async def incr_async(self, key: str) -> int:
+        return int(await self.async_client.incr(key))
+
+class ResponseCache:
+    """Cache de respostas por usuário, versionado por gerações.
+
+    Cada chave inclui a geração do usuário (incrementada a cada sincronização) e,
+    quando a resposta depende dos clusters, a geração dos clusters (incrementada
+    a cada clusterização). Invalidar é só incrementar um contador: as entradas
+    antigas deixam de ser lidas e expiram pelo TTL/LRU.
+
+    Com o backend em memória os contadores são do processo, e a invalidação feita
+    por outro worker não chega aqui; por isso as rotas passam também a versão lida
+    do banco (o ETag), que entra na chave e impede servir um corpo antigo sob um
+    ETag novo.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    async def _generation(self, key: str) -> str:
+        return await self.backend.get_async(key) or "0"
+
+    async def _key(self, namespace: str, user_id: int, depends_on_clusters: bool, version: Optional[str]) -> str:
+        key = f"resp:{namespace}:{user_id}:u{await self._generation(f'gen:user:{user_id}')}"
+        if depends_on_clusters:
+            key += f":c{await self._generation('gen:clusters')}"
+        if version is not None:
+            key += ":v" + version.strip('"')
+        return key
+
+    def _count(self, counters: Dict[str, int], namespace: str):
+        with self._lock:
+            counters[namespace] = counters.get(namespace, 0) + 1
+
+    async def get_or_build(
+        self,
+        namespace: str,
+        user_id: int,
+        builder: Callable[[], Awaitable[Any]],
+        depends_on_clusters: bool = False,
+        version: Optional[str] = None
+    ) -> Any:
+        """Retorna a resposta em cache ou constrói, guarda e retorna (exceções não são guardadas)"""
+        return await self._get_or_build(
+            namespace, user_id, builder, depends_on_clusters, version,
+            encode=lambda value: json.dumps(value, default=str), decode=json.loads
+        )
+
+    async def get_or_build_bytes(
+        self,
+        namespace: str,
+        user_id: int,
+        builder: Callable[[], Awaitable[bytes]],
+        depends_on_clusters: bool = False,
+        version: Optional[str] = None
+    ) -> bytes:
+        """Como get_or_build, para respostas já serializadas: guarda e devolve o JSON sem parse"""
+        return await self._get_or_build(
+            namespace, user_id, builder, depends_on_clusters, version,
+            encode=lambda value: value.decode(), decode=lambda cached: cached.encode()
+        )
+
+    async def _get_or_build(
+        self,
+        namespace: str,
+        user_id: int,
+        builder: Callable[[], Awaitable[Any]],
+        depends_on_clusters: bool,
+        version: Optional[str],
+        encode: Callable[[Any], str],
+        decode: Callable[[str], Any]
+    ) -> Any:
+        key = None
+        try:
+            key = await self._key(namespace, user_id, depends_on_clusters, version)
+            cached = await self.backend.get_async(key)
+            if cached is not None:
+                self._count(self.hits, namespace)
+                return decode(cached)
+        except Exception as e:
+            # A cache outage must never fail the request
+            self.errors += 1
+            print(f"⚠️ Erro no cache de respostas: {e}")
+
+        self._count(self.misses, namespace)
+        value = await builder()
+        if key is not None:
+            try:
+                await self.backend.set_async(key, encode(value), self.ttl)
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Erro no cache de respostas: {e}")
+        return value
+
+    def invalidate_user(self, user_id: int):
+        self._bump(f"gen:user:{user_id}")
+
+    def invalidate_clusters(self):
+        self._bump("gen:clusters")
+
+    async def invalidate_user_async(self, user_id: int):
+        await self._bump_async(f"gen:user:{user_id}")
+
+    async def invalidate_clusters_async(self):
+        await self._bump_async("gen:clusters")
+
+    def _bump(self, key: str):
+        try:
+            self.backend.incr(key)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Erro ao invalidar cache de respostas: {e}")
+
+    async def _bump_async(self, key: str):
+        try:
+            await self.backend.incr_async(key)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Erro ao invalidar cache de respostas: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        hits = sum(self.hits.values())
+        misses = sum(self.misses.values())
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "errors": self.errors,
+            "by_namespace": {
+                namespace: {"hits": self.hits.get(namespace, 0), "misses": self.misses.get(namespace, 0)}
+                for namespace in sorted(set(self.hits) | set(self.misses))
+            }
+        }
+
+def build_backend() -> CacheBackend:
+    if settings.cache_backend == "redis":
+        return RedisCache(settings.redis_url)
+    if settings.cache_backend == "memory":
+        return MemoryCache(settings.cache_max_entries)
+    return NullCache()
+
+response_cache = ResponseCache(build_backend(), settings.cache_ttl_seconds)
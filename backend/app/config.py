@@ -1,14 +1,43 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 class Settings(BaseSettings):
     # Spotify API Configuration
     spotify_client_id: str
     spotify_client_secret: str
     spotify_redirect_uri: str = "http://localhost:8000/auth/callback"
+    spotify_token_refresh_margin_seconds: int = 300  # renew tokens expiring within this window
+    spotify_token_refresh_interval_seconds: int = 60  # 0 disables the background refresh
+    # The background refresh only covers users who logged in or synced recently; the rest renew on demand
+    spotify_token_refresh_active_days: int = 7
+    spotify_token_refresh_batch_size: int = 500  # most users renewed per run, soonest expiry first
+    spotify_token_refresh_concurrency: int = 4  # parallel calls to the Spotify token endpoint
+    # Point both at bench/fake_spotify_server.py for load tests
+    spotify_api_base_url: str = "https://api.spotify.com/v1/"
+    spotify_accounts_base_url: str = "https://accounts.spotify.com"
     
     # Database Configuration
     database_url: str
+    async_database_url: Optional[str] = None  # defaults to database_url with the asyncpg/aiosqlite driver
+    
+    # Connection pools: the async pool serves requests, the sync pool serves jobs, scripts and token refresh
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_sync_pool_size: int = 2
+    db_sync_max_overflow: int = 3
+    db_pool_timeout_seconds: int = 30
+    db_pool_recycle_seconds: int = 1800
+    db_pool_pre_ping: bool = True
+    # Read replicas (same URL format as database_url) for endpoints using get_read_db; empty = primary only
+    db_replica_urls: List[str] = []
+    db_replica_pool_size: int = 10
+    db_replica_max_overflow: int = 10
+    db_replica_retry_seconds: int = 30  # a replica that refused a connection is skipped for this long
+    read_your_writes_seconds: int = 10  # after a user's own write, their reads stay on the primary (> replica lag)
+    # Connection budget: must match max_connections in init.sql
+    web_concurrency: int = 1  # uvicorn/gunicorn worker processes
+    db_max_connections: int = 200
+    db_reserved_connections: int = 10  # superuser, migrations, psql sessions
     
     # Security
     secret_key: str
@@ -19,6 +48,58 @@ class Settings(BaseSettings):
     debug: bool = True
     cors_origins: List[str] = ["http://localhost:3000", "http://localhost:5173"]
     
+    # Audio features dataset (CSV keyed by track id); defaults to backend/data/spotify_features.csv
+    tracks_dataset_path: Optional[str] = None
+    
+    # Clustering
+    clustering_batch_size: int = 1024
+    clustering_read_chunk_size: int = 10000
+    clustering_write_chunk_size: int = 5000
+    clustering_max_clusters: int = 5  # upper bound of the heuristic k
+    clustering_auto_k: bool = True
+    clustering_k_min: int = 2
+    clustering_k_max: int = 12
+    clustering_selection_sample_size: int = 20000
+    clustering_silhouette_sample_size: int = 5000
+    clustering_selection_jobs: int = 4
+    clustering_refresh_interval_minutes: int = 60  # 0 disables the periodic partial fit
+    
+    # Response cache ("memory", "redis" or "none"). "memory" is per worker: entries are keyed by the
+    # profile/model versions read from the database, so another worker's writes never serve stale bodies
+    cache_backend: str = "memory"
+    redis_url: str = "redis://localhost:6379/0"
+    cache_ttl_seconds: int = 3600
+    cache_max_entries: int = 10000
+    
+    # Authenticated principal cache (per process, token-to-user resolution)
+    principal_cache_ttl_seconds: int = 300
+    principal_cache_max_entries: int = 10000
+    
+    # User search: on SQLite an in-process index is used instead of pg_trgm. New users are
+    # loaded every few seconds; the full rebuild picks up renames made in other workers
+    user_search_limit: int = 10
+    user_search_refresh_seconds: int = 5
+    user_search_rebuild_minutes: int = 10
+    
+    # Users allowed on the /admin endpoints (bulk export)
+    admin_user_ids: List[int] = []
+    
+    # Streaming exports: rows fetched from the server-side cursor per response chunk
+    export_chunk_size: int = 1000
+    
+    # Per-route SQL budgets (@query_budget): "off", "warn" (log violations) or "raise" (development only)
+    query_budget_mode: str = "off"
+    
+    # Background jobs (process pool)
+    job_workers: int = 1
+    job_stale_after_minutes: int = 30
+    
+    # Extended streaming-history imports (POST /users/me/import)
+    import_upload_dir: Optional[str] = None  # uploads wait here for the job; defaults to the system temp dir
+    import_max_file_mb: int = 500
+    import_batch_size: int = 5000
+    import_min_ms_played: int = 30000  # Spotify counts a stream after 30s
+    
     class Config:
         env_file = ".env"
 
@@ -1,18 +1,157 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from typing import Dict, List, Optional
+import asyncio
+import itertools
+import time
+
+from app.cache import MemoryCache, RedisCache
 from app.config import settings
+from app.db_pool import engine_options
+from app.metrics import instrument_engine
+
+# Async driver used by the request path for each backend
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        return url
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
 
-engine = create_engine(settings.database_url)
+# Blocking engine for background jobs, worker processes and scripts
+engine = create_engine(
+    settings.database_url,
+    **engine_options(settings.database_url, "sync", settings.db_sync_pool_size, settings.db_sync_max_overflow)
+)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Non-blocking engine for request handlers
+ASYNC_DATABASE_URL = settings.async_database_url or async_database_url(settings.database_url)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **engine_options(ASYNC_DATABASE_URL, "async", settings.db_pool_size, settings.db_max_overflow, is_async=True)
+)
+
+# Read-only engines for the read-heavy GETs, used round-robin by get_read_db
+replica_engines = []
+for index, replica_url in enumerate(settings.db_replica_urls):
+    replica_async_url = async_database_url(replica_url)
+    replica_engines.append(create_async_engine(
+        replica_async_url,
+        **engine_options(replica_async_url, f"replica{index}", settings.db_replica_pool_size, settings.db_replica_max_overflow, is_async=True)
+    ))
+
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+for index, replica_engine in enumerate(replica_engines):
+    instrument_engine(replica_engine.sync_engine, f"replica{index}")
+
+# Objects stay readable after commit: async sessions cannot lazy-load expired attributes
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+ReplicaSessions: List[async_sessionmaker] = [
+    async_sessionmaker(replica_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    for replica_engine in replica_engines
+]
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+def _dialect_insert(dialect_name: str):
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"ON CONFLICT não suportado para {dialect_name}")
+    return insert
+
+def insert_ignoring_conflicts(table, dialect_name: str, index_elements):
+    """INSERT que ignora linhas já existentes (ON CONFLICT DO NOTHING)"""
+    # Concurrent writers of the same row (two syncs seeing the same new track) keep the first one
+    return _dialect_insert(dialect_name)(table).on_conflict_do_nothing(index_elements=index_elements)
+
+def insert_adding_counts(table, dialect_name: str, index_elements, count_column: str):
+    """INSERT que, se a linha já existe, soma a contagem nova à guardada (contadores agregados)"""
+    stmt = _dialect_insert(dialect_name)(table)
+    # Atomic in the database, so concurrent writers of the same counter never lose an increment
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={count_column: table.c[count_column] + stmt.excluded[count_column]}
+    )
+
+def insert_merging_means(table, dialect_name: str, index_elements, count_column: str, mean_columns):
+    """INSERT que, se a linha já existe, combina as médias novas com as guardadas, ponderadas pelas contagens"""
+    stmt = _dialect_insert(dialect_name)(table)
+    count, added = table.c[count_column], stmt.excluded[count_column]
+    # Every right-hand side reads the row as it was before the update
+    set_ = {count_column: count + added}
+    for col in mean_columns:
+        set_[col] = (
+            func.coalesce(table.c[col], 0.0) * count + func.coalesce(stmt.excluded[col], 0.0) * added
+        ) / func.nullif(count + added, 0)
+    return stmt.on_conflict_do_update(index_elements=index_elements, set_=set_)
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
+_replica_turn = itertools.count()
+_replica_down_until: Dict[int, float] = {}
+
+# Shared through Redis when configured, so the window holds whichever worker serves the next read
+_recent_writes = RedisCache(settings.redis_url) if settings.cache_backend == "redis" else MemoryCache(settings.principal_cache_max_entries)
+
+def mark_recent_write(user_id: int):
+    """Abre a janela de read-your-writes: as leituras do usuário vão ao primário por um tempo"""
+    if not ReplicaSessions or settings.read_your_writes_seconds <= 0:
+        return
+    try:
+        _recent_writes.set(f"recent-write:{user_id}", "1", settings.read_your_writes_seconds)
+    except Exception as e:
+        print(f"⚠️ Erro ao registrar escrita recente: {e}")
+
+async def mark_recent_write_async(user_id: int):
+    """mark_recent_write para os handlers async (não bloqueia o event loop com o Redis)"""
+    if not ReplicaSessions or settings.read_your_writes_seconds <= 0:
+        return
+    try:
+        await _recent_writes.set_async(f"recent-write:{user_id}", "1", settings.read_your_writes_seconds)
+    except Exception as e:
+        print(f"⚠️ Erro ao registrar escrita recente: {e}")
+
+async def has_recent_write(user_id: int) -> bool:
+    try:
+        return await _recent_writes.get_async(f"recent-write:{user_id}") is not None
+    except Exception:
+        # Without the mark we cannot prove the replica is fresh enough for this user
+        return True
+
+async def open_replica_session() -> Optional[AsyncSession]:
+    """Sessão na próxima réplica disponível (round-robin), ou None se nenhuma responder"""
+    for _ in range(len(ReplicaSessions)):
+        index = next(_replica_turn) % len(ReplicaSessions)
+        if _replica_down_until.get(index, 0) > time.monotonic():
+            continue
+        db = ReplicaSessions[index]()
+        try:
+            # Check out the connection now, so a dead replica falls back here instead of failing the query
+            await db.connection()
+            return db
+        except (DBAPIError, OSError, asyncio.TimeoutError) as e:
+            await db.close()
+            _replica_down_until[index] = time.monotonic() + settings.db_replica_retry_seconds
+            print(f"⚠️ Réplica {index} indisponível por {settings.db_replica_retry_seconds}s: {e}")
+    return None
+
+async def open_read_session(user_id: int) -> AsyncSession:
+    """Sessão só de leitura: réplica em round-robin, ou o primário se o usuário escreveu há pouco"""
+    db = None
+    if ReplicaSessions and not await has_recent_write(user_id):
+        db = await open_replica_session()
+    return db or AsyncSessionLocal()
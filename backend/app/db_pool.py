@@ -0,0 +1,130 @@
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from typing import Any, Dict, Optional, Type
+import threading
+import time
+
+from app.config import settings
+
+# Upper bounds (ms) of the checkout wait histogram buckets; the last bucket is +Inf
+WAIT_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+class PoolStats:
+    """Histograma de espera por conexão e contadores de um pool"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.bucket_counts = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.wait_count = 0
+        self.wait_sum_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def observe(self, wait_ms: float, timed_out: bool = False):
+        index = next((i for i, bound in enumerate(WAIT_BUCKETS_MS) if wait_ms <= bound), len(WAIT_BUCKETS_MS))
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.wait_count += 1
+            self.wait_sum_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            cumulative, buckets = 0, []
+            for bound, count in zip(WAIT_BUCKETS_MS + ["+Inf"], self.bucket_counts):
+                cumulative += count
+                buckets.append({"le_ms": bound, "count": cumulative})
+            return {
+                "count": self.wait_count,
+                "sum_ms": self.wait_sum_ms,
+                "avg_ms": self.wait_sum_ms / self.wait_count if self.wait_count else 0.0,
+                "max_ms": self.wait_max_ms,
+                "timeouts": self.timeouts,
+                "buckets": buckets
+            }
+
+# Stats live on the pool class, so they survive pool.recreate() on engine.dispose()
+_instrumented_pools: Dict[str, Type[QueuePool]] = {}
+
+def instrumented_pool_class(name: str, base: Type[QueuePool]) -> Type[QueuePool]:
+    stats = PoolStats(name)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return base._do_get(self)
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            stats.observe((time.perf_counter() - started) * 1000, timed_out)
+
+    pool_class = type(f"Instrumented{base.__name__}", (base,), {"_do_get": _do_get, "stats": stats})
+    _instrumented_pools[name] = pool_class
+    return pool_class
+
+def engine_options(url: str, name: str, pool_size: int, max_overflow: int, is_async: bool = False) -> Dict[str, Any]:
+    """Argumentos do create_engine com o pool configurado e instrumentado"""
+    options: Dict[str, Any] = {
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "pool_recycle": settings.db_pool_recycle_seconds
+    }
+    # SQLite (development) keeps the dialect's own pool; size limits only make sense for a server
+    if make_url(url).get_backend_name() == "sqlite":
+        return options
+
+    options.update(
+        poolclass=instrumented_pool_class(name, AsyncAdaptedQueuePool if is_async else QueuePool),
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.db_pool_timeout_seconds,
+        pool_use_lifo=True  # idle connections beyond the hot set age out through pool_recycle
+    )
+    return options
+
+def pool_status(name: str, pool) -> Dict[str, Any]:
+    status: Dict[str, Any] = {"name": name, "class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+            timeout_seconds=pool.timeout()
+        )
+    pool_class = _instrumented_pools.get(name)
+    if pool_class is not None:
+        status["wait"] = pool_class.stats.snapshot()
+    return status
+
+def connection_budget() -> Dict[str, Any]:
+    """Conexões que o deploy pode abrir no pior caso, contra o max_connections do Postgres"""
+    web = settings.web_concurrency * (
+        settings.db_pool_size + settings.db_max_overflow
+        + settings.db_sync_pool_size + settings.db_sync_max_overflow
+    )
+    jobs = settings.job_workers * (settings.db_sync_pool_size + settings.db_sync_max_overflow)
+    worst_case = web + jobs
+    return {
+        "web_processes": settings.web_concurrency,
+        "job_processes": settings.job_workers,
+        "worst_case_connections": worst_case,
+        "max_connections": settings.db_max_connections,
+        "reserved_connections": settings.db_reserved_connections,
+        "within_budget": worst_case <= settings.db_max_connections - settings.db_reserved_connections
+    }
+
+def check_connection_budget() -> Optional[str]:
+    budget = connection_budget()
+    if budget["within_budget"]:
+        return None
+    return (
+        f"Pools podem abrir {budget['worst_case_connections']} conexões, acima do orçamento de "
+        f"{budget['max_connections'] - budget['reserved_connections']} (max_connections - reservadas)"
+    )
@@ -0,0 +1,60 @@
+from fastapi import Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+import hashlib
+
+from app.models import ClusterModel, ClusterSummary, UserProfile
+
+CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256(":".join(str(part) for part in parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+async def profile_etag(
+    db: AsyncSession,
+    route: str,
+    user_id: int,
+    include_cluster_model: bool = False,
+    include_cluster_summaries: bool = False
+) -> Optional[str]:
+    """ETag forte a partir da versão do perfil (e, se pedido, do modelo/resumos de clusters).
+
+    Só lê colunas de versão; retorna None quando o usuário ainda não tem perfil.
+    """
+    profile_version = await db.scalar(select(UserProfile.version).where(UserProfile.user_id == user_id))
+    if profile_version is None:
+        return None
+
+    parts = [route, user_id, profile_version]
+    if include_cluster_model:
+        model_version = await db.scalar(select(ClusterModel.version).order_by(ClusterModel.id.desc()).limit(1))
+        parts.append(model_version or 0)
+    if include_cluster_summaries:
+        # Summaries also move with other users' syncs, not only with the model
+        parts.extend((await db.execute(select(
+            func.coalesce(func.sum(ClusterSummary.user_count), 0),
+            func.max(ClusterSummary.updated_at)
+        ))).one())
+    return make_etag(*parts)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+def not_modified_response(request: Request, response: Response, etag: Optional[str]) -> Optional[Response]:
+    """Retorna um 304 se o cliente já tem a versão atual; senão anota o ETag na resposta"""
+    if etag is None:
+        return None
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return None
@@ -1,22 +1,38 @@
+import time
+
+# Measured from here: the cost of importing the app is most of a worker's boot time
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from app.config import settings
-import os
+import asyncio
 
-from app.routers import auth, users, compatibility, analysis
-from app.database import engine, Base
+from app.routers import auth, users, compatibility, analysis, admin
+from app.database import async_engine, engine, replica_engines
+from app.cache import response_cache
+from app.db_pool import check_connection_budget, connection_budget, pool_status
+from app.metrics import MetricsMiddleware, registry, sample_lines
+from app.query_budget import QueryBudgetMiddleware, query_budget
+from app.services.jobs import run_periodic_clustering, shutdown_executor
+from app.services.tokens import run_token_refresh
 
 load_dotenv()
 
-Base.metadata.create_all(bind=engine)
+# The schema is managed by Alembic (alembic upgrade head / init_db.py), never on import
 
 app = FastAPI(
     title="SoulMatch.fm API",
     description="API para análise de compatibilidade musical entre usuários do Spotify",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(QueryBudgetMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.cors_origins,
@@ -25,16 +41,101 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(auth.router, prefix="/auth", tags=["authentication"])
-app.include_router(users.router, prefix="/users", tags=["users"])
-app.include_router(compatibility.router, prefix="/compatibility", tags=["compatibility"])
-app.include_router(analysis.router, prefix="/analysis", tags=["analysis"])
+# Prefixes are declared on each APIRouter, so every route knows its full path (metrics and
+# query-budget labels read it from the matched route, whatever the FastAPI version)
+app.include_router(auth.router, tags=["authentication"])
+app.include_router(users.router, tags=["users"])
+app.include_router(compatibility.router, tags=["compatibility"])
+app.include_router(analysis.router, tags=["analysis"])
+app.include_router(admin.router, tags=["admin"])
+
+startup_timings = {"import": time.perf_counter() - _import_started}
+
+@app.on_event("startup")
+async def warn_connection_budget():
+    warning = check_connection_budget()
+    if warning:
+        print(f"⚠️ {warning}")
+
+@app.on_event("startup")
+async def start_cluster_refresh():
+    if settings.clustering_refresh_interval_minutes > 0:
+        asyncio.create_task(run_periodic_clustering(settings.clustering_refresh_interval_minutes))
+
+@app.on_event("startup")
+async def start_token_refresh():
+    if settings.spotify_token_refresh_interval_seconds > 0:
+        asyncio.create_task(run_token_refresh(settings.spotify_token_refresh_interval_seconds))
+
+# Registered last so it runs after the other startup hooks
+@app.on_event("startup")
+async def record_startup_time():
+    startup_timings["ready"] = time.perf_counter() - _import_started
+    print(f"🚀 API pronta em {startup_timings['ready']:.2f}s (import {startup_timings['import']:.2f}s)")
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    shutdown_executor()
+    await async_engine.dispose()
+    for replica_engine in replica_engines:
+        await replica_engine.dispose()
 
 @app.get("/")
+@query_budget(0)
 async def root():
     return {"message": "SoulMatch.fm API - Análise de Compatibilidade Musical"}
 
 @app.get("/health")
+@query_budget(0)
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/stats/cache")
+@query_budget(0)
+async def cache_stats():
+    return response_cache.stats()
+
+def all_pool_status():
+    return [pool_status("async", async_engine.pool), pool_status("sync", engine.pool)] + [
+        pool_status(f"replica{index}", replica_engine.pool) for index, replica_engine in enumerate(replica_engines)
+    ]
+
+@app.get("/stats/pool")
+@query_budget(0)
+async def pool_stats():
+    return {
+        "pools": all_pool_status(),
+        "budget": connection_budget()
+    }
+
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+@query_budget(0)
+async def metrics():
+    """Métricas no formato de texto do Prometheus"""
+    pools = all_pool_status()
+    cache = response_cache.stats()["by_namespace"]
+    extra = []
+    for field, help_text in (("checked_out", "Conexões em uso"), ("overflow", "Conexões acima do pool_size"), ("size", "Tamanho configurado do pool")):
+        extra += sample_lines(
+            f"db_pool_{field}", help_text, "gauge",
+            [({"pool": p["name"]}, p[field]) for p in pools if field in p]
+        )
+    extra += sample_lines(
+        "db_pool_wait_seconds_total", "Tempo total esperando por conexão", "counter",
+        [({"pool": p["name"]}, p["wait"]["sum_ms"] / 1000) for p in pools if "wait" in p]
+    )
+    extra += sample_lines(
+        "db_pool_timeouts_total", "Checkouts que estouraram pool_timeout", "counter",
+        [({"pool": p["name"]}, p["wait"]["timeouts"]) for p in pools if "wait" in p]
+    )
+    extra += sample_lines(
+        "app_startup_seconds", "Tempo de boot do worker (import do app e pronto para servir)", "gauge",
+        [({"phase": phase}, seconds) for phase, seconds in startup_timings.items()]
+    )
+    extra += sample_lines(
+        "response_cache_requests_total", "Consultas ao cache de respostas", "counter",
+        [({"namespace": ns, "result": result}, counts[key]) for ns, counts in cache.items() for result, key in (("hit", "hits"), ("miss", "misses"))]
+    )
+    return PlainTextResponse(registry.render(extra), media_type="text/plain; version=0.0.4")
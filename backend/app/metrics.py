@@ -0,0 +1,224 @@
+from contextvars import ContextVar
+from dataclasses import dataclass
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from typing import Dict, List, Optional, Sequence, Tuple
+import re
+import threading
+import time
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+QUERY_COUNT_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200]
+
+class Metric:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _labels(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _format_labels(self, values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.label_names, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        super().__init__(name, help_text, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{self._format_labels(key)} {value}" for key, value in sorted(self._values.items())]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = list(buckets)
+        self._values: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts + [sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._labels(labels)
+        with self._lock:
+            entry = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, entry in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, entry):
+                    lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', repr(float(bound))))} {count}")
+                lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', '+Inf'))} {entry[-1]}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {entry[-2]}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {entry[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self, extra: Sequence[str] = ()) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        lines.extend(extra)
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Latência das requisições HTTP por rota", ("method", "route", "status")
+))
+db_queries_per_request = registry.register(Histogram(
+    "http_request_db_queries", "Comandos SQL executados por requisição", ("method", "route"), QUERY_COUNT_BUCKETS
+))
+db_time_per_request = registry.register(Histogram(
+    "http_request_db_seconds", "Tempo total em SQL por requisição", ("method", "route")
+))
+db_statements = registry.register(Counter(
+    "db_statements_total", "Comandos SQL executados (inclui jobs)", ("engine",)
+))
+db_statement_duration = registry.register(Histogram(
+    "db_statement_duration_seconds", "Latência de cada comando SQL", ("engine",)
+))
+spotify_calls_per_request = registry.register(Histogram(
+    "http_request_spotify_calls", "Chamadas ao Spotify por requisição", ("method", "route"), QUERY_COUNT_BUCKETS
+))
+spotify_requests = registry.register(Counter(
+    "spotify_requests_total", "Chamadas à API do Spotify", ("endpoint", "status")
+))
+spotify_request_duration = registry.register(Histogram(
+    "spotify_request_duration_seconds", "Latência das chamadas à API do Spotify", ("endpoint",)
+))
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+    spotify_calls: int = 0
+
+# Set per request by the middleware; mutated in place, so tasks and threads spawned
+# by the request (which copy the context) report into the same object
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+def instrument_engine(engine: Engine, name: str):
+    """Conta e cronometra cada comando SQL do engine (sync ou o sync_engine de um AsyncEngine)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        elapsed = time.perf_counter() - started
+        db_statements.inc(engine=name)
+        db_statement_duration.observe(elapsed, engine=name)
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("metrics_started"):
+            conn.info["metrics_started"].pop()
+
+def route_template(scope) -> Optional[str]:
+    """Template completo da rota que atendeu a requisição ("/analysis/clustering/{job_id}"), ou None"""
+    route = scope.get("route")
+    path = getattr(route, "path_format", None) or getattr(route, "path", None)
+    if path is None:
+        return None
+    # A route under a Mount only knows its own part; Starlette puts the mount prefix in root_path
+    return scope.get("root_path", "") + path
+
+class MetricsMiddleware:
+    """Middleware ASGI: latência por rota (template, não o path cru) e SQL por requisição"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request_stats.reset(token)
+            # Unmatched paths share one label so scanners cannot blow up the series count
+            route_label = route_template(scope) or "unmatched"
+            method = scope["method"]
+            http_request_duration.observe(elapsed, method=method, route=route_label, status=status_code)
+            db_queries_per_request.observe(stats.queries, method=method, route=route_label)
+            db_time_per_request.observe(stats.db_seconds, method=method, route=route_label)
+            spotify_calls_per_request.observe(stats.spotify_calls, method=method, route=route_label)
+
+_SPOTIFY_ID = re.compile(r"^[0-9A-Za-z]{22}$")
+
+def spotify_endpoint(url: str) -> str:
+    path = url.split("://", 1)[-1]
+    if "://" in url:
+        path = path.split("/", 1)[-1]
+    path = path.split("?", 1)[0].strip("/")
+    if path.startswith("v1/"):
+        path = path[3:]
+    # Ids become placeholders so each endpoint is one series
+    return "/".join("{id}" if _SPOTIFY_ID.match(part) or part.isdigit() else part for part in path.split("/"))
+
+def record_spotify_call(endpoint: str, elapsed: float, status: str):
+    spotify_requests.inc(endpoint=endpoint, status=status)
+    spotify_request_duration.observe(elapsed, endpoint=endpoint)
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.spotify_calls += 1
+
+def sample_lines(name: str, help_text: str, kind: str, samples: Sequence[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Linhas de exposição para valores lidos na hora (gauges de pool, contadores do cache)"""
+    metric = Metric(name, help_text, sorted({key for labels, _ in samples for key in labels}))
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{metric._format_labels(metric._labels(labels))} {value}")
+    return lines
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, Text, Boolean, ForeignKey
+from sqlalchemy import DDL, Column, Integer, String, Date, DateTime, Float, Text, Boolean, ForeignKey, Index, event, text
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import false, func
 from app.database import Base
 
 class User(Base):
@@ -16,6 +16,7 @@ class User(Base):
     access_token = Column(Text, nullable=True)
     refresh_token = Column(Text, nullable=True)
     token_expires_at = Column(DateTime, nullable=True)
+    last_active_at = Column(DateTime, nullable=True, index=True)  # last login or sync; bounds the proactive token refresh
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -27,6 +28,18 @@ class User(Base):
         foreign_keys="[CompatibilityScore.user1_id]"
     )
 
+# User search (app/services/user_search.py); Postgres only, SQLite uses an in-process index.
+# Byte order ("C") lets LIKE 'q%' be an index range scan already sorted by name
+Index(
+    "ix_users_display_name_prefix", func.lower(User.display_name).collate("C")
+).ddl_if(dialect="postgresql")
+# Trigrams serve LIKE '%q%' and the similarity ordering (<->) from the same GiST index
+Index(
+    "ix_users_display_name_trgm", func.lower(User.display_name).label("display_name_lower"),
+    postgresql_using="gist", postgresql_ops={"display_name_lower": "gist_trgm_ops"}
+).ddl_if(dialect="postgresql")
+event.listen(User.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+
 class Track(Base):
     __tablename__ = "tracks"
     
@@ -34,6 +47,7 @@ class Track(Base):
     spotify_id = Column(String, unique=True, index=True, nullable=False)
     name = Column(String, nullable=False)
     artists = Column(Text, nullable=True)  # JSON string of artists
+    artist_ids = Column(Text, nullable=True)  # comma separated Spotify artist ids
     album = Column(String, nullable=True)
     duration_ms = Column(Integer, nullable=True)
     popularity = Column(Integer, nullable=True)
@@ -60,8 +74,22 @@ class Track(Base):
     # Relationships
     listening_history = relationship("ListeningHistory", back_populates="track")
 
+class Artist(Base):
+    __tablename__ = "artists"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    spotify_id = Column(String, unique=True, index=True, nullable=False)
+    name = Column(String, nullable=True)
+    genres = Column(Text, nullable=True)  # JSON list
+    fetched_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class ListeningHistory(Base):
     __tablename__ = "listening_history"
+    __table_args__ = (
+        Index("ix_listening_history_user_played_at", "user_id", "played_at"),
+        # A play is stored once; bulk inserts (imports) rely on it for ON CONFLICT DO NOTHING
+        Index("ux_listening_history_user_track_played_at", "user_id", "track_id", "played_at", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -75,6 +103,35 @@ class ListeningHistory(Base):
     user = relationship("User", back_populates="listening_history")
     track = relationship("Track", back_populates="listening_history")
 
+class ListeningDaily(Base):
+    """Execuções por usuário, música e dia; mantido a cada inserção no histórico (app/services/rollups.py)"""
+    __tablename__ = "listening_daily"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    track_id = Column(Integer, ForeignKey("tracks.id"), primary_key=True)
+    day = Column(Date, primary_key=True)  # UTC, like played_at
+    play_count = Column(Integer, nullable=False, default=0)
+
+class ListeningHourly(Base):
+    """Execuções por usuário, dia da semana, hora e contexto (padrões de escuta)"""
+    __tablename__ = "listening_hourly"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day_of_week = Column(Integer, primary_key=True)  # 0 = domingo
+    hour = Column(Integer, primary_key=True)
+    context_type = Column(String, primary_key=True)  # "unknown" when Spotify sends none
+    play_count = Column(Integer, nullable=False, default=0)
+
+class HistoryPrune(Base):
+    """Registro de cada limpeza do histórico bruto; execuções antes do corte não são mais aceitas"""
+    __tablename__ = "history_prunes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    pruned_before = Column(DateTime, nullable=False)
+    deleted_rows = Column(Integer, nullable=False, default=0)
+    archive_path = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class CompatibilityScore(Base):
     __tablename__ = "compatibility_scores"
     
@@ -114,6 +171,9 @@ class UserProfile(Base):
     avg_speechiness = Column(Float, nullable=True)
     avg_tempo = Column(Float, nullable=True)
     
+    # Incremented every time the profile is rebuilt (used for ETags)
+    version = Column(Integer, default=1, nullable=False)
+    
     # Listening patterns
     total_tracks_played = Column(Integer, default=0)
     unique_artists = Column(Integer, default=0)
@@ -121,7 +181,9 @@ class UserProfile(Base):
     avg_session_duration = Column(Float, nullable=True)
     
     # Clustering information
-    cluster_id = Column(Integer, nullable=True)
+    cluster_id = Column(Integer, nullable=True, index=True)
+    pending_cluster_fit = Column(Boolean, default=True, index=True)  # features changed since the last model refresh
+    music_persona = Column(String, nullable=True, index=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -129,3 +191,92 @@ class UserProfile(Base):
     # Relationships
     user = relationship("User")
 
+
+class ClusterModel(Base):
+    __tablename__ = "cluster_models"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    version = Column(Integer, nullable=False, default=1)
+    n_clusters = Column(Integer, nullable=False)
+    
+    # Scaler parameters and centroids (scaled space), stored as JSON lists
+    scaler_mean = Column(Text, nullable=False)
+    scaler_scale = Column(Text, nullable=False)
+    centroids = Column(Text, nullable=False)
+    cluster_counts = Column(Text, nullable=False)  # samples absorbed by each centroid
+    
+    inertia = Column(Float, nullable=True)
+    n_samples_seen = Column(Integer, default=0)
+    full_fit_samples = Column(Integer, default=0)  # profiles in the last full fit
+    
+    # How k was chosen ("auto" or "heuristic") and, for auto, the score of every candidate
+    k_selection = Column(String, nullable=True)
+    selection_scores = Column(Text, nullable=True)  # JSON string
+    last_full_fit_at = Column(DateTime(timezone=True), nullable=True)
+    last_partial_fit_at = Column(DateTime(timezone=True), nullable=True)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class UserGenreStats(Base):
+    __tablename__ = "user_genre_stats"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total_plays = Column(Integer, default=0)  # plays whose artists have known genres
+    genre_counts = Column(Text, nullable=True)  # JSON {genre: plays}
+    monthly_counts = Column(Text, nullable=True)  # JSON {"YYYY-MM": {"plays": n, "genres": {genre: plays}}}
+    entropy = Column(Float, nullable=True)  # Shannon entropy (bits) of genre_counts
+    needs_backfill = Column(Boolean, nullable=False, default=False, server_default=false())  # some plays left out; rebuilt from the daily rollup on the next sync
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ClusterSummary(Base):
+    __tablename__ = "cluster_summary"
+    
+    cluster_id = Column(Integer, primary_key=True)
+    model_version = Column(Integer, nullable=True)
+    user_count = Column(Integer, default=0)
+    centroid = Column(Text, nullable=True)  # JSON list, original feature scale
+    
+    # Feature means over the cluster members (a missing feature counts as 0, as in the feature matrix)
+    avg_danceability = Column(Float, nullable=True)
+    avg_energy = Column(Float, nullable=True)
+    avg_valence = Column(Float, nullable=True)
+    avg_acousticness = Column(Float, nullable=True)
+    avg_instrumentalness = Column(Float, nullable=True)
+    avg_liveness = Column(Float, nullable=True)
+    avg_speechiness = Column(Float, nullable=True)
+    avg_tempo = Column(Float, nullable=True)
+    
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class PersonaCount(Base):
+    __tablename__ = "persona_counts"
+    
+    persona = Column(String, primary_key=True)
+    user_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+ACTIVE_JOB = text("status IN ('queued', 'running')")
+
+class BackgroundJob(Base):
+    __tablename__ = "background_jobs"
+    __table_args__ = (
+        # At most one active job per coalescing key, enforced by the database across worker processes
+        Index("ux_background_jobs_active_coalesce_key", "coalesce_key", unique=True, sqlite_where=ACTIVE_JOB, postgresql_where=ACTIVE_JOB),
+    )
+    
+    id = Column(String, primary_key=True)  # uuid4 hex
+    kind = Column(String, nullable=False, index=True)  # clustering, ...
+    status = Column(String, nullable=False, default="queued", index=True)  # queued, running, succeeded, failed
+    coalesce_key = Column(String, nullable=True)  # "clustering", "import:<user_id>"; unique among active jobs
+    progress = Column(Float, default=0.0)
+    stage = Column(String, nullable=True)
+    params = Column(Text, nullable=True)  # JSON string
+    result = Column(Text, nullable=True)  # JSON string
+    error = Column(Text, nullable=True)
+    requested_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
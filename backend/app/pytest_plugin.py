@@ -0,0 +1,47 @@
+"""Fixtures de orçamento de queries para pytest.
+
+Ative no conftest.py com ``pytest_plugins = ["app.pytest_plugin"]``.
+"""
+from starlette.routing import Match
+import pytest
+
+from app.query_budget import DEFAULT_MAX_REPEATS, assert_max_queries, get_query_budget, iter_api_routes, routes_without_budget
+
+@pytest.fixture
+def max_queries():
+    """Uso: ``with max_queries(3): service.metodo()`` falha se passar de 3 comandos ou houver N+1"""
+    def _max_queries(limit: int, max_repeats: int = DEFAULT_MAX_REPEATS, label: str = ""):
+        return assert_max_queries(limit, max_repeats, process_wide=True, label=label)
+    return _max_queries
+
+@pytest.fixture
+def within_route_budget():
+    """Uso: ``within_route_budget(client, "GET", "/analysis/my-profile", headers=...)``
+
+    Executa a requisição e falha se exceder o orçamento declarado com @query_budget na rota.
+    """
+    def _request(client, method: str, path: str, **kwargs):
+        route = _match_route(client.app, method, path)
+        budget = get_query_budget(getattr(route, "endpoint", None))
+        if budget is None:
+            pytest.fail(f"{method} {path} não declara orçamento de queries")
+        with assert_max_queries(budget.max_queries, budget.max_repeats, process_wide=True, label=f"{method} {path}"):
+            response = client.request(method, path, **kwargs)
+        return response
+    return _request
+
+@pytest.fixture
+def assert_all_routes_budgeted():
+    def _check(app):
+        assert any(True for _ in iter_api_routes(app.routes)), "Nenhuma rota encontrada no app"
+        missing = routes_without_budget(app)
+        assert not missing, "Rotas sem orçamento de queries: " + ", ".join(missing)
+    return _check
+
+def _match_route(app, method: str, path: str):
+    scope = {"type": "http", "method": method.upper(), "path": path.split("?", 1)[0], "root_path": ""}
+    for route in iter_api_routes(app.routes):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+    return None
@@ -0,0 +1,171 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from typing import Callable, Iterator, List, Optional, Tuple
+import re
+import threading
+
+from app.config import settings
+from app.metrics import route_template
+
+# Shapes repeated this many times in one unit of work are reported as suspected N+1s
+DEFAULT_MAX_REPEATS = 3
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER = r"(?:\?|\$\d+|%\(\w+\)s|%s|:\w+)"
+_PLACEHOLDER_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+def statement_shape(statement: str) -> str:
+    """Normaliza o SQL para que execuções com parâmetros diferentes tenham o mesmo formato"""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _PLACEHOLDER_LIST.sub("(?)", shape)
+    return _LITERAL.sub("?", shape)
+
+@dataclass
+class QueryLog:
+    statements: List[str] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def shapes(self) -> Counter:
+        return Counter(statement_shape(s) for s in self.statements)
+
+    def suspected_n_plus_one(self, max_repeats: int = DEFAULT_MAX_REPEATS) -> List[Tuple[str, int]]:
+        # Only reads: repeated ORM INSERTs depend on the dialect (SQLite emits one per row
+        # when RETURNING server defaults, Postgres batches them) and are covered by the count
+        return [
+            (shape, n) for shape, n in self.shapes().most_common()
+            if n >= max_repeats and shape.upper().startswith(("SELECT", "WITH"))
+        ]
+
+    def report(self, max_repeats: int = DEFAULT_MAX_REPEATS) -> str:
+        lines = [f"{self.count} comandos SQL"]
+        for shape, n in self.suspected_n_plus_one(max_repeats):
+            lines.append(f"  possível N+1 ({n}x): {shape[:200]}")
+        return "\n".join(lines)
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+@dataclass(frozen=True)
+class QueryBudget:
+    max_queries: int
+    max_repeats: int = DEFAULT_MAX_REPEATS
+
+    def violations(self, log: QueryLog) -> List[str]:
+        problems = []
+        if log.count > self.max_queries:
+            problems.append(f"{log.count} comandos SQL, orçamento é {self.max_queries}")
+        for shape, n in log.suspected_n_plus_one(self.max_repeats):
+            problems.append(f"possível N+1 ({n}x): {shape[:200]}")
+        return problems
+
+    def check(self, log: QueryLog, label: str = ""):
+        problems = self.violations(log)
+        if problems:
+            raise QueryBudgetExceeded(f"{label or 'Orçamento de queries'} excedido:\n  " + "\n  ".join(problems))
+
+# Logs bound to the current task/thread context, plus process-wide ones used by tests
+# (the test client runs the app in another thread, where the context does not follow)
+_context_logs: ContextVar[Tuple[QueryLog, ...]] = ContextVar("query_budget_logs", default=())
+_global_logs: List[QueryLog] = []
+_global_lock = threading.Lock()
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    for log in _context_logs.get():
+        log.statements.append(statement)
+    if _global_logs:
+        with _global_lock:
+            for log in _global_logs:
+                log.statements.append(statement)
+
+@contextmanager
+def count_queries(process_wide: bool = False) -> Iterator[QueryLog]:
+    """Registra os comandos SQL executados dentro do bloco"""
+    log = QueryLog()
+    if process_wide:
+        with _global_lock:
+            _global_logs.append(log)
+        try:
+            yield log
+        finally:
+            with _global_lock:
+                _global_logs.remove(log)
+        return
+
+    token = _context_logs.set(_context_logs.get() + (log,))
+    try:
+        yield log
+    finally:
+        _context_logs.reset(token)
+
+@contextmanager
+def assert_max_queries(max_queries: int, max_repeats: int = DEFAULT_MAX_REPEATS, process_wide: bool = False, label: str = "") -> Iterator[QueryLog]:
+    with count_queries(process_wide) as log:
+        yield log
+    QueryBudget(max_queries, max_repeats).check(log, label)
+
+def query_budget(max_queries: int, max_repeats: int = DEFAULT_MAX_REPEATS) -> Callable:
+    """Declara o orçamento de comandos SQL de um endpoint (inclui as dependências, como a autenticação)"""
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.__query_budget__ = QueryBudget(max_queries, max_repeats)
+        return endpoint
+    return decorator
+
+def get_query_budget(endpoint: Optional[Callable]) -> Optional[QueryBudget]:
+    return getattr(endpoint, "__query_budget__", None)
+
+def iter_api_routes(routes) -> Iterator:
+    """Todas as APIRoutes, inclusive as de routers incluídos e mounts"""
+    from fastapi.routing import APIRoute
+
+    for route in routes:
+        if isinstance(route, APIRoute):
+            yield route
+            continue
+        # Mounts expose .routes; newer FastAPI keeps included routers nested instead of copying their routes
+        children = getattr(route, "routes", None) or getattr(getattr(route, "original_router", None), "routes", None)
+        if children:
+            yield from iter_api_routes(children)
+
+def routes_without_budget(app) -> List[str]:
+    return [
+        f"{','.join(sorted(route.methods))} {route.path}"
+        for route in iter_api_routes(app.routes)
+        if get_query_budget(route.endpoint) is None
+    ]
+
+class QueryBudgetMiddleware:
+    """Em modo de desenvolvimento, confere cada requisição contra o orçamento da rota"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or settings.query_budget_mode == "off":
+            await self.app(scope, receive, send)
+            return
+
+        with count_queries() as log:
+            await self.app(scope, receive, send)
+
+        route = scope.get("route")
+        budget = get_query_budget(getattr(route, "endpoint", None))
+        label = f"{scope['method']} {route_template(scope) or scope['path']}"
+        if budget is None:
+            if route is not None:
+                print(f"⚠️ {label} não declara orçamento de queries ({log.report()})")
+            return
+        try:
+            budget.check(log, label)
+        except QueryBudgetExceeded as e:
+            if settings.query_budget_mode == "raise":
+                raise
+            print(f"⚠️ {e}")
@@ -0,0 +1,49 @@
+"""Serialização JSON rápida (orjson) para respostas grandes.
+
+ORJSONResponse é a classe padrão do app. Os endpoints de listas e perfis vão além:
+serializam direto para bytes (sem o passo de dicts intermediários do response_model)
+e embutem o JSON já guardado no banco (top_artists, top_tracks...) sem parse.
+"""
+from functools import lru_cache
+from typing import Any, AsyncIterator, Iterable, List, Optional, Type
+
+import orjson
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter
+
+# Same output as FastAPI/pydantic: UTC datetimes end in "Z"
+JSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+# Returning a Response skips the injected one, so these are carried over by hand
+_FORWARDED_HEADERS = ("etag", "cache-control")
+
+class JSONBytesResponse(Response):
+    """Corpo já serializado em JSON; é enviado como está"""
+    media_type = "application/json"
+
+def dumps(value: Any) -> bytes:
+    return orjson.dumps(value, option=JSON_OPTIONS)
+
+def raw_json(text: Optional[str], default: str = "[]") -> orjson.Fragment:
+    """JSON guardado como texto, embutido no documento sem json.loads/dumps"""
+    return orjson.Fragment(text or default)
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+def models_json(model: Type[BaseModel], rows: Iterable[Any]) -> bytes:
+    """Linhas do ORM validadas e serializadas pelo pydantic-core numa passada só"""
+    adapter = _list_adapter(model)
+    return adapter.dump_json(adapter.validate_python(list(rows), from_attributes=True))
+
+def json_bytes_response(content: bytes, response: Optional[Response] = None) -> JSONBytesResponse:
+    headers = {}
+    if response is not None:
+        headers = {name: response.headers[name] for name in _FORWARDED_HEADERS if name in response.headers}
+    return JSONBytesResponse(content, headers=headers)
+
+def attachment_stream(chunks: AsyncIterator[bytes], media_type: str, filename: str) -> StreamingResponse:
+    """Download enviado à medida que os pedaços são gerados (sem Content-Length)"""
+    return StreamingResponse(chunks, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+
+from app.utils import get_admin_user_id
+from app.query_budget import query_budget
+from app.responses import attachment_stream
+from app.services.export import DATASETS, MEDIA_TYPES, export_filename, stream_export
+
+router = APIRouter(prefix="/admin")
+
+@router.get("/export")
+@query_budget(1)
+async def bulk_export(
+    dataset: str = "history",
+    format: str = "ndjson",
+    user_id: Optional[int] = None,
+    admin_id: int = Depends(get_admin_user_id)
+):
+    """Exporta o histórico de escuta ou as compatibilidades de todos os usuários (ou de um), em streaming"""
+    if dataset not in DATASETS or format not in MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Use dataset em {', '.join(DATASETS)} e format em {', '.join(MEDIA_TYPES)}"
+        )
+    return attachment_stream(
+        stream_export(dataset, format, reader_id=admin_id, user_id=user_id),
+        MEDIA_TYPES[format],
+        export_filename(dataset, format, user_id)
+    )
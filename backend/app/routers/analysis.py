@@ -1,66 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 import json
 
 from app.database import get_db
-from app.models import User, UserProfile, ListeningHistory, Track
+from app.models import User, UserProfile, BackgroundJob, ClusterSummary
 from app.schemas import UserAnalysis
-from app.utils import get_current_user
+from app.utils import Principal, get_current_principal, get_read_db
+from app.query_budget import query_budget
+from app.cache import response_cache
+from app.etags import profile_etag, not_modified_response
+from app.responses import dumps, json_bytes_response, raw_json
 from app.services.analysis import AnalysisService
+from app.services.jobs import submit_clustering_job, serialize_job
+from app.services.clustering import FEATURE_COLUMNS
+from app.services.genres import GenreService
+from app.services.personas import PersonaService, determine_music_persona
 
-router = APIRouter()
+router = APIRouter(prefix="/analysis")
 
-def determine_music_persona(features: dict) -> str:
-    """Traduz números em nomes de 'Vibe'"""
-    energy = features.get("energy", 0)
-    dance = features.get("danceability", 0)
-    acoustic = features.get("acousticness", 0)
-    valence = features.get("valence", 0)
-    instrumental = features.get("instrumentalness", 0)
-    
-    # Check in order of specificity - most specific rules first
-    if instrumental > 0.5:
-        return "Foco & Instrumental"
-    
-    if energy > 0.75 and dance > 0.6:
-        return "Rei da Pista"
-    
-    if energy > 0.8 and valence < 0.4:
-        return "Metal & Intenso"
-        
-    if acoustic > 0.7:
-        return "Acústico & Café"
-        
-    if valence > 0.75 and dance > 0.6:
-        return "Good Vibes"
-        
-    if valence < 0.3 and energy < 0.4:
-        return "Melancólico & Profundo"
-        
-    if dance > 0.8:
-        return "Não Para de Dançar"
-    
-    return "Eclético / Explorador"
-
-@router.get("/my-profile", response_model=UserAnalysis)
-async def get_my_analysis(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Retorna análise completa do perfil musical do usuário"""
-    profile = db.query(UserProfile).filter(UserProfile.user_id == current_user.id).first()
-    
-    if not profile:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Perfil musical não encontrado. Execute a sincronização primeiro."
-        )
-    
-    top_genres = json.loads(profile.top_genres) if profile.top_genres else []
-    top_artists = json.loads(profile.top_artists) if profile.top_artists else []
-    top_tracks = json.loads(profile.top_tracks) if profile.top_tracks else []
-    
+def my_analysis_json(profile: UserProfile) -> bytes:
+    """Corpo do /my-profile (schema UserAnalysis); os tops vão do banco para a resposta sem parse"""
     audio_features_profile = {
         "danceability": profile.avg_danceability,
         "energy": profile.avg_energy,
@@ -71,170 +32,241 @@ async def get_my_analysis(
         "speechiness": profile.avg_speechiness,
         "tempo": profile.avg_tempo
     }
+    return dumps({
+        "user_id": profile.user_id,
+        "top_genres": raw_json(profile.top_genres),
+        "top_artists": raw_json(profile.top_artists),
+        "top_tracks": raw_json(profile.top_tracks),
+        "audio_features_profile": audio_features_profile,
+        "listening_patterns": {
+            "total_tracks_played": profile.total_tracks_played,
+            "unique_artists": profile.unique_artists,
+            "unique_genres": profile.unique_genres,
+            "avg_session_duration": profile.avg_session_duration
+        },
+        "cluster_assignment": profile.cluster_id,
+        "music_persona": profile.music_persona or determine_music_persona(audio_features_profile)
+    })
+
+@router.get("/my-profile", response_model=UserAnalysis)
+@query_budget(6)
+async def get_my_analysis(
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Retorna análise completa do perfil musical do usuário"""
+    etag = await profile_etag(db, "my-profile", current_user.id, include_cluster_model=True)
+    not_modified = not_modified_response(request, response, etag)
+    if not_modified:
+        return not_modified
     
-    listening_patterns = {
-        "total_tracks_played": profile.total_tracks_played,
-        "unique_artists": profile.unique_artists,
-        "unique_genres": profile.unique_genres,
-        "avg_session_duration": profile.avg_session_duration
-    }
+    async def build():
+        profile = await db.scalar(select(UserProfile).where(UserProfile.user_id == current_user.id))
     
-    persona = determine_music_persona(audio_features_profile)
-
-    return UserAnalysis(
-        user_id=current_user.id,
-        top_genres=top_genres,
-        top_artists=top_artists,
-        top_tracks=top_tracks,
-        audio_features_profile=audio_features_profile,
-        listening_patterns=listening_patterns,
-        cluster_assignment=profile.cluster_id,
-        music_persona=persona
-    )
+        if not profile:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Perfil musical não encontrado. Execute a sincronização primeiro."
+            )
+        return my_analysis_json(profile)
+    
+    content = await response_cache.get_or_build_bytes("my-profile", current_user.id, build, depends_on_clusters=True, version=etag)
+    return json_bytes_response(content, response)
 
 @router.get("/clusters")
+@query_budget(8)
 async def get_cluster_analysis(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Retorna análise dos clusters de usuários"""
-    clusters = db.query(UserProfile.cluster_id).filter(
-        UserProfile.cluster_id.isnot(None)
-    ).distinct().all()
-    
-    cluster_analysis = []
-    for (cluster_id,) in clusters:
-        cluster_users = db.query(UserProfile).filter(
-            UserProfile.cluster_id == cluster_id
-        ).all()
-        
-        if cluster_users:
-            avg_features = {
-                "danceability": sum(p.avg_danceability for p in cluster_users if p.avg_danceability) / len(cluster_users),
-                "energy": sum(p.avg_energy for p in cluster_users if p.avg_energy) / len(cluster_users),
-                "valence": sum(p.avg_valence for p in cluster_users if p.avg_valence) / len(cluster_users),
-                "acousticness": sum(p.avg_acousticness for p in cluster_users if p.avg_acousticness) / len(cluster_users),
-                "instrumentalness": sum(p.avg_instrumentalness for p in cluster_users if p.avg_instrumentalness) / len(cluster_users),
-                "liveness": sum(p.avg_liveness for p in cluster_users if p.avg_liveness) / len(cluster_users),
-                "speechiness": sum(p.avg_speechiness for p in cluster_users if p.avg_speechiness) / len(cluster_users),
-                "tempo": sum(p.avg_tempo for p in cluster_users if p.avg_tempo) / len(cluster_users)
-            }
-            
+    """Retorna análise dos clusters de usuários (lida dos resumos materializados)"""
+    etag = await profile_etag(db, "clusters", current_user.id, include_cluster_model=True, include_cluster_summaries=True)
+    not_modified = not_modified_response(request, response, etag)
+    if not_modified:
+        return not_modified
+    
+    async def build():
+        summaries = (await db.scalars(select(ClusterSummary).where(
+            ClusterSummary.user_count > 0
+        ).order_by(ClusterSummary.cluster_id))).all()
+    
+        my_cluster = await db.scalar(select(UserProfile.cluster_id).where(
+            UserProfile.user_id == current_user.id
+        ))
+    
+        cluster_analysis = []
+        for summary in summaries:
             cluster_analysis.append({
-                "cluster_id": cluster_id,
-                "user_count": len(cluster_users),
-                "avg_features": avg_features,
-                "is_current_user_cluster": any(p.user_id == current_user.id for p in cluster_users)
+                "cluster_id": summary.cluster_id,
+                "user_count": summary.user_count,
+                "avg_features": {
+                    col.replace("avg_", "", 1): getattr(summary, col) or 0 for col in FEATURE_COLUMNS
+                },
+                "centroid": json.loads(summary.centroid) if summary.centroid else None,
+                "is_current_user_cluster": summary.cluster_id == my_cluster
             })
     
-    return {"clusters": cluster_analysis}
+        return {"clusters": cluster_analysis}
+    
+    return await response_cache.get_or_build("clusters", current_user.id, build, depends_on_clusters=True, version=etag)
 
-@router.post("/clustering")
+@router.post("/clustering", status_code=status.HTTP_202_ACCEPTED)
+@query_budget(6)
 async def perform_clustering(
     min_users: int = 2,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    full_refit: bool = False,
+    auto_k: Optional[bool] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Executa clustering de usuários"""
+    """Agenda a atualização do modelo de clusters (incremental por padrão, completa com full_refit=true)"""
     try:
-        analysis_service = AnalysisService(db)
-        result = await analysis_service.perform_clustering(min_users)
-        return result
+        params = {"min_users": min_users, "full_refit": full_refit}
+        if auto_k is not None:
+            params["auto_k"] = auto_k
+        job, coalesced = await db.run_sync(submit_clustering_job, params, current_user.id)
+        return {**serialize_job(job), "coalesced": coalesced}
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Erro ao executar clustering: {str(e)}"
+            detail=f"Erro ao agendar clustering: {str(e)}"
         )
 
+@router.get("/clustering/{job_id}")
+@query_budget(2)
+async def get_clustering_job(
+    job_id: str,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Retorna status, progresso, tempos, k e inércia de uma clusterização"""
+    job = await db.scalar(select(BackgroundJob).where(
+        BackgroundJob.id == job_id,
+        BackgroundJob.kind == "clustering"
+    ))
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job de clustering não encontrado"
+        )
+    
+    data = serialize_job(job)
+    result = data["result"] or {}
+    data["k"] = result.get("clusters_formed")
+    data["inertia"] = result.get("inertia")
+    data["timings"] = result.get("timings")
+    data["selection_scores"] = result.get("selection_scores")
+    return data
+
 @router.get("/listening-patterns")
+@query_budget(8)
 async def get_listening_patterns(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Retorna padrões de escuta do usuário"""
-    listening_history = db.query(ListeningHistory).filter(
-        ListeningHistory.user_id == current_user.id
-    ).order_by(ListeningHistory.played_at.desc()).limit(1000).all()
-    
-    if not listening_history:
-        return {"message": "Nenhum histórico de escuta encontrado"}
-    
-    patterns = {
-        "total_sessions": len(listening_history),
-        "time_distribution": {},
-        "context_analysis": {},
-        "recent_activity": []
-    }
+    etag = await profile_etag(db, "listening-patterns", current_user.id)
+    not_modified = not_modified_response(request, response, etag)
+    if not_modified:
+        return not_modified
     
-    # Count plays by hour of day to see listening patterns
-    hour_counts = {}
-    for entry in listening_history:
-        hour = entry.played_at.hour
-        hour_counts[hour] = hour_counts.get(hour, 0) + 1
+    async def build():
+        patterns = await AnalysisService(db).get_listening_patterns(current_user.id)
     
-    patterns["time_distribution"] = hour_counts
+        if not patterns:
+            return {"message": "Nenhum histórico de escuta encontrado"}
     
-    # Count by context type (playlist, album, etc.)
-    context_counts = {}
-    for entry in listening_history:
-        context_type = entry.context_type or "unknown"
-        context_counts[context_type] = context_counts.get(context_type, 0) + 1
+        return patterns
     
-    patterns["context_analysis"] = context_counts
+    return await response_cache.get_or_build("listening-patterns", current_user.id, build, version=etag)
+
+@router.get("/personas")
+@query_budget(4)
+async def get_persona_distribution(
+    persona: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Retorna a distribuição de personas e, opcionalmente, os usuários de uma persona"""
+    result = {"distribution": await db.run_sync(lambda session: PersonaService(session).get_distribution())}
     
-    recent_tracks = []
-    for entry in listening_history[:10]:
-        recent_tracks.append({
-            "track_name": entry.track.name,
-            "artists": entry.track.artists,
-            "played_at": entry.played_at.isoformat(),
-            "context": entry.context_name
-        })
+    if persona:
+        # Served by the index on user_profiles.music_persona, one page at a time
+        rows = (await db.execute(select(User.id, User.display_name, User.image_url).join(
+            UserProfile, UserProfile.user_id == User.id
+        ).where(
+            UserProfile.music_persona == persona
+        ).order_by(UserProfile.id).offset(offset).limit(limit))).all()
     
-    patterns["recent_activity"] = recent_tracks
+        result["persona"] = persona
+        result["users"] = [
+            {"user_id": user_id, "display_name": display_name, "image_url": image_url}
+            for user_id, display_name, image_url in rows
+        ]
     
-    return patterns
+    return result
 
 @router.get("/genre-analysis")
+@query_budget(4)
 async def get_genre_analysis(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Retorna análise de gêneros musicais"""
-    return {
-        "message": "Análise de gêneros não implementada ainda",
-        "note": "Requer integração com API do Spotify para obter informações de gênero"
-    }
+    """Retorna distribuição, diversidade (entropia) e tendência mensal dos gêneros ouvidos"""
+    analysis = await db.run_sync(lambda session: GenreService(session).get_genre_analysis(current_user.id))
+    
+    if not analysis:
+        return {"message": "Nenhuma análise de gêneros disponível. Execute a sincronização primeiro."}
+    
+    return analysis
 
 @router.get("/audio-features-radar")
+@query_budget(4)
 async def get_audio_features_radar(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Retorna dados para gráfico radar de características de áudio"""
-    profile = db.query(UserProfile).filter(UserProfile.user_id == current_user.id).first()
+    etag = await profile_etag(db, "audio-features-radar", current_user.id)
+    not_modified = not_modified_response(request, response, etag)
+    if not_modified:
+        return not_modified
     
-    if not profile:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_F,
-            detail="Perfil musical não encontrado"
-        )
+    async def build():
+        profile = await db.scalar(select(UserProfile).where(UserProfile.user_id == current_user.id))
     
-    radar_data = {
-        "categories": [
-            "Danceability", "Energy", "Valence", "Acousticness",
-            "Instrumentalness", "Liveness", "Speechiness"
-        ],
-        "values": [
-            profile.avg_danceability or 0,
-            profile.avg_energy or 0,
-            profile.avg_valence or 0,
-            profile.avg_acousticness or 0,
-            profile.avg_instrumentalness or 0,
-            profile.avg_liveness or 0,
-            profile.avg_speechiness or 0
-        ]
-    }
+        if not profile:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Perfil musical não encontrado"
+            )
     
-    return radar_data
-
+        radar_data = {
+            "categories": [
+                "Danceability", "Energy", "Valence", "Acousticness",
+                "Instrumentalness", "Liveness", "Speechiness"
+            ],
+            "values": [
+                profile.avg_danceability or 0,
+                profile.avg_energy or 0,
+                profile.avg_valence or 0,
+                profile.avg_acousticness or 0,
+                profile.avg_instrumentalness or 0,
+                profile.avg_liveness or 0,
+                profile.avg_speechiness or 0
+            ]
+        }
+    
+        return radar_data
+    
+    return await response_cache.get_or_build("audio-features-radar", current_user.id, build, version=etag)
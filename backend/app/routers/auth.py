@@ -1,57 +1,68 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
-from typing import Optional
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-import requests
-import json
+from functools import lru_cache
+import asyncio
+import time
 
 from app.database import get_db
+from app.metrics import record_spotify_call
 from app.models import User
-from app.schemas import UserCreate, User as UserSchema
-from app.config import settings
-from app.utils import create_access_token, get_current_user
+from app.schemas import User as UserSchema
+from app.utils import Principal, create_access_token, get_current_principal, get_current_user, invalidate_principal
+from app.query_budget import query_budget
+from app.services.tokens import token_manager
+from app.services.user_search import index_user
 
-router = APIRouter()
+router = APIRouter(prefix="/auth")
 
-sp_oauth = SpotifyOAuth(
-    client_id=settings.spotify_client_id,
-    client_secret=settings.spotify_client_secret,
-    redirect_uri=settings.spotify_redirect_uri,
-    scope="user-read-recently-played user-top-read user-read-private user-read-email",
-    show_dialog=True,
-    cache_handler=None
-)
+@lru_cache(maxsize=1)
+def login_oauth():
+    # Built on first use: spotipy is only imported once someone logs in
+    from app.spotify import spotify_oauth
+
+    return spotify_oauth(
+        scope="user-read-recently-played user-top-read user-read-private user-read-email",
+        show_dialog=True,
+        cache_handler=None
+    )
 
 @router.get("/login")
+@query_budget(0)
 async def spotify_login():
     """Inicia o processo de autenticação com Spotify"""
-    auth_url = sp_oauth.get_authorize_url()
+    auth_url = login_oauth().get_authorize_url()
     if "show_dialog=true" not in auth_url:
         auth_url += "&show_dialog=true"
     return {"auth_url": auth_url}
 
 @router.get("/callback")
-async def spotify_callback(code: str, db: Session = Depends(get_db)):
+@query_budget(6)
+async def spotify_callback(code: str, db: AsyncSession = Depends(get_db)):
     """Callback do Spotify OAuth"""
+    from app.spotify import InstrumentedSpotify
+
     try:
-        token_info = sp_oauth.get_access_token(code)
+        # spotipy is blocking; keep it off the event loop
+        started = time.perf_counter()
+        token_info = await asyncio.to_thread(login_oauth().get_access_token, code)
+        record_spotify_call("POST oauth/token", time.perf_counter() - started, "ok")
         access_token = token_info['access_token']
         refresh_token = token_info.get('refresh_token')  # May not always be present
-        expires_at = datetime.now() + timedelta(seconds=token_info['expires_in'])
+        expires_at = datetime.utcnow() + timedelta(seconds=token_info['expires_in'])
         
-        sp = spotipy.Spotify(auth=access_token)
-        spotify_user = sp.current_user()
+        sp = InstrumentedSpotify(auth=access_token)
+        spotify_user = await asyncio.to_thread(sp.current_user)
         
-        db_user = db.query(User).filter(User.spotify_id == spotify_user['id']).first()
+        db_user = await db.scalar(select(User).where(User.spotify_id == spotify_user['id']))
         
         # Update existing user or create new one
         if db_user:
             db_user.access_token = access_token
             db_user.refresh_token = refresh_token
             db_user.token_expires_at = expires_at
+            db_user.last_active_at = datetime.utcnow()
             db_user.display_name = spotify_user.get('display_name')
             db_user.email = spotify_user.get('email')
             db_user.country = spotify_user.get('country')
@@ -68,12 +79,15 @@ async def spotify_callback(code: str, db: Session = Depends(get_db)):
                 image_url=spotify_user['images'][0]['url'] if spotify_user.get('images') else None,
                 access_token=access_token,
                 refresh_token=refresh_token,
-                token_expires_at=expires_at
+                token_expires_at=expires_at,
+                last_active_at=datetime.utcnow()
             )
             db.add(db_user)
         
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
+        invalidate_principal(db_user.id)
+        index_user(db_user.id, db_user.display_name)
         
         jwt_token = create_access_token(data={"sub": str(db_user.id)})
         
@@ -90,12 +104,14 @@ async def spotify_callback(code: str, db: Session = Depends(get_db)):
         )
 
 @router.get("/me")
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
+@query_budget(2)
+async def get_current_user_info(current_user: Principal = Depends(get_current_principal)):
     """Retorna informações do usuário atual"""
     return UserSchema.from_orm(current_user)
 
 @router.post("/refresh")
-async def refresh_token(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+@query_budget(6)
+async def refresh_token(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     """Atualiza o token de acesso do Spotify"""
     try:
         if not current_user.refresh_token:
@@ -104,13 +120,8 @@ async def refresh_token(current_user: User = Depends(get_current_user), db: Sess
                 detail="Refresh token não disponível"
             )
         
-        token_info = sp_oauth.refresh_access_token(current_user.refresh_token)
-        access_token = token_info['access_token']
-        expires_at = datetime.now() + timedelta(seconds=token_info['expires_in'])
-        
-        current_user.access_token = access_token
-        current_user.token_expires_at = expires_at
-        db.commit()
+        # Single-flight with the background refresh; also drops the cached principal
+        await asyncio.to_thread(token_manager.ensure_fresh, current_user, True)
         
         return {"message": "Token atualizado com sucesso"}
         
@@ -121,12 +132,14 @@ async def refresh_token(current_user: User = Depends(get_current_user), db: Sess
         )
 
 @router.post("/logout")
-async def logout(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+@query_budget(3)
+async def logout(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     """Remove tokens do usuário"""
     current_user.access_token = None
     current_user.refresh_token = None
     current_user.token_expires_at = None
-    db.commit()
+    await db.commit()
+    invalidate_principal(current_user.id)
     
     return {"message": "Logout realizado com sucesso"}
 
@@ -1,21 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime
-from sqlalchemy.orm import Session, joinedload
-from app.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from sqlalchemy.orm import joinedload
+from app.database import get_db, mark_recent_write_async
 from app.models import User, CompatibilityScore, UserProfile
 from app.schemas import CompatibilityScore as CompatibilityScoreSchema, CompatibilityAnalysis
-from app.utils import get_current_user
+from app.utils import Principal, get_current_principal, get_read_db
+from app.query_budget import query_budget
+from app.responses import json_bytes_response, models_json
 from app.services.analysis import AnalysisService
 
-router = APIRouter()
+router = APIRouter(prefix="/compatibility")
 
 @router.post("/calculate/{user2_id}", response_model=CompatibilityAnalysis)
+@query_budget(15)
 async def calculate_compatibility(
     user2_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """Calcula compatibilidade entre o usuário atual e outro usuário"""
     if current_user.id == user2_id:
@@ -24,7 +27,7 @@ async def calculate_compatibility(
             detail="Não é possível calcular compatibilidade consigo mesmo"
         )
     
-    user2 = db.query(User).filter(User.id == user2_id).first()
+    user2 = await db.get(User, user2_id)
     if not user2:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -32,10 +35,11 @@ async def calculate_compatibility(
         )
     
     # Both users need to have synced their data first
-    profile1 = db.query(UserProfile).filter(UserProfile.user_id == current_user.id).first()
-    profile2 = db.query(UserProfile).filter(UserProfile.user_id == user2_id).first()
+    profile_user_ids = set((await db.scalars(select(UserProfile.user_id).where(
+        UserProfile.user_id.in_([current_user.id, user2_id])
+    ))).all())
     
-    if not profile1 or not profile2:
+    if len(profile_user_ids) < 2:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Um ou ambos os usuários não possuem perfil musical. Execute a sincronização primeiro."
@@ -44,6 +48,9 @@ async def calculate_compatibility(
     try:
         analysis_service = AnalysisService(db)
         compatibility_data = await analysis_service.calculate_compatibility(current_user.id, user2_id)
+        # The score shows up in both users' lists
+        await mark_recent_write_async(current_user.id)
+        await mark_recent_write_async(user2_id)
         
         return CompatibilityAnalysis(
             user1_id=current_user.id,
@@ -63,49 +70,59 @@ async def calculate_compatibility(
         )
 
 @router.get("/scores", response_model=List[CompatibilityScoreSchema])
+@query_budget(3)
 async def get_compatibility_scores(
     limit: int = 20,
     offset: int = 0,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Retorna os scores de compatibilidade do usuário atual"""
-    scores = db.query(CompatibilityScore).filter(
+    # The response model includes both users, which async sessions cannot lazy-load
+    scores = (await db.scalars(select(CompatibilityScore).options(
+        joinedload(CompatibilityScore.user1),
+        joinedload(CompatibilityScore.user2)
+    ).where(
         (CompatibilityScore.user1_id == current_user.id) | 
         (CompatibilityScore.user2_id == current_user.id)
-    ).order_by(CompatibilityScore.overall_score.desc()).offset(offset).limit(limit).all()
+    ).order_by(CompatibilityScore.overall_score.desc()).offset(offset).limit(limit))).all()
     
-    return scores
+    return json_bytes_response(models_json(CompatibilityScoreSchema, scores))
 
 @router.get("/top-matches", response_model=List[CompatibilityScoreSchema])
+@query_budget(3)
 async def get_top_matches(
     limit: int = 10,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Retorna os melhores matches do usuário atual com detalhes dos usuários"""
     # Use joinedload to avoid N+1 query problem when accessing user data
-    scores = db.query(CompatibilityScore).options(
+    scores = (await db.scalars(select(CompatibilityScore).options(
         joinedload(CompatibilityScore.user1),
         joinedload(CompatibilityScore.user2)
-    ).filter(
+    ).where(
         (CompatibilityScore.user1_id == current_user.id) | 
         (CompatibilityScore.user2_id == current_user.id)
-    ).order_by(CompatibilityScore.overall_score.desc()).limit(limit).all()
+    ).order_by(CompatibilityScore.overall_score.desc()).limit(limit))).all()
     
-    return scores
+    return json_bytes_response(models_json(CompatibilityScoreSchema, scores))
 
 @router.get("/with/{user_id}", response_model=CompatibilityScoreSchema)
+@query_budget(3)
 async def get_compatibility_with_user(
     user_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Retorna o score de compatibilidade com um usuário específico"""
-    score = db.query(CompatibilityScore).filter(
+    score = await db.scalar(select(CompatibilityScore).options(
+        joinedload(CompatibilityScore.user1),
+        joinedload(CompatibilityScore.user2)
+    ).where(
         ((CompatibilityScore.user1_id == current_user.id) & (CompatibilityScore.user2_id == user_id)) |
         ((CompatibilityScore.user1_id == user_id) & (CompatibilityScore.user2_id == current_user.id))
-    ).first()
+    ))
     
     if not score:
         raise HTTPException(
@@ -116,13 +133,14 @@ async def get_compatibility_with_user(
     return score
 
 @router.get("/similar-users")
+@query_budget(4)
 async def get_similar_users(
     limit: int = 10,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Retorna usuários com perfil musical similar"""
-    current_profile = db.query(UserProfile).filter(UserProfile.user_id == current_user.id).first()
+    current_profile = await db.scalar(select(UserProfile).where(UserProfile.user_id == current_user.id))
     
     if not current_profile or current_profile.cluster_id is None:
         raise HTTPException(
@@ -130,36 +148,34 @@ async def get_similar_users(
             detail="Usuário não foi clusterizado. Execute a análise de clustering primeiro."
         )
     
-    similar_profiles = db.query(UserProfile).filter(
+    # Users come from the same join, not one lookup per profile
+    rows = (await db.execute(select(User.id, User.display_name, User.image_url, UserProfile.cluster_id).join(
+        UserProfile, UserProfile.user_id == User.id
+    ).where(
         UserProfile.cluster_id == current_profile.cluster_id,
         UserProfile.user_id != current_user.id
-    ).limit(limit).all()
+    ).limit(limit))).all()
     
-    similar_users = []
-    for profile in similar_profiles:
-        user = db.query(User).filter(User.id == profile.user_id).first()
-        if user:
-            similar_users.append({
-                "id": user.id,
-                "display_name": user.display_name,
-                "image_url": user.image_url,
-                "cluster_id": profile.cluster_id
-            })
+    similar_users = [
+        {"id": user_id, "display_name": display_name, "image_url": image_url, "cluster_id": cluster_id}
+        for user_id, display_name, image_url, cluster_id in rows
+    ]
     
     return {"similar_users": similar_users}
 
 @router.delete("/scores/{score_id}")
+@query_budget(4)
 async def delete_compatibility_score(
     score_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
 ):
     """Remove um score de compatibilidade"""
-    score = db.query(CompatibilityScore).filter(
+    score = await db.scalar(select(CompatibilityScore).where(
         CompatibilityScore.id == score_id,
         (CompatibilityScore.user1_id == current_user.id) | 
         (CompatibilityScore.user2_id == current_user.id)
-    ).first()
+    ))
     
     if not score:
         raise HTTPException(
@@ -167,8 +183,10 @@ async def delete_compatibility_score(
             detail="Score de compatibilidade não encontrado"
         )
     
-    db.delete(score)
-    db.commit()
+    await db.delete(score)
+    await db.commit()
+    await mark_recent_write_async(score.user1_id)
+    await mark_recent_write_async(score.user2_id)
     
     return {"message": "Score de compatibilidade removido com sucesso"}
 
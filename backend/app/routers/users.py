@@ -1,56 +1,93 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List, Optional
-import spotipy
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, File, HTTPException, Request, Response, UploadFile, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+import asyncio
+from datetime import datetime
 
-from app.database import get_db
-from app.models import User, Track, ListeningHistory, UserProfile
+from app.config import settings
+from app.database import get_db, mark_recent_write_async
+from app.models import BackgroundJob, User, Track, UserProfile
 from app.schemas import User as UserSchema, Track as TrackSchema, UserProfile as UserProfileSchema
-from app.utils import get_current_user, get_spotify_client, refresh_spotify_token
-from app.services.data_collection import DataCollectionService
+from app.utils import Principal, get_current_principal, get_current_user, get_current_user_id, get_read_db, get_spotify_client, refresh_spotify_token
+from app.query_budget import query_budget
+from app.responses import attachment_stream, json_bytes_response, models_json
+from app.services.data_collection import DataCollectionService, insert_new_tracks
 from app.services.analysis import AnalysisService
+from app.services import user_search
+from app.services.export import DATASETS, MEDIA_TYPES, export_filename, stream_export
+from app.services.history_import import UploadTooLarge, remove_uploads, save_upload
+from app.services.jobs import serialize_job, submit_import_job
+from app.cache import response_cache
+from app.etags import profile_etag, not_modified_response
 
-router = APIRouter()
+router = APIRouter(prefix="/users")
 
 @router.get("/me", response_model=UserSchema)
-async def get_my_profile(current_user: User = Depends(get_current_user)):
+@query_budget(2)
+async def get_my_profile(current_user: Principal = Depends(get_current_principal)):
     """Retorna o perfil do usuário atual"""
     return current_user
 
 @router.get("/me/profile", response_model=UserProfileSchema)
+@query_budget(6)
 async def get_my_musical_profile(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Retorna o perfil musical do usuário"""
-    profile = db.query(UserProfile).filter(UserProfile.user_id == current_user.id).first()
-    if not profile:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Perfil musical não encontrado. Execute a análise primeiro."
-        )
-    return profile
+    etag = await profile_etag(db, "profile", current_user.id, include_cluster_model=True)
+    not_modified = not_modified_response(request, response, etag)
+    if not_modified:
+        return not_modified
+    
+    async def build():
+        profile = await db.scalar(select(UserProfile).where(UserProfile.user_id == current_user.id))
+        if not profile:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Perfil musical não encontrado. Execute a análise primeiro."
+            )
+        return UserProfileSchema.model_validate(profile).model_dump_json().encode()
+    
+    content = await response_cache.get_or_build_bytes("profile", current_user.id, build, depends_on_clusters=True, version=etag)
+    return json_bytes_response(content, response)
 
 @router.post("/me/sync")
+# A page is 50 plays; SQLite issues one INSERT per new play
+@query_budget(250)
 async def sync_user_data(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Sincroniza dados do usuário com o Spotify"""
     try:
         try:
-            sp = get_spotify_client(current_user)
+            # A due token refresh blocks on Spotify and the database; keep it off the event loop
+            sp = await asyncio.to_thread(get_spotify_client, current_user)
         except HTTPException:
             # Token might be expired, try refreshing it
-            sp = refresh_spotify_token(current_user, db)
+            sp = await asyncio.to_thread(refresh_spotify_token, current_user, db)
         
-        data_service = DataCollectionService(db)
-        await data_service.sync_user_listening_history(current_user.id, sp)
+        try:
+            # Active users get their tokens renewed in the background (written with the sync's first commit)
+            current_user.last_active_at = datetime.utcnow()
+            data_service = DataCollectionService(db)
+            await data_service.sync_user_listening_history(current_user.id, sp)
+            
+            # Generate profile after syncing history
+            analysis_service = AnalysisService(db)
+            profile = await analysis_service.generate_user_profile(current_user.id, sp)
+        finally:
+            # Until the replicas catch up, this user's reads (and cache rebuilds) come from the primary
+            await mark_recent_write_async(current_user.id)
+            await response_cache.invalidate_user_async(current_user.id)
         
-        # Generate profile after syncing history
-        analysis_service = AnalysisService(db)
-        await analysis_service.generate_user_profile(current_user.id, sp)
+        # Online cluster assignment changed the cluster summaries everyone sees
+        if profile is not None and profile.cluster_id is not None:
+            await response_cache.invalidate_clusters_async()
         
         return {"message": "Dados sincronizados com sucesso"}
         
@@ -60,29 +97,108 @@ async def sync_user_data(
             detail=f"Erro ao sincronizar dados: {str(e)}"
         )
 
+@router.get("/me/export")
+@query_budget(1)
+async def export_my_data(
+    dataset: str = "history",
+    format: str = "ndjson",
+    user_id: int = Depends(get_current_user_id)
+):
+    """Exporta o histórico de escuta ou as compatibilidades do usuário (NDJSON ou CSV, em streaming)"""
+    if dataset not in DATASETS or format not in MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Use dataset em {', '.join(DATASETS)} e format em {', '.join(MEDIA_TYPES)}"
+        )
+    return attachment_stream(
+        stream_export(dataset, format, reader_id=user_id, user_id=user_id),
+        MEDIA_TYPES[format],
+        export_filename(dataset, format, user_id)
+    )
+
+@router.post("/me/import", status_code=status.HTTP_202_ACCEPTED)
+@query_budget(4)
+async def import_streaming_history(
+    files: List[UploadFile] = File(...),
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """Importa os arquivos do histórico estendido do Spotify (Streaming_History_Audio_*.json) em segundo plano"""
+    paths = []
+    try:
+        for upload in files:
+            # Copied to disk off the event loop; the job runs in another process and reads by path
+            paths.append(await asyncio.to_thread(save_upload, upload.file, settings.import_max_file_mb * 1024 * 1024))
+        job, already_running = await db.run_sync(submit_import_job, user_id, paths)
+    except UploadTooLarge as e:
+        remove_uploads(paths)
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+    except Exception as e:
+        remove_uploads(paths)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao agendar importação: {str(e)}"
+        )
+    
+    if already_running:
+        remove_uploads(paths)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Já existe uma importação em andamento (job {job.id})"
+        )
+    return serialize_job(job)
+
+@router.get("/me/import/{job_id}")
+@query_budget(1)
+async def get_import_job(
+    job_id: str,
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """Retorna status, progresso e contagens de uma importação do usuário"""
+    job = await db.scalar(select(BackgroundJob).where(
+        BackgroundJob.id == job_id,
+        BackgroundJob.kind == "import",
+        BackgroundJob.requested_by == user_id
+    ))
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Importação não encontrada"
+        )
+    return serialize_job(job)
+
 @router.get("/me/tracks", response_model=List[TrackSchema])
+@query_budget(6)
 async def get_my_tracks(
     limit: int = 50,
     offset: int = 0,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Retorna as músicas mais tocadas do usuário"""
     try:
-        sp = get_spotify_client(current_user)
+        sp = await asyncio.to_thread(get_spotify_client, current_user)
         
-        top_tracks = sp.current_user_top_tracks(limit=limit, offset=offset, time_range='medium_term')
+        top_tracks = await asyncio.to_thread(sp.current_user_top_tracks, limit=limit, offset=offset, time_range='medium_term')
         
-        tracks = []
+        # Known tracks come from one IN query; the missing ones are inserted in one batch
+        spotify_ids = [track_data['id'] for track_data in top_tracks['items']]
+        known = {
+            t.spotify_id: t for t in (await db.scalars(select(Track).where(Track.spotify_id.in_(spotify_ids)))).all()
+        }
+        
+        new_tracks = {}
         for track_data in top_tracks['items']:
-            # Check if we already have this track in DB, otherwise create it
-            db_track = db.query(Track).filter(Track.spotify_id == track_data['id']).first()
-            
-            if not db_track:
-                db_track = Track(
+            if track_data['id'] not in known and track_data['id'] not in new_tracks:
+                new_tracks[track_data['id']] = Track(
                     spotify_id=track_data['id'],
                     name=track_data['name'],
                     artists=','.join([artist['name'] for artist in track_data['artists']]),
+                    artist_ids=','.join([artist['id'] for artist in track_data['artists'] if artist.get('id')]),
                     album=track_data['album']['name'],
                     duration_ms=track_data['duration_ms'],
                     popularity=track_data['popularity'],
@@ -90,13 +206,12 @@ async def get_my_tracks(
                     preview_url=track_data.get('preview_url'),
                     external_urls=str(track_data['external_urls'])
                 )
-                db.add(db_track)
-                db.commit()
-                db.refresh(db_track)
-            
-            tracks.append(db_track)
         
-        return tracks
+        if new_tracks:
+            known.update(await insert_new_tracks(db, new_tracks.values()))
+            await db.commit()
+        
+        return json_bytes_response(models_json(TrackSchema, (known[spotify_id] for spotify_id in spotify_ids if spotify_id in known)))
         
     except Exception as e:
         raise HTTPException(
@@ -105,6 +220,7 @@ async def get_my_tracks(
         )
 
 @router.get("/me/artists")
+@query_budget(2)
 async def get_my_artists(
     limit: int = 50,
     offset: int = 0,
@@ -112,9 +228,9 @@ async def get_my_artists(
 ):
     """Retorna os artistas mais ouvidos do usuário"""
     try:
-        sp = get_spotify_client(current_user)
+        sp = await asyncio.to_thread(get_spotify_client, current_user)
         
-        top_artists = sp.current_user_top_artists(limit=limit, offset=offset, time_range='medium_term')
+        top_artists = await asyncio.to_thread(sp.current_user_top_artists, limit=limit, offset=offset, time_range='medium_term')
         
         artists = []
         for artist_data in top_artists['items']:
@@ -137,15 +253,16 @@ async def get_my_artists(
         )
 
 @router.get("/me/recent")
+@query_budget(2)
 async def get_recent_tracks(
     limit: int = 50,
     current_user: User = Depends(get_current_user)
 ):
     """Retorna as músicas tocadas recentemente"""
     try:
-        sp = get_spotify_client(current_user)
+        sp = await asyncio.to_thread(get_spotify_client, current_user)
         
-        recent_tracks = sp.current_user_recently_played(limit=limit)
+        recent_tracks = await asyncio.to_thread(sp.current_user_recently_played, limit=limit)
         
         tracks = []
         for item in recent_tracks['items']:
@@ -169,30 +286,27 @@ async def get_recent_tracks(
         )
 
 @router.get("/search", response_model=List[UserSchema])
+@query_budget(3)
 async def search_users(
     query: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
-    """Busca usuários pelo nome (case insensitive)"""
+    """Busca usuários pelo nome (case insensitive): exatos, depois prefixos, depois substrings"""
     if len(query) < 2:
         return []
         
-    users = db.query(User).filter(
-        User.display_name.ilike(f"%{query}%"),
-        User.id != current_user.id
-    ).limit(10).all()
-    
-    return users
+    return await user_search.search_users(db, query, current_user.id, settings.user_search_limit)
 
 @router.get("/{user_id}", response_model=UserSchema)
+@query_budget(3)
 async def get_user_profile(
     user_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Retorna o perfil de um usuário específico"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1,27 +1,31 @@
 import numpy as np
-import pandas as pd
-from sqlalchemy.orm import Session
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List, Dict, Any, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, func, select
+from typing import List, Dict, Any
+import asyncio
 import json
 import math
 from collections import Counter
 
-from app.models import User, Track, ListeningHistory, UserProfile, CompatibilityScore
+from app.models import Track, ListeningDaily, ListeningHistory, ListeningHourly, UserProfile, CompatibilityScore
+from app.services.clustering import ClusteringService, profile_features
+from app.services.personas import PersonaService, persona_labels
 
 class AnalysisService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
     
     async def generate_user_profile(self, user_id: int, sp: Any = None):
         try:
-            listening_history = self.db.query(ListeningHistory).filter(ListeningHistory.user_id == user_id).all()
-            if not listening_history: return None
+            # Totals come from the daily rollup; the raw history may have been pruned
+            total_plays = await self.db.scalar(
+                select(func.sum(ListeningDaily.play_count)).where(ListeningDaily.user_id == user_id)
+            )
+            if not total_plays: return None
             
-            track_ids = [entry.track_id for entry in listening_history]
-            tracks = self.db.query(Track).filter(Track.id.in_(track_ids)).all()
+            tracks = (await self.db.scalars(select(Track).where(Track.id.in_(
+                select(ListeningDaily.track_id).where(ListeningDaily.user_id == user_id)
+            )))).all()
             
             durations = [t.duration_ms for t in tracks if t.duration_ms]
             avg_duration = sum(durations) / len(durations) if durations else 0.0
@@ -43,14 +47,17 @@ class AnalysisService:
             else:
                 avg_features = np.mean(np.array(audio_features), axis=0)
                 
-            top_genres = self._get_top_genres(user_id, sp)
-            top_artists = self._get_top_artists(user_id)
-            top_tracks = self._get_top_tracks(user_id)
+            top_genres = await self._get_top_genres(user_id, sp)
+            top_artists = await self._get_top_artists(user_id)
+            top_tracks = await self._get_top_tracks(user_id)
             
-            profile = self.db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+            profile = await self.db.scalar(select(UserProfile).where(UserProfile.user_id == user_id))
+            previous_features = None
             if not profile:
                 profile = UserProfile(user_id=user_id)
                 self.db.add(profile)
+            elif profile.avg_energy is not None:
+                previous_features = profile_features(profile)
             
             profile.top_genres = json.dumps(top_genres)
             profile.top_artists = json.dumps(top_artists)
@@ -63,55 +70,80 @@ class AnalysisService:
             profile.avg_liveness = float(avg_features[5])
             profile.avg_speechiness = float(avg_features[6])
             profile.avg_tempo = float(avg_features[7])
-            profile.total_tracks_played = len(listening_history)
+            profile.total_tracks_played = int(total_plays)
             profile.unique_artists = len(set([t.artists for t in tracks if t.artists]))
             profile.unique_genres = len(top_genres)
             profile.avg_session_duration = float(avg_duration)
+            profile.version = (profile.version or 0) + 1
+            
+            # Online assignment against the persisted model keeps cluster membership current;
+            # the next partial fit absorbs the new features into the centroids
+            # (the clustering and persona services are shared with the sync job workers)
+            await self.db.run_sync(lambda session: ClusteringService(session).assign_profile(profile, previous_features))
+            profile.pending_cluster_fit = True
+            
+            persona = str(persona_labels([profile_features(profile)])[0])
+            previous_persona = profile.music_persona
+            await self.db.run_sync(lambda session: PersonaService(session).move(previous_persona, persona))
+            profile.music_persona = persona
             
-            self.db.commit()
-            self.db.refresh(profile)
+            await self.db.commit()
+            await self.db.refresh(profile)
             return profile
         except Exception as e:
-            self.db.rollback()
+            await self.db.rollback()
             print(f"Erro profile: {e}")
             raise e
 
-    def _get_top_genres(self, user_id: int, sp: Any = None, limit: int = 10) -> List[str]:
+    async def _get_top_genres(self, user_id: int, sp: Any = None, limit: int = 10) -> List[str]:
         if not sp: return []
         try:
-            data = sp.current_user_top_artists(limit=50, time_range='medium_term')
+            # spotipy is blocking; keep it off the event loop
+            data = await asyncio.to_thread(sp.current_user_top_artists, limit=50, time_range='medium_term')
             genres = []
             for a in data['items']: 
                 if a.get('genres'): genres.extend(a['genres'])
             return [g for g, c in Counter(genres).most_common(limit)]
         except: return []
 
-    def _get_top_artists(self, user_id: int, limit: int = 20) -> List[Dict[str, Any]]:
-        history = self.db.query(ListeningHistory).filter(ListeningHistory.user_id == user_id).all()
+    async def _get_top_artists(self, user_id: int, limit: int = 20) -> List[Dict[str, Any]]:
+        plays_per_artists = (await self.db.execute(
+            select(Track.artists, func.sum(ListeningDaily.play_count)).join(
+                ListeningDaily, ListeningDaily.track_id == Track.id
+            ).where(ListeningDaily.user_id == user_id).group_by(Track.artists)
+        )).all()
         counts = Counter()
-        for h in history:
-            if h.track.artists:
-                for a in h.track.artists.split(','): counts[a.strip()] += 1
+        for artists, plays in plays_per_artists:
+            if artists:
+                for a in artists.split(','): counts[a.strip()] += int(plays)
         return [{'name': a, 'play_count': c} for a, c in counts.most_common(limit)]
 
-    def _get_top_tracks(self, user_id: int, limit: int = 20) -> List[Dict[str, Any]]:
-        history = self.db.query(ListeningHistory).filter(ListeningHistory.user_id == user_id).all()
-        counts = Counter([h.track_id for h in history])
-        tracks = []
-        for tid, c in counts.most_common(limit):
-            t = self.db.query(Track).filter(Track.id == tid).first()
-            if t: tracks.append({'id': t.spotify_id, 'name': t.name, 'artists': t.artists, 'play_count': c})
-        return tracks
+    async def _get_top_tracks(self, user_id: int, limit: int = 20) -> List[Dict[str, Any]]:
+        plays = func.sum(ListeningDaily.play_count)
+        top = (await self.db.execute(
+            select(Track.spotify_id, Track.name, Track.artists, plays).join(
+                ListeningDaily, ListeningDaily.track_id == Track.id
+            ).where(ListeningDaily.user_id == user_id).group_by(Track.id).order_by(plays.desc(), Track.id).limit(limit)
+        )).all()
+        return [
+            {'id': spotify_id, 'name': name, 'artists': artists, 'play_count': int(c)}
+            for spotify_id, name, artists, c in top
+        ]
 
     async def calculate_compatibility(self, user1_id: int, user2_id: int) -> Dict[str, Any]:
         try:
-            self.db.query(CompatibilityScore).filter(
+            await self.db.execute(delete(CompatibilityScore).where(
                 ((CompatibilityScore.user1_id == user1_id) & (CompatibilityScore.user2_id == user2_id)) |
                 ((CompatibilityScore.user1_id == user2_id) & (CompatibilityScore.user2_id == user1_id))
-            ).delete()
+            ))
             
-            profile1 = self.db.query(UserProfile).filter(UserProfile.user_id == user1_id).first()
-            profile2 = self.db.query(UserProfile).filter(UserProfile.user_id == user2_id).first()
+            profiles = {
+                p.user_id: p for p in (await self.db.scalars(
+                    select(UserProfile).where(UserProfile.user_id.in_([user1_id, user2_id]))
+                )).all()
+            }
+            profile1 = profiles.get(user1_id)
+            profile2 = profiles.get(user2_id)
             
             if not profile1 or not profile2:
                 raise ValueError("Perfis não encontrados")
@@ -136,13 +168,15 @@ class AnalysisService:
             if np.sum(audio_features1) == 0 or np.sum(audio_features2) == 0:
                 audio_similarity = 0.0
             else:
-                audio_similarity = cosine_similarity([audio_features1], [audio_features2])[0][0]
+                # Plain numpy: importing sklearn for one dot product costs more than the request
+                v1, v2 = np.asarray(audio_features1, dtype=float), np.asarray(audio_features2, dtype=float)
+                audio_similarity = float(v1 @ v2 / (np.linalg.norm(v1) * np.linalg.norm(v2)))
             
             artists1 = json.loads(profile1.top_artists) if profile1.top_artists else []
             artists2 = json.loads(profile2.top_artists) if profile2.top_artists else []
             artist_similarity = self._calculate_artist_similarity(artists1, artists2)
             
-            common_tracks = self._get_common_tracks(user1_id, user2_id)
+            common_tracks = await self._get_common_tracks(user1_id, user2_id)
             count_common = len(common_tracks)
             
             # Use logarithmic scaling so having 10 common tracks isn't 10x better than 1
@@ -168,7 +202,7 @@ class AnalysisService:
                 common_tracks=count_common
             )
             self.db.add(compatibility)
-            self.db.commit()
+            await self.db.commit()
             
             def make_feature_dict(p):
                 return {
@@ -199,7 +233,7 @@ class AnalysisService:
             }
             
         except Exception as e:
-            self.db.rollback()
+            await self.db.rollback()
             raise e
 
     def _calculate_artist_similarity(self, artists1: List[Dict], artists2: List[Dict]) -> float:
@@ -212,172 +246,52 @@ class AnalysisService:
         if union == 0: return 0.0
         return (intersection / union) * min(1.0, union / 20.0)
 
-    def _get_common_tracks(self, user1_id: int, user2_id: int) -> List[Dict[str, Any]]:
-        tracks1 = set([e.track_id for e in self.db.query(ListeningHistory).filter(ListeningHistory.user_id == user1_id).all()])
-        tracks2 = set([e.track_id for e in self.db.query(ListeningHistory).filter(ListeningHistory.user_id == user2_id).all()])
-        common_ids = tracks1.intersection(tracks2)
+    async def _get_common_tracks(self, user1_id: int, user2_id: int) -> List[Dict[str, Any]]:
+        def played_by(user_id):
+            return Track.id.in_(select(ListeningDaily.track_id).where(ListeningDaily.user_id == user_id))
         return [
             {'id': t.spotify_id, 'name': t.name, 'artists': t.artists} 
-            for t in self.db.query(Track).filter(Track.id.in_(common_ids)).all()
+            for t in (await self.db.scalars(select(Track).where(played_by(user1_id), played_by(user2_id)))).all()
         ]
 
-# ... (outros métodos da classe acima: generate_user_profile, calculate_compatibility, etc)
-
-    # CORREÇÃO 1: Mantenha este método COM O MESMO RECUO (TAB) dos outros métodos da classe
-    async def perform_clustering(self, min_users: int = 2): # Reduzi para 2 para facilitar testes
-        try:
-            print("🚀 Iniciando Clusterização...")
-            profiles = self.db.query(UserProfile).all()
-            
-            # Filtra usuários que já têm médias calculadas
-            valid_profiles = [p for p in profiles if p.avg_energy is not None]
-            
-            print(f"👥 Usuários válidos: {len(valid_profiles)}")
-
-            # CORREÇÃO 3: Retorna JSON seguro mesmo com poucos usuários
-            if len(valid_profiles) < min_users:
-                print("⚠️ Usuários insuficientes. Cancelando clusterização de forma segura.")
-                return {
-                    "status": "skipped",
-                    "message": f"Clusterização requer {min_users} usuários. Encontrados: {len(valid_profiles)}",
-                    "clusters_formed": 0
-                }
-
-            # Prepara dados para o Scikit-Learn
-            features = []
-            p_ids = []
-            for p in valid_profiles:
-                features.append([
-                    float(p.avg_danceability or 0), 
-                    float(p.avg_energy or 0), 
-                    float(p.avg_valence or 0),
-                    float(p.avg_acousticness or 0), 
-                    float(p.avg_instrumentalness or 0), 
-                    float(p.avg_liveness or 0),
-                    float(p.avg_speechiness or 0), 
-                    float(p.avg_tempo or 0)
-                ])
-                p_ids.append(p.id)
-                
-            scaler = StandardScaler()
-            features_scaled = scaler.fit_transform(features)
-            
-            # Lógica dinâmica de K (clusters)
-            n_samples = len(valid_profiles)
-            if n_samples < 2:
-                # Segurança extra caso min_users seja alterado externamente
-                return {"status": "skipped", "message": "Dados insuficientes para K-Means."}
+    async def get_listening_patterns(self, user_id: int) -> Dict[str, Any]:
+        """Distribuições por hora, dia da semana e contexto (agregado listening_hourly) e atividade recente"""
+        by_user = ListeningHourly.user_id == user_id
+        plays = func.sum(ListeningHourly.play_count)
 
-            desired_k = min(5, max(2, n_samples // 3))
-            k = min(desired_k, n_samples - 1) # Garante que K < N
-            
-            if k < 2: k = 2 # Força mínimo de 2 se houver usuários suficientes
-
-            print(f"🧮 Rodando KMeans com k={k} para {n_samples} usuários...")
-            
-            kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-            labels = kmeans.fit_predict(features_scaled)
-            
-            # Atualiza no banco
-            for index, pid in enumerate(p_ids):
-                user_to_update = next((p for p in valid_profiles if p.id == pid), None)
-                if user_to_update:
-                    # Se der erro aqui, é porque a coluna cluster_id não existe no DB
-                    user_to_update.cluster_id = int(labels[index])
-            
-            self.db.commit()
-            print("✅ Clusterização salva com sucesso!")
-            
-            return {
-                "status": "success",
-                "message": f"Clusterização concluída! {k} grupos formados.",
-                "clusters_formed": k
-            }
-            
-        except Exception as e:
-            self.db.rollback()
-            # ISSO VAI MOSTRAR O ERRO REAL NO SEU TERMINAL:
-            import traceback
-            traceback.print_exc() 
-            print(f"🚨 ERRO FATAL NO CLUSTERING: {str(e)}")
-            # Retorna um erro legível em vez de estourar 500 (opcional, ajuda o front)
-            return {"status": "error", "message": str(e)}
-        try:
-            profiles = self.db.query(UserProfile).all()
-            
-            # Filtra usuários que já têm médias calculadas
-            valid_profiles = [p for p in profiles if p.avg_energy is not None]
-            
-            # LOG PARA DEBUG
-            print(f"👥 Usuários válidos para cluster: {len(valid_profiles)} (Mínimo exigido: {min_users})")
+        hour_counts = (await self.db.execute(
+            select(ListeningHourly.hour, plays).where(by_user).group_by(ListeningHourly.hour)
+        )).all()
+        if not hour_counts:
+            return None
 
-            if len(valid_profiles) < min_users:
-                return {"message": f"Poucos usuários com dados ({len(valid_profiles)}/{min_users}). Continue sincronizando!"}
-            
-            # Se tivermos poucos usuários (ex: teste com 1 ou 2), não dá pra clusterizar
-            if len(valid_profiles) < 2:
-                 return {"message": "Clusterização requer pelo menos 2 usuários com dados."}
+        day_counts = (await self.db.execute(
+            select(ListeningHourly.day_of_week, plays).where(by_user).group_by(ListeningHourly.day_of_week)  # 0 = domingo
+        )).all()
+        context_counts = (await self.db.execute(
+            select(ListeningHourly.context_type, plays).where(by_user).group_by(ListeningHourly.context_type)
+        )).all()
 
-            # Build feature matrix
-            features = []
-            p_ids = []
-            for p in valid_profiles:
-                features.append([
-                    float(p.avg_danceability or 0), 
-                    float(p.avg_energy or 0), 
-                    float(p.avg_valence or 0),
-                    float(p.avg_acousticness or 0), 
-                    float(p.avg_instrumentalness or 0), 
-                    float(p.avg_liveness or 0),
-                    float(p.avg_speechiness or 0), 
-                    float(p.avg_tempo or 0)
-                ])
-                p_ids.append(p.id)
-                
-            scaler = StandardScaler()
-            features_scaled = scaler.fit_transform(features)
-            
-            # CORREÇÃO DO ERRO MATEMÁTICO:
-            # O número de clusters (k) não pode ser maior que o número de amostras (n_samples)
-            n_samples = len(valid_profiles)
-            
-            # Tenta criar 1 cluster a cada 3 pessoas, mas no mínimo 2 e no máximo 5
-            desired_k = min(5, max(2, n_samples // 3))
-            
-            # Proteção final: K não pode ser maior que N-1 (idealmente) ou N
-            k = min(desired_k, n_samples)
-            
-            # Se k for igual a n_samples, cada um fica no seu cluster (edge case)
-            if k >= n_samples:
-                k = max(1, n_samples - 1) 
-            
-            if k < 2:
-                 return {"message": "Dados insuficientes para formar múltiplos clusters."}
+        # Only the latest plays need the raw log, and they are never old enough to be pruned
+        recent = (await self.db.execute(select(
+            Track.name, Track.artists, ListeningHistory.played_at, ListeningHistory.context_name
+        ).join(Track, Track.id == ListeningHistory.track_id).where(ListeningHistory.user_id == user_id).order_by(
+            ListeningHistory.played_at.desc()
+        ).limit(10))).all()
 
-            print(f"🧮 Rodando KMeans com {k} clusters para {n_samples} usuários...")
-            
-            kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-            labels = kmeans.fit_predict(features_scaled)
-            
-            # Atualização otimizada
-            for index, pid in enumerate(p_ids):
-                # Não precisa buscar no banco de novo se você já tem o objeto na lista valid_profiles
-                # Mas para garantir que estamos na sessão certa:
-                user_to_update = next((p for p in valid_profiles if p.id == pid), None)
-                if user_to_update:
-                    user_to_update.cluster_id = int(labels[index])
-            
-            self.db.commit()
-            return {"message": f"Clusterização concluída! {k} grupos formados."}
-            
-        except Exception as e:
-                self.db.rollback()
-                
-                # --- ADICIONE ISTO ---
-                print("\n🚨 ERRO NO CLUSTERING ENCONTRADO:")
-                import traceback
-                traceback.print_exc() # Imprime o erro detalhado no terminal
-                print("🚨 FIM DO ERRO\n")
-                # ---------------------
-                
-                raise e
\ No newline at end of file
+        patterns = {
+            "total_sessions": int(sum(count for _, count in hour_counts)),
+            "time_distribution": {int(h): int(count) for h, count in sorted(hour_counts)},
+            "day_of_week_distribution": {int(d): int(count) for d, count in sorted(day_counts)},
+            "context_analysis": {context: int(count) for context, count in context_counts},
+            "recent_activity": [
+                {
+                    "track_name": name,
+                    "artists": artists,
+                    "played_at": played_at.isoformat(),
+                    "context": context_name
+                }
+                for name, artists, played_at, context_name in recent
+            ]
+        }
+        return patterns
@@ -0,0 +1,502 @@
+import numpy as np
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+import json
+import time
+
+from app.config import settings
+from app.database import insert_merging_means
+from app.models import ClusterModel, ClusterSummary, UserProfile
+
+# Column order of the feature matrix and of the persisted scaler/centroids
+FEATURE_COLUMNS = [
+    "avg_danceability", "avg_energy", "avg_valence", "avg_acousticness",
+    "avg_instrumentalness", "avg_liveness", "avg_speechiness", "avg_tempo"
+]
+
+def profile_features(profile: UserProfile) -> List[float]:
+    return [float(getattr(profile, col) or 0) for col in FEATURE_COLUMNS]
+
+# Receives (fraction done, stage name); used by background jobs to report progress
+ProgressCallback = Callable[[float, str], None]
+
+def _no_progress(fraction: float, stage: str):
+    pass
+
+def nearest_centroids(features_scaled: np.ndarray, centroids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Retorna o centróide mais próximo de cada linha e a distância quadrática até ele"""
+    distances = ((features_scaled[:, np.newaxis, :] - centroids[np.newaxis, :, :]) ** 2).sum(axis=2)
+    labels = distances.argmin(axis=1)
+    return labels, distances[np.arange(len(labels)), labels]
+
+def stratified_sample(strata: np.ndarray, sample_size: int, seed: int = 42) -> np.ndarray:
+    """Índices de uma amostra proporcional a cada estrato (ao menos 1 por estrato)"""
+    if len(strata) <= sample_size:
+        return np.arange(len(strata))
+
+    rng = np.random.default_rng(seed)
+    fraction = sample_size / len(strata)
+    picked = []
+    for stratum in np.unique(strata):
+        members = np.flatnonzero(strata == stratum)
+        take = max(1, int(round(len(members) * fraction)))
+        picked.append(rng.choice(members, size=min(take, len(members)), replace=False))
+    return np.sort(np.concatenate(picked))
+
+def _evaluate_k(features_scaled: np.ndarray, k: int) -> Dict[str, float]:
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.metrics import silhouette_score
+
+    kmeans = MiniBatchKMeans(
+        n_clusters=k,
+        batch_size=settings.clustering_batch_size,
+        random_state=42,
+        n_init=3
+    )
+    labels = kmeans.fit_predict(features_scaled)
+    # Silhouette is O(n^2), so it is always estimated on a bounded subsample
+    silhouette = silhouette_score(
+        features_scaled, labels,
+        sample_size=min(len(features_scaled), settings.clustering_silhouette_sample_size),
+        random_state=42
+    )
+    return {"k": k, "inertia": float(kmeans.inertia_), "silhouette": float(silhouette)}
+
+def _elbow_scores(k_values: List[int], inertias: List[float]) -> List[float]:
+    # Distance of each point of the normalized inertia curve to the chord joining its
+    # ends; the knee of the curve is the point furthest from it
+    if len(k_values) < 3:
+        return [0.0] * len(k_values)
+    x = (np.array(k_values) - k_values[0]) / (k_values[-1] - k_values[0])
+    y = np.array(inertias)
+    span = y.max() - y.min()
+    y = (y - y.min()) / span if span > 0 else np.zeros_like(y)
+    distances = np.abs(x + y - 1) / np.sqrt(2)  # chord runs from (0, 1) to (1, 0)
+    top = distances.max()
+    return (distances / top if top > 0 else distances).tolist()
+
+def evaluate_k_range(features_scaled: np.ndarray, k_values: List[int]) -> List[Dict[str, float]]:
+    """Avalia cada k em paralelo e combina silhouette e cotovelo da inércia em um score"""
+    from joblib import Parallel, delayed
+
+    scores = Parallel(n_jobs=settings.clustering_selection_jobs, prefer="threads")(
+        delayed(_evaluate_k)(features_scaled, k) for k in k_values
+    )
+    elbows = _elbow_scores(k_values, [s["inertia"] for s in scores])
+    silhouettes = np.array([s["silhouette"] for s in scores])
+    spread = silhouettes.max() - silhouettes.min()
+    silhouettes_norm = (silhouettes - silhouettes.min()) / spread if spread > 0 else np.ones_like(silhouettes)
+
+    for entry, elbow, silhouette_norm in zip(scores, elbows, silhouettes_norm):
+        entry["elbow"] = float(elbow)
+        entry["score"] = float(0.5 * silhouette_norm + 0.5 * elbow)
+    return scores
+
+@dataclass
+class ModelState:
+    mean: np.ndarray
+    scale: np.ndarray
+    centroids: np.ndarray
+    counts: np.ndarray
+
+    @classmethod
+    def from_row(cls, model: ClusterModel) -> "ModelState":
+        return cls(
+            mean=np.array(json.loads(model.scaler_mean)),
+            scale=np.array(json.loads(model.scaler_scale)),
+            centroids=np.array(json.loads(model.centroids)),
+            counts=np.array(json.loads(model.cluster_counts), dtype=float)
+        )
+
+    def save_to(self, model: ClusterModel):
+        model.scaler_mean = json.dumps(self.mean.tolist())
+        model.scaler_scale = json.dumps(self.scale.tolist())
+        model.centroids = json.dumps(self.centroids.tolist())
+        model.cluster_counts = json.dumps(self.counts.tolist())
+        model.n_clusters = len(self.centroids)
+
+    def transform(self, features) -> np.ndarray:
+        return (np.asarray(features, dtype=float) - self.mean) / self.scale
+
+    def partial_fit(self, features_scaled: np.ndarray) -> np.ndarray:
+        # Mini-batch k-means update: every centroid moves towards the mean of the
+        # points assigned to it, with a per-centroid learning rate of 1 / count
+        labels, _ = nearest_centroids(features_scaled, self.centroids)
+        k, n_features = self.centroids.shape
+        batch_counts = np.bincount(labels, minlength=k).astype(float)
+        batch_sums = np.zeros((k, n_features))
+        np.add.at(batch_sums, labels, features_scaled)
+
+        self.counts += batch_counts
+        touched = batch_counts > 0
+        self.centroids[touched] += (
+            batch_sums[touched] - batch_counts[touched, np.newaxis] * self.centroids[touched]
+        ) / self.counts[touched, np.newaxis]
+        return labels
+
+class ClusteringService:
+    """Mantém o modelo de clusters persistido (scaler + centróides) e as atribuições dos perfis.
+
+    O scaler só é recalculado em um ajuste completo; entre ajustes completos os
+    centróides são atualizados com mini-batches dos perfis alterados.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_model(self) -> Optional[ClusterModel]:
+        return self.db.query(ClusterModel).order_by(ClusterModel.id.desc()).first()
+
+    def assign_profile(
+        self,
+        profile: UserProfile,
+        previous_features: Optional[List[float]] = None,
+        model: Optional[ClusterModel] = None
+    ) -> Optional[int]:
+        """Atribui o perfil ao centróide mais próximo do modelo salvo (sem refazer o ajuste).
+
+        previous_features são as médias do perfil antes da atualização; com elas o
+        resumo do cluster antigo é corrigido sem reagregar seus membros.
+        """
+        model = model or self.get_model()
+        if model is None or profile.avg_energy is None:
+            return None
+
+        features = profile_features(profile)
+        state = ModelState.from_row(model)
+        labels, _ = nearest_centroids(state.transform([features]), state.centroids)
+
+        if profile.cluster_id is not None and previous_features is not None:
+            self._shift_summary(profile.cluster_id, -1, -np.asarray(previous_features))
+        profile.cluster_id = int(labels[0])
+        self._shift_summary(profile.cluster_id, 1, np.asarray(features), model.version)
+        return profile.cluster_id
+
+    def _shift_summary(self, cluster_id: int, count_delta: int, sums_delta: np.ndarray, model_version: Optional[int] = None):
+        if count_delta > 0:
+            # Upsert so concurrent syncs never lose each other's members, even into a cluster with no summary row yet
+            means = np.asarray(sums_delta, dtype=float) / count_delta
+            self.db.execute(
+                insert_merging_means(
+                    ClusterSummary.__table__, self.db.get_bind().dialect.name, ["cluster_id"], "user_count", FEATURE_COLUMNS
+                ),
+                {
+                    "cluster_id": int(cluster_id),
+                    "model_version": model_version,
+                    "user_count": count_delta,
+                    **{col: float(value) for col, value in zip(FEATURE_COLUMNS, means)}
+                }
+            )
+            return
+
+        # Removing members: single UPDATE, every right-hand side reads the pre-update values of the row
+        count = ClusterSummary.user_count
+        new_count = count + count_delta
+        values = {"user_count": new_count}
+        for col, delta in zip(FEATURE_COLUMNS, sums_delta):
+            current = func.coalesce(getattr(ClusterSummary, col), 0.0)
+            values[col] = (current * count + float(delta)) / func.nullif(new_count, 0)
+        self.db.execute(update(ClusterSummary).where(ClusterSummary.cluster_id == int(cluster_id)).values(values))
+
+    def refresh_summaries(self, model: ClusterModel):
+        """Recalcula do zero os resumos de todos os clusters"""
+        state = ModelState.from_row(model)
+        centroids = state.centroids * state.scale + state.mean
+        rows = self.db.execute(
+            select(
+                UserProfile.cluster_id,
+                func.count(UserProfile.id),
+                # Nulls count as 0, as in profile_features: the online deltas then keep the same means
+                *[func.avg(func.coalesce(getattr(UserProfile, col), 0.0)) for col in FEATURE_COLUMNS]
+            ).where(
+                UserProfile.cluster_id.isnot(None),
+                UserProfile.avg_energy.isnot(None)
+            ).group_by(UserProfile.cluster_id)
+        ).all()
+        aggregates = {row[0]: row for row in rows}
+
+        self.db.query(ClusterSummary).delete(synchronize_session=False)
+        for cluster_id, centroid in enumerate(centroids):
+            row = aggregates.get(cluster_id)
+            summary = ClusterSummary(
+                cluster_id=cluster_id,
+                model_version=model.version,
+                user_count=row[1] if row else 0,
+                centroid=json.dumps(centroid.tolist())
+            )
+            if row:
+                for col, value in zip(FEATURE_COLUMNS, row[2:]):
+                    setattr(summary, col, value)
+            self.db.add(summary)
+
+    def _update_summary_centroids(self, model: ClusterModel, state: "ModelState"):
+        centroids = state.centroids * state.scale + state.mean
+        for cluster_id, centroid in enumerate(centroids):
+            self.db.execute(
+                update(ClusterSummary).where(ClusterSummary.cluster_id == cluster_id).values(
+                    centroid=json.dumps(centroid.tolist()),
+                    model_version=model.version
+                )
+            )
+
+    def choose_k(self, n_samples: int) -> int:
+        # Roughly one cluster per 3 users, at least 2 and never more than N - 1
+        k = min(settings.clustering_max_clusters, max(2, n_samples // 3))
+        return max(2, min(k, n_samples - 1))
+
+    def perform_clustering(
+        self,
+        min_users: int = 2,
+        full_refit: bool = False,
+        auto_k: Optional[bool] = None,
+        progress: Optional[ProgressCallback] = None
+    ) -> Dict[str, Any]:
+        progress = progress or _no_progress
+        progress(0.0, "counting")
+        valid_filter = UserProfile.avg_energy.isnot(None)
+        n_samples = self.db.query(func.count(UserProfile.id)).filter(valid_filter).scalar()
+        print(f"👥 Usuários válidos: {n_samples}")
+
+        if n_samples < max(2, min_users):
+            print("⚠️ Usuários insuficientes. Cancelando clusterização de forma segura.")
+            return {
+                "status": "skipped",
+                "message": f"Clusterização requer {max(2, min_users)} usuários. Encontrados: {n_samples}",
+                "clusters_formed": 0
+            }
+
+        model = self.get_model()
+        auto_k = settings.clustering_auto_k if auto_k is None else auto_k
+
+        # A full fit is only needed to bootstrap the model, when k may have changed
+        # (the user base doubled in auto mode, or the heuristic k moved) or on request
+        needs_full_fit = full_refit or model is None or not model.n_samples_seen
+        if not needs_full_fit:
+            if auto_k:
+                needs_full_fit = n_samples >= 2 * (model.full_fit_samples or 0)
+            else:
+                needs_full_fit = model.n_clusters != self.choose_k(n_samples)
+
+        if needs_full_fit:
+            return self._full_fit(model, n_samples, valid_filter, auto_k, progress)
+        return self._partial_fit(model, valid_filter, progress)
+
+    def select_k(self, features_scaled: np.ndarray, strata: np.ndarray) -> Tuple[int, List[Dict[str, float]]]:
+        """Escolhe k avaliando a faixa configurada sobre uma amostra estratificada"""
+        sample = features_scaled[stratified_sample(strata, settings.clustering_selection_sample_size)]
+        k_max = min(settings.clustering_k_max, len(sample) - 1)
+        k_values = list(range(settings.clustering_k_min, k_max + 1))
+        if len(k_values) < 2:
+            return max(2, min(settings.clustering_k_min, len(sample) - 1)), []
+
+        scores = evaluate_k_range(sample, k_values)
+        best = max(scores, key=lambda entry: (entry["score"], entry["silhouette"]))
+        return best["k"], scores
+
+    def _iter_feature_chunks(self, *criteria):
+        """Lê (id, cluster_id, features) em blocos via cursor do lado do servidor"""
+        chunk_size = settings.clustering_read_chunk_size
+        stmt = select(
+            UserProfile.id,
+            func.coalesce(UserProfile.cluster_id, -1),
+            *[func.coalesce(getattr(UserProfile, col), 0.0) for col in FEATURE_COLUMNS]
+        ).where(*criteria).order_by(UserProfile.id)
+        result = self.db.execute(stmt, execution_options={"stream_results": True, "yield_per": chunk_size})
+        for rows in result.partitions():
+            block = np.array(rows, dtype=float)
+            yield block[:, 0].astype(np.int64), block[:, 1].astype(np.int64), block[:, 2:]
+
+    def _load_feature_matrix(self, n_rows: int, *criteria) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        ids = np.empty(n_rows, dtype=np.int64)
+        strata = np.empty(n_rows, dtype=np.int64)
+        features = np.empty((n_rows, len(FEATURE_COLUMNS)))
+        filled = 0
+        for chunk_ids, chunk_clusters, chunk_features in self._iter_feature_chunks(*criteria):
+            # Profiles created after the count stay pending and are picked up by the next partial fit
+            take = min(len(chunk_ids), n_rows - filled)
+            ids[filled:filled + take] = chunk_ids[:take]
+            strata[filled:filled + take] = chunk_clusters[:take]
+            features[filled:filled + take] = chunk_features[:take]
+            filled += take
+            if filled == n_rows:
+                break
+        return ids[:filled], strata[:filled], features[:filled]
+
+    def _write_labels(self, ids: np.ndarray, labels: np.ndarray, personas: Optional[np.ndarray] = None):
+        # ORM bulk UPDATE by primary key: one executemany per chunk
+        chunk_size = settings.clustering_write_chunk_size
+        for start in range(0, len(ids), chunk_size):
+            rows = [
+                {"id": int(pid), "cluster_id": int(label), "pending_cluster_fit": False}
+                for pid, label in zip(ids[start:start + chunk_size], labels[start:start + chunk_size])
+            ]
+            if personas is not None:
+                for row, persona in zip(rows, personas[start:start + chunk_size]):
+                    row["music_persona"] = str(persona)
+            self.db.execute(update(UserProfile), rows)
+
+    def _full_fit(self, model: Optional[ClusterModel], n_samples: int, valid_filter, auto_k: bool, progress: ProgressCallback) -> Dict[str, Any]:
+        from app.services.personas import PersonaService, persona_labels
+
+        timings = {}
+        started = time.perf_counter()
+        progress(0.05, "loading")
+        ids, strata, features = self._load_feature_matrix(n_samples, valid_filter)
+        timings["load_seconds"] = time.perf_counter() - started
+
+        # The persona rules are re-evaluated in one vectorized pass over the same matrix
+        personas = persona_labels(features)
+
+        # scikit-learn takes seconds to import; only the full fit needs it
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.preprocessing import StandardScaler
+
+        started = time.perf_counter()
+        scaler = StandardScaler()
+        features_scaled = scaler.fit_transform(features)
+        del features
+
+        selection_scores = []
+        if auto_k:
+            progress(0.1, "selecting_k")
+            k, selection_scores = self.select_k(features_scaled, strata)
+            timings["selection_seconds"] = time.perf_counter() - started
+        else:
+            k = self.choose_k(len(ids))
+
+        print(f"🧮 Ajuste completo (MiniBatchKMeans) com k={k} para {len(ids)} usuários...")
+        progress(0.4, "fitting")
+        started = time.perf_counter()
+        kmeans = MiniBatchKMeans(
+            n_clusters=k,
+            batch_size=settings.clustering_batch_size,
+            random_state=42,
+            n_init=3
+        )
+        labels = kmeans.fit_predict(features_scaled)
+        timings["fit_seconds"] = time.perf_counter() - started
+
+        progress(0.7, "writing")
+        started = time.perf_counter()
+        self._write_labels(ids, labels, personas)
+        PersonaService(self.db).refresh_counts()
+
+        if model is None:
+            model = ClusterModel(version=0)
+            self.db.add(model)
+
+        ModelState(
+            mean=scaler.mean_,
+            scale=scaler.scale_,
+            centroids=kmeans.cluster_centers_,
+            counts=np.bincount(labels, minlength=k).astype(float)
+        ).save_to(model)
+        model.version = (model.version or 0) + 1
+        model.inertia = float(kmeans.inertia_)
+        model.n_samples_seen = len(ids)
+        model.full_fit_samples = len(ids)
+        model.k_selection = "auto" if auto_k else "heuristic"
+        model.selection_scores = json.dumps(selection_scores)
+        model.last_full_fit_at = func.now()
+        model.last_partial_fit_at = func.now()
+        self.db.flush()
+        self.refresh_summaries(model)
+
+        self.db.commit()
+        timings["write_seconds"] = time.perf_counter() - started
+        progress(1.0, "done")
+        print("✅ Clusterização salva com sucesso!")
+
+        return {
+            "status": "success",
+            "mode": "full",
+            "message": f"Clusterização concluída! {k} grupos formados.",
+            "clusters_formed": k,
+            "profiles_assigned": len(ids),
+            "inertia": model.inertia,
+            "model_version": model.version,
+            "k_selection": model.k_selection,
+            "selection_scores": selection_scores,
+            "timings": timings
+        }
+
+    def _partial_fit(self, model: ClusterModel, valid_filter, progress: ProgressCallback) -> Dict[str, Any]:
+        timings = {}
+        started = time.perf_counter()
+        progress(0.05, "loading")
+        pending_filter = UserProfile.pending_cluster_fit.is_(True)
+        n_pending = self.db.query(func.count(UserProfile.id)).filter(valid_filter, pending_filter).scalar()
+        timings["load_seconds"] = time.perf_counter() - started
+
+        if not n_pending:
+            return {
+                "status": "up_to_date",
+                "mode": "partial",
+                "message": "Nenhum perfil alterado desde a última atualização do modelo.",
+                "clusters_formed": model.n_clusters,
+                "profiles_assigned": 0,
+                "inertia": model.inertia,
+                "model_version": model.version,
+                "timings": timings
+            }
+
+        print(f"🔁 Atualização incremental do modelo com {n_pending} perfis alterados...")
+        state = ModelState.from_row(model)
+        batch_inertia = 0.0
+        processed = 0
+        started = time.perf_counter()
+
+        batch_size = settings.clustering_batch_size
+
+        # Streamed chunks are split into mini-batches; labels are written chunk by chunk
+        k = len(state.centroids)
+        count_deltas = np.zeros(k, dtype=int)
+        sums_deltas = np.zeros((k, len(FEATURE_COLUMNS)))
+
+        for chunk_ids, previous_labels, chunk_features in self._iter_feature_chunks(valid_filter, pending_filter):
+            progress(0.1 + 0.8 * min(1.0, processed / n_pending), "partial_fit")
+            features_scaled = state.transform(chunk_features)
+            for start in range(0, len(features_scaled), batch_size):
+                state.partial_fit(features_scaled[start:start + batch_size])
+
+            # Re-assign against the updated centroids
+            labels, distances = nearest_centroids(features_scaled, state.centroids)
+            batch_inertia += float(distances.sum())
+            self._write_labels(chunk_ids, labels)
+            processed += len(chunk_ids)
+
+            # Summaries already hold these profiles under their online label; only moves change them
+            moved = previous_labels != labels
+            known = moved & (previous_labels >= 0) & (previous_labels < k)
+            np.add.at(count_deltas, previous_labels[known], -1)
+            np.add.at(sums_deltas, previous_labels[known], -chunk_features[known])
+            np.add.at(count_deltas, labels[moved], 1)
+            np.add.at(sums_deltas, labels[moved], chunk_features[moved])
+
+        state.save_to(model)
+        model.version = (model.version or 0) + 1
+        model.n_samples_seen = (model.n_samples_seen or 0) + processed
+        model.last_partial_fit_at = func.now()
+
+        # A cluster that lost and gained the same number of members still has new sums
+        for cluster_id in np.flatnonzero((count_deltas != 0) | (sums_deltas != 0).any(axis=1)):
+            self._shift_summary(cluster_id, int(count_deltas[cluster_id]), sums_deltas[cluster_id], model.version)
+        self._update_summary_centroids(model, state)
+
+        self.db.commit()
+        timings["fit_seconds"] = time.perf_counter() - started
+        progress(1.0, "done")
+        print("✅ Modelo de clusters atualizado!")
+
+        return {
+            "status": "success",
+            "mode": "partial",
+            "message": f"Modelo atualizado com {processed} perfis.",
+            "clusters_formed": model.n_clusters,
+            "profiles_assigned": processed,
+            "inertia": batch_inertia,
+            "model_version": model.version,
+            "timings": timings
+        }
@@ -1,21 +1,57 @@
-import spotipy
-import pandas as pd
 import os
-from sqlalchemy.orm import Session
-from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, Iterable
+import asyncio
 import json
 
+from app.config import settings
+from app.database import insert_ignoring_conflicts
 from app.models import Track, ListeningHistory
+from app.services.genres import SYNC_TRACK_LOOKUPS, GenreService, fetch_genre_sources
+from app.services.rollups import PRUNED_BEFORE, ListeningRollupService
+
+if TYPE_CHECKING:
+    import spotipy
+
+def parse_played_at(ts: str) -> datetime:
+    # "2021-03-05T12:34:56.789Z" from Spotify; played_at is a naive UTC column, and asyncpg
+    # refuses to compare or store an aware datetime there
+    played_at = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if played_at.tzinfo is not None:
+        played_at = played_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return played_at
+
+async def insert_new_tracks(db: AsyncSession, tracks: Iterable[Track]) -> Dict[str, Track]:
+    """Insere músicas ainda não persistidas e retorna as linhas do banco por spotify_id"""
+    rows = {
+        track.spotify_id: {
+            column.name: getattr(track, column.key)
+            for column in Track.__table__.columns if column.name not in ("id", "created_at")
+        }
+        for track in tracks
+    }
+    if not rows:
+        return {}
+    await db.execute(
+        insert_ignoring_conflicts(Track.__table__, db.get_bind().dialect.name, ["spotify_id"]),
+        list(rows.values())
+    )
+    return {t.spotify_id: t for t in (await db.scalars(select(Track).where(Track.spotify_id.in_(rows)))).all()}
 
 _tracks_df = None
 
 def get_tracks_dataset():
     global _tracks_df
     if _tracks_df is None:
+        # Deferred so that importing the app does not pay for pandas
+        import pandas as pd
+
         try:
             # 1. Resolve o caminho (Mantive sua lógica, ajuste se necessário)
             base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            csv_path = os.path.join(base_dir, 'data', 'spotify_features.csv')
+            csv_path = settings.tracks_dataset_path or os.path.join(base_dir, 'data', 'spotify_features.csv')
             
             print(f"📂 Lendo CSV de: {csv_path}")
 
@@ -65,53 +101,77 @@ def get_tracks_dataset():
             
     return _tracks_df
 
+# Audio feature columns read from the dataset, with the type stored in Track
+AUDIO_FEATURES = {
+    'danceability': float, 'energy': float, 'key': int, 'loudness': float, 'mode': int,
+    'speechiness': float, 'acousticness': float, 'instrumentalness': float, 'liveness': float,
+    'valence': float, 'tempo': float, 'time_signature': int
+}
+
+def dataset_features(dataset, spotify_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Audio features do dataset para as músicas encontradas nele, por spotify_id"""
+    if dataset.empty:
+        return {}
+    # Membership goes through the index hash table; no scan of the dataset
+    found = [spotify_id for spotify_id in set(spotify_ids) if spotify_id in dataset.index]
+    if not found:
+        return {}
+    rows = dataset.loc[found]
+    rows = rows[~rows.index.duplicated()]
+    columns = [column for column in AUDIO_FEATURES if column in rows.columns]
+    return {
+        spotify_id: {
+            # NaN (missing in the CSV) is the only value not equal to itself
+            column: AUDIO_FEATURES[column](value) if value == value else None
+            for column, value in zip(columns, values)
+        }
+        for spotify_id, values in zip(rows.index, rows[columns].itertuples(index=False))
+    }
+
 class DataCollectionService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         self.dataset = get_tracks_dataset()
     
-    def _enrich_track_from_csv(self, db_track):
+    def _enrich_tracks_from_csv(self, tracks: Iterable[Track]):
         # Try to get audio features from the CSV dataset if Spotify API doesn't have them
-        if self.dataset.empty:
-            return False
-
-        spotify_id = db_track.spotify_id
-        
-        if spotify_id in self.dataset.index:
-            try:
-                features = self.dataset.loc[spotify_id]
-                
-                db_track.danceability = float(features['danceability'])
-                db_track.energy = float(features['energy'])
-                db_track.key = int(features['key'])
-                db_track.loudness = float(features['loudness'])
-                db_track.mode = int(features['mode'])
-                db_track.speechiness = float(features['speechiness'])
-                db_track.acousticness = float(features['acousticness'])
-                db_track.instrumentalness = float(features['instrumentalness'])
-                db_track.liveness = float(features['liveness'])
-                db_track.valence = float(features['valence'])
-                db_track.tempo = float(features['tempo'])
-                db_track.time_signature = int(features['time_signature'])
-                
-                return True
-            except Exception as e:
-                print(f"⚠️ Erro ao ler dados do CSV para {spotify_id}: {e}")
-        return False
+        tracks = list(tracks)
+        try:
+            features = dataset_features(self.dataset, [track.spotify_id for track in tracks])
+        except Exception as e:
+            print(f"⚠️ Erro ao ler dados do CSV: {e}")
+            return
+        for track in tracks:
+            if track.spotify_id in features:
+                for column, value in features[track.spotify_id].items():
+                    setattr(track, column, value)
+                print(f"Dados recuperados do CSV para: {track.name}")
 
-    async def sync_user_listening_history(self, user_id: int, sp: spotipy.Spotify):
+    async def sync_user_listening_history(self, user_id: int, sp: "spotipy.Spotify"):
         """Sincroniza o histórico de escuta do usuário"""
         try:
-            recent_tracks = sp.current_user_recently_played(limit=50)
+            # spotipy is blocking; keep it off the event loop
+            recent_tracks = await asyncio.to_thread(sp.current_user_recently_played, limit=50)
             print(f"🔄 Processando {len(recent_tracks['items'])} músicas do histórico...")
+            new_plays = []
+            rollup_rows = []
+            items = recent_tracks['items']
+            
+            # Tracks and already-stored plays are looked up once for the whole page, not per item
+            spotify_ids = {item['track']['id'] for item in items}
+            tracks_by_spotify_id = {
+                t.spotify_id: t for t in (await self.db.scalars(select(Track).where(Track.spotify_id.in_(spotify_ids)))).all()
+            }
             
-            for item in recent_tracks['items']:
+            new_tracks = {}
+            featureless = {}
+            plays = []
+            for item in items:
                 track_data = item['track']
-                played_at = datetime.fromisoformat(item['played_at'].replace('Z', '+00:00'))
+                played_at = parse_played_at(item['played_at'])
                 spotify_id = track_data['id']
                 
-                db_track = self.db.query(Track).filter(Track.spotify_id == spotify_id).first()
-                track_modified = False  # Track if we need to commit changes to the track
+                db_track = tracks_by_spotify_id.get(spotify_id)
 
                 if not db_track:
                     # Create new track entry from Spotify data
@@ -119,6 +179,7 @@ class DataCollectionService:
                         spotify_id=spotify_id,
                         name=track_data['name'],
                         artists=','.join([artist['name'] for artist in track_data['artists']]),
+                        artist_ids=','.join([artist['id'] for artist in track_data['artists'] if artist.get('id')]),
                         album=track_data['album']['name'],
                         duration_ms=track_data['duration_ms'],
                         popularity=track_data['popularity'],
@@ -126,45 +187,61 @@ class DataCollectionService:
                         preview_url=track_data.get('preview_url'),
                         external_urls=json.dumps(track_data['external_urls'])
                     )
-                    self.db.add(db_track)
-                    track_modified = True
+                    new_tracks[spotify_id] = db_track
+                    tracks_by_spotify_id[spotify_id] = db_track
+                elif db_track.artist_ids is None:
+                    db_track.artist_ids = ','.join([artist['id'] for artist in track_data['artists'] if artist.get('id')])
                 
-                # If track exists but missing audio features, try to get them from CSV
                 if db_track.danceability is None:
-                    found = self._enrich_track_from_csv(db_track)
-                    if found:
-                        print(f"Dados recuperados do CSV para: {db_track.name}")
-                        track_modified = True
-
-                # Only commit if we actually changed something
-                if track_modified:
-                    self.db.commit()
-                    self.db.refresh(db_track)
+                    featureless[spotify_id] = db_track
                 
-                existing_entry = self.db.query(ListeningHistory).filter(
+                plays.append((db_track, played_at, item.get('context') or {}))
+            
+            # Tracks missing audio features are looked up in the CSV once for the whole page
+            self._enrich_tracks_from_csv(featureless.values())
+            
+            # New tracks go in one batched INSERT; plays then point at the stored rows
+            stored = await insert_new_tracks(self.db, new_tracks.values())
+            plays = [(stored.get(track.spotify_id, track), played_at, context) for track, played_at, context in plays]
+            
+            pruned_before = await self.db.scalar(PRUNED_BEFORE)
+            existing = set(
+                (await self.db.execute(select(ListeningHistory.track_id, ListeningHistory.played_at).where(
                     ListeningHistory.user_id == user_id,
-                    ListeningHistory.track_id == db_track.id,
-                    ListeningHistory.played_at == played_at
-                ).first()
-                
-                if not existing_entry:
-                    context = item.get('context') or {}
-                    history_entry = ListeningHistory(
-                        user_id=user_id,
-                        track_id=db_track.id,
-                        played_at=played_at,
-                        context_type=context.get('type'),
-                        context_name=context.get('name')
-                    )
-                    self.db.add(history_entry)
+                    ListeningHistory.played_at.in_([played_at for _, played_at, _ in plays])
+                ))).all()
+            )
+            
+            for db_track, played_at, context in plays:
+                key = (db_track.id, played_at)
+                if key in existing or (pruned_before is not None and key[1] < pruned_before):
+                    continue
+                existing.add(key)
+                history_entry = ListeningHistory(
+                    user_id=user_id,
+                    track_id=db_track.id,
+                    played_at=played_at,
+                    context_type=context.get('type'),
+                    context_name=context.get('name')
+                )
+                self.db.add(history_entry)
+                new_plays.append((db_track, played_at))
+                rollup_rows.append((db_track.id, played_at, context.get('type')))
+            
+            # Rollups and genre tallies are maintained here so the analyses never scan history
+            await self.db.run_sync(lambda session: ListeningRollupService(session).record_plays(user_id, rollup_rows))
+            tally = await self.db.run_sync(lambda session: GenreService(session).prepare_plays(user_id, new_plays))
+            # Only the Spotify lookup leaves the loop; run_sync gets the database work alone
+            lookup = await asyncio.to_thread(fetch_genre_sources, sp, tally, SYNC_TRACK_LOOKUPS) if tally.needs_lookup else None
+            await self.db.run_sync(lambda session: GenreService(session).apply_plays(tally, lookup))
             
-            self.db.commit()
+            await self.db.commit()
             print("Sincronização concluída")
             
         except Exception as e:
-            self.db.rollback()
+            await self.db.rollback()
             print(f"Erro na sincronização: {e}")
             raise e
             
-    async def get_user_top_tracks(self, user_id: int, sp: spotipy.Spotify, time_range: str = 'medium_term', limit: int = 50):
+    async def get_user_top_tracks(self, user_id: int, sp: "spotipy.Spotify", time_range: str = 'medium_term', limit: int = 50):
         pass
\ No newline at end of file
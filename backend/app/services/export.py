@@ -0,0 +1,83 @@
+"""Exportação em massa (NDJSON ou CSV) lida do banco por cursor no servidor.
+
+Cada bloco de linhas do cursor vira um pedaço da resposta, então a memória do worker
+não depende do tamanho do histórico. O gerador abre a própria sessão (réplica quando
+houver), que vive enquanto a resposta é enviada.
+"""
+from datetime import datetime
+from typing import AsyncIterator, Optional, Sequence
+import csv
+import io
+
+from sqlalchemy import Select, or_, select
+
+from app.config import settings
+from app.database import open_read_session
+from app.models import CompatibilityScore, ListeningHistory, Track
+from app.responses import dumps
+
+DATASETS = ("history", "compatibility")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+HISTORY_COLUMNS = (
+    ListeningHistory.user_id,
+    ListeningHistory.played_at,
+    Track.spotify_id.label("track_spotify_id"),
+    Track.name.label("track_name"),
+    Track.artists,
+    Track.album,
+    Track.duration_ms,
+    ListeningHistory.context_type,
+    ListeningHistory.context_name
+)
+
+COMPATIBILITY_COLUMNS = (
+    CompatibilityScore.user1_id,
+    CompatibilityScore.user2_id,
+    CompatibilityScore.overall_score,
+    CompatibilityScore.genre_similarity,
+    CompatibilityScore.artist_similarity,
+    CompatibilityScore.audio_features_similarity,
+    CompatibilityScore.listening_time_similarity,
+    CompatibilityScore.common_tracks,
+    CompatibilityScore.analysis_date
+)
+
+def export_statement(dataset: str, user_id: Optional[int] = None) -> Select:
+    """SELECT de um dataset ("history" ou "compatibility"), de um usuário ou de todos"""
+    if dataset == "history":
+        stmt = select(*HISTORY_COLUMNS).join(Track, Track.id == ListeningHistory.track_id)
+        if user_id is not None:
+            stmt = stmt.where(ListeningHistory.user_id == user_id)
+        # Follows ix_listening_history_user_played_at, so the cursor needs no sort
+        return stmt.order_by(ListeningHistory.user_id, ListeningHistory.played_at)
+
+    stmt = select(*COMPATIBILITY_COLUMNS)
+    if user_id is not None:
+        stmt = stmt.where(or_(CompatibilityScore.user1_id == user_id, CompatibilityScore.user2_id == user_id))
+    return stmt.order_by(CompatibilityScore.id)
+
+def _ndjson_chunk(keys: Sequence[str], rows) -> bytes:
+    return b"".join(dumps(dict(zip(keys, row))) + b"\n" for row in rows)
+
+def _csv_chunk(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([value.isoformat() if isinstance(value, datetime) else value for value in row])
+    return buffer.getvalue().encode()
+
+async def stream_export(dataset: str, fmt: str, reader_id: int, user_id: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Gera a exportação em pedaços de EXPORT_CHUNK_SIZE linhas"""
+    stmt = export_statement(dataset, user_id).execution_options(yield_per=settings.export_chunk_size)
+    async with await open_read_session(reader_id) as db:
+        result = await db.stream(stmt)
+        keys = list(result.keys())
+        if fmt == "csv":
+            yield _csv_chunk([keys])
+        async for rows in result.partitions():
+            yield _csv_chunk(rows) if fmt == "csv" else _ndjson_chunk(keys, rows)
+
+def export_filename(dataset: str, fmt: str, user_id: Optional[int] = None) -> str:
+    scope = f"user-{user_id}" if user_id is not None else "all"
+    return f"soulmatch-{dataset}-{scope}.{fmt}"
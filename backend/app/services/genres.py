@@ -0,0 +1,250 @@
+from sqlalchemy.orm import Session
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import json
+import math
+
+from app.database import insert_ignoring_conflicts
+from app.models import Artist, ListeningDaily, Track, UserGenreStats
+
+SPOTIFY_ARTISTS_BATCH = 50  # limite do endpoint GET /artists
+SPOTIFY_TRACKS_BATCH = 50  # limite do endpoint GET /tracks
+# Tracks stored without artist ids (e.g. imported) looked up per sync; the rest wait for the next one
+SYNC_TRACK_LOOKUPS = 500
+
+def genre_entropy(genre_counts: Dict[str, int]) -> float:
+    total = sum(genre_counts.values())
+    if not total:
+        return 0.0
+    return -sum((c / total) * math.log2(c / total) for c in genre_counts.values() if c)
+
+@dataclass
+class GenreTally:
+    """Execuções a somar às contagens de um usuário, com os gêneros já conhecidos e os artistas a buscar"""
+    stats: UserGenreStats
+    weighted: List[Tuple[Track, datetime, int]]
+    artist_genres: Dict[str, List[str]]
+    missing: List[str]
+    unknown_tracks: List[str]  # spotify ids of tracks whose artists were never stored
+
+    @property
+    def needs_lookup(self) -> bool:
+        return bool(self.missing or self.unknown_tracks)
+
+@dataclass
+class SpotifyLookup:
+    """O que fetch_genre_sources trouxe do Spotify para apply_plays"""
+    track_artists: Dict[str, str]  # spotify id da música -> artist_ids ("" se o Spotify não a conhece)
+    artists: List[Dict[str, Any]]
+
+def fetch_track_artists(sp: Any, track_ids: List[str]) -> Dict[str, str]:
+    """Ids dos artistas de cada música, em lotes de SPOTIFY_TRACKS_BATCH (só HTTP)"""
+    track_artists = {}
+    for start in range(0, len(track_ids), SPOTIFY_TRACKS_BATCH):
+        batch = track_ids[start:start + SPOTIFY_TRACKS_BATCH]
+        try:
+            response = sp.tracks(batch)
+        except Exception as e:
+            print(f"⚠️ Erro ao buscar artistas de músicas no Spotify: {e}")
+            continue
+        found = {track_data['id']: track_data for track_data in response.get('tracks') or [] if track_data}
+        for track_id in batch:
+            track_artists[track_id] = ','.join(
+                artist['id'] for artist in (found.get(track_id) or {}).get('artists') or [] if artist.get('id')
+            )
+    return track_artists
+
+def fetch_artists(sp: Any, artist_ids: List[str]) -> List[Dict[str, Any]]:
+    """Artistas no Spotify, em lotes de SPOTIFY_ARTISTS_BATCH.
+
+    Só faz HTTP (bloqueante): no caminho async roda em asyncio.to_thread, entre as duas etapas de banco.
+    """
+    artists = []
+    for start in range(0, len(artist_ids), SPOTIFY_ARTISTS_BATCH):
+        batch = artist_ids[start:start + SPOTIFY_ARTISTS_BATCH]
+        try:
+            response = sp.artists(batch)
+        except Exception as e:
+            # The batch stays missing from the result; apply_plays flags the user for a rebuild
+            print(f"⚠️ Erro ao buscar gêneros de artistas no Spotify: {e}")
+            continue
+        found = {artist_data['id']: artist_data for artist_data in response.get('artists') or [] if artist_data}
+        # Ids Spotify doesn't know are cached without genres, so they aren't looked up forever
+        artists.extend(found.get(artist_id) or {"id": artist_id, "name": None, "genres": []} for artist_id in batch)
+    return artists
+
+def fetch_genre_sources(sp: Any, tally: GenreTally, max_track_lookups: Optional[int] = None) -> SpotifyLookup:
+    """Busca no Spotify os artistas das músicas sem artistas e os gêneros dos artistas fora do cache.
+
+    Só faz HTTP (bloqueante): no caminho async roda em asyncio.to_thread, entre prepare_plays e apply_plays.
+    """
+    track_artists = fetch_track_artists(sp, tally.unknown_tracks[:max_track_lookups])
+    artist_ids = set(tally.missing)
+    for ids in track_artists.values():
+        artist_ids.update(a for a in ids.split(',') if a)
+    return SpotifyLookup(track_artists, fetch_artists(sp, sorted(artist_ids - set(tally.artist_genres))))
+
+class GenreService:
+    """Mantém o cache artista→gêneros e as contagens de gêneros por usuário"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def cached_artist_genres(self, artist_ids: Iterable[str]) -> Dict[str, List[str]]:
+        artist_ids = set(a for a in artist_ids if a)
+        if not artist_ids:
+            return {}
+        cached = self.db.query(Artist.spotify_id, Artist.genres).filter(Artist.spotify_id.in_(artist_ids)).all()
+        return {spotify_id: json.loads(g) if g else [] for spotify_id, g in cached}
+
+    def store_artists(self, artists: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+        """Grava no cache local os artistas vindos do Spotify e devolve os gêneros de cada um"""
+        if not artists:
+            return {}
+        rows = [{
+            "spotify_id": artist_data['id'],
+            "name": artist_data.get('name'),
+            "genres": json.dumps(artist_data.get('genres') or [])
+        } for artist_data in artists]
+        self.db.execute(
+            insert_ignoring_conflicts(Artist.__table__, self.db.get_bind().dialect.name, ["spotify_id"]), rows
+        )
+        return {artist_data['id']: artist_data.get('genres') or [] for artist_data in artists}
+
+    def resolve_artist_genres(self, artist_ids: Iterable[str], sp: Any = None) -> Dict[str, List[str]]:
+        """Gêneros por artista, buscando no Spotify só os que ainda não estão no cache local"""
+        artist_ids = set(a for a in artist_ids if a)
+        genres = self.cached_artist_genres(artist_ids)
+        missing = sorted(artist_ids - set(genres))
+        if missing and sp is not None:
+            genres.update(self.store_artists(fetch_artists(sp, missing)))
+        return genres
+
+    def prepare_plays(self, user_id: int, plays: List[Tuple[Track, datetime]]) -> GenreTally:
+        """Primeira etapa de record_plays: o que somar e quais artistas ainda faltam no cache local"""
+        stats = self.db.query(UserGenreStats).filter(UserGenreStats.user_id == user_id).first()
+        weighted = [(track, played_at, 1) for track, played_at in plays]
+        if stats is None or stats.needs_backfill:
+            # First run for this user, or plays left out by an earlier run: (re)build from the
+            # daily rollup, which the caller has already updated with these plays
+            if stats is None:
+                stats = UserGenreStats(user_id=user_id)
+                self.db.add(stats)
+            stats.total_plays = 0
+            stats.genre_counts = None
+            stats.monthly_counts = None
+            stats.needs_backfill = False
+            self.db.flush()
+            weighted = self.db.query(Track, ListeningDaily.day, ListeningDaily.play_count).join(
+                ListeningDaily, ListeningDaily.track_id == Track.id
+            ).filter(ListeningDaily.user_id == user_id).all()
+
+        artist_ids = set()
+        unknown_tracks = set()
+        for track, _, _ in weighted:
+            if track.artist_ids is None:
+                unknown_tracks.add(track.spotify_id)
+            elif track.artist_ids:
+                artist_ids.update(a for a in track.artist_ids.split(',') if a)
+        artist_genres = self.cached_artist_genres(artist_ids)
+        return GenreTally(stats, weighted, artist_genres, sorted(artist_ids - set(artist_genres)), sorted(unknown_tracks))
+
+    def apply_plays(self, tally: GenreTally, lookup: Optional[SpotifyLookup] = None) -> UserGenreStats:
+        """Segunda etapa de record_plays: grava o que veio do Spotify e soma as execuções"""
+        stats = tally.stats
+        lookup = lookup or SpotifyLookup({}, [])
+        wanted = set(tally.missing)
+        for track, _, _ in tally.weighted:
+            if track.artist_ids is None and track.spotify_id in lookup.track_artists:
+                track.artist_ids = lookup.track_artists[track.spotify_id]
+                wanted.update(a for a in track.artist_ids.split(',') if a)
+        artist_genres = {**tally.artist_genres, **self.store_artists(lookup.artists)}
+
+        unresolved = wanted - set(artist_genres)
+        unknown_tracks = {track.spotify_id for track, _, _ in tally.weighted if track.artist_ids is None}
+        if unresolved or unknown_tracks:
+            # Their plays are left out now and counted when the next sync rebuilds the tallies
+            print(
+                f"⚠️ {len(unknown_tracks)} músicas sem artistas e {len(unresolved)} artistas sem gêneros; "
+                "contagens refeitas no próximo sync"
+            )
+            stats.needs_backfill = True
+
+        genre_counts = Counter(json.loads(stats.genre_counts) if stats.genre_counts else {})
+        monthly_counts = json.loads(stats.monthly_counts) if stats.monthly_counts else {}
+        total_plays = stats.total_plays or 0
+
+        for track, played_at, count in tally.weighted:
+            track_genres = set()
+            for artist_id in (track.artist_ids or '').split(','):
+                track_genres.update(artist_genres.get(artist_id, []))
+            if not track_genres:
+                continue
+
+            total_plays += count
+            month = monthly_counts.setdefault(played_at.strftime('%Y-%m'), {"plays": 0, "genres": {}})
+            month["plays"] += count
+            for genre in track_genres:
+                genre_counts[genre] += count
+                month["genres"][genre] = month["genres"].get(genre, 0) + count
+
+        stats.total_plays = total_plays
+        stats.genre_counts = json.dumps(dict(genre_counts))
+        stats.monthly_counts = json.dumps(monthly_counts)
+        stats.entropy = genre_entropy(genre_counts)
+        return stats
+
+    def record_plays(self, user_id: int, plays: List[Tuple[Track, datetime]], sp: Any = None) -> UserGenreStats:
+        """Soma as novas execuções às contagens de gêneros do usuário (total e por mês).
+
+        Versão síncrona, para jobs e scripts; o sync async chama prepare_plays e apply_plays
+        dentro de run_sync e fetch_genre_sources fora dele, sem travar o event loop.
+        """
+        tally = self.prepare_plays(user_id, plays)
+        lookup = fetch_genre_sources(sp, tally) if sp is not None and tally.needs_lookup else None
+        return self.apply_plays(tally, lookup)
+
+    def mark_for_backfill(self, user_id: int):
+        """Execuções gravadas sem somar (ex.: importadas): o próximo record_plays refaz as contagens"""
+        # Without a stats row there is nothing to flag: the first run already folds in everything
+        self.db.query(UserGenreStats).filter(UserGenreStats.user_id == user_id).update(
+            {UserGenreStats.needs_backfill: True}, synchronize_session=False
+        )
+
+    def get_genre_analysis(self, user_id: int, top: int = 20, months: int = 12, top_per_month: int = 5) -> Optional[Dict[str, Any]]:
+        stats = self.db.query(UserGenreStats).filter(UserGenreStats.user_id == user_id).first()
+        if stats is None or not stats.total_plays:
+            return None
+
+        genre_counts = Counter(json.loads(stats.genre_counts))
+        monthly_counts = json.loads(stats.monthly_counts)
+        total = stats.total_plays
+        unique_genres = len(genre_counts)
+
+        trend = []
+        for month in sorted(monthly_counts)[-months:]:
+            month_plays = monthly_counts[month]["plays"]
+            counts = Counter(monthly_counts[month]["genres"])
+            trend.append({
+                "month": month,
+                "total_plays": month_plays,
+                "entropy": genre_entropy(counts),
+                "top_genres": [
+                    {"genre": g, "share": c / month_plays} for g, c in counts.most_common(top_per_month)
+                ]
+            })
+
+        return {
+            "total_plays": total,
+            "genre_distribution": [
+                {"genre": g, "play_count": c, "share": c / total} for g, c in genre_counts.most_common(top)
+            ],
+            "diversity": {
+                "entropy": stats.entropy,
+                "normalized_entropy": stats.entropy / math.log2(unique_genres) if unique_genres > 1 else 0.0,
+                "unique_genres": unique_genres
+            },
+            "trend": trend
+        }
@@ -0,0 +1,205 @@
+"""Importação do histórico estendido do Spotify (Streaming_History_Audio_*.json).
+
+Cada arquivo é um array JSON com anos de execuções; ijson lê um item por vez, sem carregar
+o documento. As execuções vão ao banco em lotes de IMPORT_BATCH_SIZE: as músicas são
+resolvidas com um IN, as que faltam são inseridas já com as audio features do dataset, e o
+histórico entra com INSERT ... ON CONFLICT DO NOTHING, então reimportar um arquivo (ou
+retomar um job que falhou no meio) não duplica execuções. Só as execuções de fato inseridas
+são somadas aos agregados (app/services/rollups.py), no mesmo commit do lote. No fim, se
+entrou alguma execução, o job refaz as contagens de gêneros (buscando no Spotify os artistas
+das músicas importadas) e o perfil do usuário (refresh_after_import).
+"""
+from collections import Counter
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional
+import asyncio
+import os
+import tempfile
+
+import ijson
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import insert_ignoring_conflicts
+from app.models import ListeningHistory, Track, User, UserProfile
+from app.services.data_collection import AUDIO_FEATURES, dataset_features, get_tracks_dataset, parse_played_at
+from app.services.genres import GenreService
+from app.services.rollups import PRUNED_BEFORE, ListeningRollupService
+
+TRACK_URI_PREFIX = "spotify:track:"
+_COPY_CHUNK_BYTES = 1024 * 1024
+
+class UploadTooLarge(ValueError):
+    pass
+
+def save_upload(source: BinaryIO, max_bytes: int) -> str:
+    """Copia o upload para um arquivo que o job (outro processo) consegue abrir pelo caminho"""
+    fd, path = tempfile.mkstemp(prefix="soulmatch-import-", suffix=".json", dir=settings.import_upload_dir)
+    try:
+        with os.fdopen(fd, "wb") as target:
+            copied = 0
+            while chunk := source.read(_COPY_CHUNK_BYTES):
+                copied += len(chunk)
+                if copied > max_bytes:
+                    raise UploadTooLarge(f"Arquivo maior que {max_bytes // (1024 * 1024)}MB")
+                target.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+def iter_plays(f: BinaryIO, counts: Counter) -> Iterator[Dict[str, Any]]:
+    """Execuções de músicas do arquivo; podcasts, vídeos e plays curtos são contados e pulados"""
+    for item in ijson.items(f, "item", use_float=True):
+        uri = item.get("spotify_track_uri") or ""
+        if not uri.startswith(TRACK_URI_PREFIX) or not item.get("ts"):
+            counts["skipped_not_track"] += 1
+            continue
+        if (item.get("ms_played") or 0) < settings.import_min_ms_played:
+            counts["skipped_short"] += 1
+            continue
+        yield item
+
+class HistoryImportService:
+    def __init__(self, db: Session):
+        self.db = db
+        self.dialect = db.get_bind().dialect.name
+        self.dataset = get_tracks_dataset()
+        self.pruned_before = None
+
+    def import_files(self, user_id: int, paths: List[str], progress: Optional[Callable[[float, str], None]] = None) -> Dict[str, Any]:
+        """Importa os arquivos em ordem, com um commit por lote; retorna as contagens"""
+        sizes = [os.path.getsize(path) for path in paths]
+        total_bytes = sum(sizes) or 1
+        done_bytes = 0
+        counts = Counter()
+        self.pruned_before = self.db.scalar(PRUNED_BEFORE)
+
+        for path, size in zip(paths, sizes):
+            with open(path, "rb") as f:
+                batch = []
+                for item in iter_plays(f, counts):
+                    batch.append(item)
+                    if len(batch) >= settings.import_batch_size:
+                        self._import_batch(user_id, batch, counts)
+                        batch = []
+                        if progress:
+                            # Read position is a few KB ahead of the parser; close enough for a progress bar
+                            progress(min((done_bytes + f.tell()) / total_bytes, 0.99), "importing")
+                if batch:
+                    self._import_batch(user_id, batch, counts)
+            done_bytes += size
+            counts["files"] += 1
+            if progress:
+                progress(min(done_bytes / total_bytes, 0.99), "importing")
+
+        if counts["plays_inserted"]:
+            # Pattern responses are tagged with the profile version, which only syncs used to move
+            self.db.execute(update(UserProfile).where(UserProfile.user_id == user_id).values(version=UserProfile.version + 1))
+            self.db.commit()
+        return dict(counts)
+
+    def _resolve_tracks(self, items: List[Dict[str, Any]], counts: Counter) -> Dict[str, Track]:
+        """Linhas de Track por spotify_id, criando as que faltam com os metadados do arquivo"""
+        metadata = {}
+        for item in items:
+            metadata.setdefault(item["spotify_track_uri"][len(TRACK_URI_PREFIX):], item)
+
+        tracks = {t.spotify_id: t for t in self.db.scalars(select(Track).where(Track.spotify_id.in_(metadata)))}
+        missing = [spotify_id for spotify_id in metadata if spotify_id not in tracks]
+        featureless = [t for t in tracks.values() if t.danceability is None]
+        features = dataset_features(self.dataset, missing + [t.spotify_id for t in featureless])
+
+        for track in featureless:
+            if track.spotify_id in features:
+                for column, value in features[track.spotify_id].items():
+                    setattr(track, column, value)
+                counts["tracks_enriched"] += 1
+
+        if missing:
+            no_features = dict.fromkeys(AUDIO_FEATURES)
+            self.db.execute(insert_ignoring_conflicts(Track.__table__, self.dialect, ["spotify_id"]), [
+                {
+                    "spotify_id": spotify_id,
+                    "name": metadata[spotify_id].get("master_metadata_track_name"),
+                    "artists": metadata[spotify_id].get("master_metadata_album_artist_name"),
+                    "album": metadata[spotify_id].get("master_metadata_album_album_name"),
+                    **no_features,
+                    **features.get(spotify_id, {})
+                }
+                for spotify_id in missing
+            ])
+            tracks.update({t.spotify_id: t for t in self.db.scalars(select(Track).where(Track.spotify_id.in_(missing)))})
+            counts["tracks_created"] += len(missing)
+            counts["tracks_enriched"] += sum(1 for spotify_id in missing if spotify_id in features)
+        return tracks
+
+    def _import_batch(self, user_id: int, items: List[Dict[str, Any]], counts: Counter):
+        tracks = self._resolve_tracks(items, counts)
+
+        rows = {}
+        pruned = 0
+        for item in items:
+            track = tracks[item["spotify_track_uri"][len(TRACK_URI_PREFIX):]]
+            played_at = parse_played_at(item["ts"])
+            if self.pruned_before is not None and played_at < self.pruned_before:
+                pruned += 1
+                continue
+            rows[(track.id, played_at)] = {"user_id": user_id, "track_id": track.id, "played_at": played_at}
+
+        # RETURNING only yields the rows actually inserted, i.e. the plays not already stored
+        inserted = self.db.execute(
+            insert_ignoring_conflicts(
+                ListeningHistory.__table__, self.dialect, ["user_id", "track_id", "played_at"]
+            ).returning(ListeningHistory.track_id, ListeningHistory.played_at),
+            list(rows.values())
+        ).all() if rows else []
+
+        ListeningRollupService(self.db).record_plays(user_id, [(track_id, played_at, None) for track_id, played_at in inserted])
+        if inserted:
+            # Imported tracks carry no artist ids; refresh_after_import (or the next sync) tallies them
+            GenreService(self.db).mark_for_backfill(user_id)
+        self.db.commit()
+
+        counts["plays_read"] += len(items)
+        counts["plays_inserted"] += len(inserted)
+        counts["plays_duplicated"] += len(items) - pruned - len(inserted)
+        if pruned:
+            counts["skipped_pruned"] += pruned
+
+def refresh_after_import(db: Session, user_id: int):
+    """Depois de um import com execuções novas: contagens de gêneros e perfil (features, cluster e persona)"""
+    from app.utils import get_spotify_client
+
+    sp = None
+    try:
+        sp = get_spotify_client(db.get(User, user_id))
+    except Exception as e:
+        # Genres stay flagged for the next sync; the profile is rebuilt without Spotify's top genres
+        print(f"⚠️ Sem cliente do Spotify para o usuário {user_id}: {e}")
+
+    GenreService(db).record_plays(user_id, [], sp)
+    db.commit()
+    asyncio.run(_regenerate_profile(user_id, sp))
+
+async def _regenerate_profile(user_id: int, sp: Any):
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from app.database import ASYNC_DATABASE_URL
+    from app.services.analysis import AnalysisService
+
+    # Own engine without a pool: the app's pooled connections belong to another event loop
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=NullPool)
+    try:
+        async with AsyncSession(async_engine, autoflush=False, expire_on_commit=False) as db:
+            await AnalysisService(db).generate_user_profile(user_id, sp)
+    finally:
+        await async_engine.dispose()
+
+def remove_uploads(paths: List[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,274 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import json
+import multiprocessing
+import time
+import uuid
+
+from app.cache import response_cache
+from app.config import settings
+from app.database import SessionLocal, engine, mark_recent_write
+from app.models import BackgroundJob
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def _init_worker():
+    # Connections inherited from the parent process must not be reused by the child
+    # (a spawned child starts without any; kept in case the pool is ever forked again)
+    engine.dispose(close=False)
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # Spawned, not forked: the web worker already runs threads (to_thread, aiosqlite, token refresh),
+        # and a forked child can inherit a lock one of them was holding and deadlock on it
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.job_workers, initializer=_init_worker, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def serialize_job(job: BackgroundJob) -> Dict[str, Any]:
+    result = json.loads(job.result) if job.result else None
+    duration = None
+    if job.started_at and job.finished_at:
+        duration = (job.finished_at - job.started_at).total_seconds()
+
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "stage": job.stage,
+        "params": json.loads(job.params) if job.params else {},
+        "result": result,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "duration_seconds": duration
+    }
+
+def _find_active_job(db: Session, coalesce_key: str) -> Optional[BackgroundJob]:
+    # Jobs whose worker stopped reporting (crash, restart) do not block new submissions
+    stale_before = datetime.utcnow() - timedelta(minutes=settings.job_stale_after_minutes)
+    return db.query(BackgroundJob).filter(
+        BackgroundJob.coalesce_key == coalesce_key,
+        BackgroundJob.status.in_(ACTIVE_STATUSES),
+        BackgroundJob.heartbeat_at >= stale_before
+    ).first()
+
+def _fail_stale_jobs(db: Session, coalesce_key: str):
+    # A stale job still holds its key in the unique index; it is closed so a new one can take it
+    stale_before = datetime.utcnow() - timedelta(minutes=settings.job_stale_after_minutes)
+    db.query(BackgroundJob).filter(
+        BackgroundJob.coalesce_key == coalesce_key,
+        BackgroundJob.status.in_(ACTIVE_STATUSES),
+        BackgroundJob.heartbeat_at < stale_before
+    ).update({"status": "failed", "error": "Job sem sinal do worker", "finished_at": datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+
+def _create_job(db: Session, kind: str, coalesce_key: str, params: Dict[str, Any], requested_by: Optional[int]) -> Tuple[BackgroundJob, bool]:
+    """Cria o job, ou retorna o ativo com a mesma chave (coalescido).
+
+    A unicidade vem do índice parcial em coalesce_key: dois workers que submetem ao mesmo
+    tempo não enfileiram dois jobs, e o que perde a corrida recebe o job do outro.
+    """
+    active = _find_active_job(db, coalesce_key)
+    if active:
+        return active, True
+    _fail_stale_jobs(db, coalesce_key)
+
+    job = BackgroundJob(
+        id=uuid.uuid4().hex,
+        kind=kind,
+        status="queued",
+        coalesce_key=coalesce_key,
+        progress=0.0,
+        params=json.dumps(params),
+        requested_by=requested_by,
+        heartbeat_at=datetime.utcnow()
+    )
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        active = _find_active_job(db, coalesce_key)
+        if active is None:
+            raise
+        return active, True
+    db.refresh(job)
+    return job, False
+
+def submit_clustering_job(db: Session, params: Dict[str, Any], requested_by: Optional[int] = None) -> Tuple[BackgroundJob, bool]:
+    """Enfileira uma clusterização. Se já existir uma ativa, retorna ela (coalescida)."""
+    job, coalesced = _create_job(db, "clustering", "clustering", params, requested_by)
+    if not coalesced:
+        future = get_executor().submit(run_clustering_job, job.id)
+        # Runs in this process once the worker is done, so in-process caches are reached too
+        future.add_done_callback(lambda _: response_cache.invalidate_clusters())
+    return job, coalesced
+
+def _update_job(job_id: str, **fields):
+    # Progress is written from its own session so it never commits half of the job's work
+    db = SessionLocal()
+    try:
+        fields["heartbeat_at"] = datetime.utcnow()
+        db.query(BackgroundJob).filter(BackgroundJob.id == job_id).update(fields)
+        db.commit()
+    finally:
+        db.close()
+
+def run_clustering_job(job_id: str):
+    """Executa no processo do pool: roda a clusterização e registra progresso e resultado"""
+    from app.services.clustering import ClusteringService
+
+    db = SessionLocal()
+    try:
+        job = db.get(BackgroundJob, job_id)
+        params = json.loads(job.params) if job.params else {}
+        _update_job(job_id, status="running", stage="starting", started_at=datetime.utcnow())
+
+        def progress(fraction: float, stage: str):
+            _update_job(job_id, progress=round(fraction, 3), stage=stage)
+
+        started = time.perf_counter()
+        result = ClusteringService(db).perform_clustering(progress=progress, **params)
+        result.setdefault("timings", {})["total_seconds"] = time.perf_counter() - started
+
+        _update_job(
+            job_id,
+            status="failed" if result.get("status") == "error" else "succeeded",
+            progress=1.0,
+            stage="done",
+            result=json.dumps(result),
+            finished_at=datetime.utcnow()
+        )
+    except Exception as e:
+        db.rollback()
+        import traceback
+        traceback.print_exc()
+        print(f"🚨 ERRO NO JOB DE CLUSTERING {job_id}: {e}")
+        _update_job(job_id, status="failed", error=str(e), finished_at=datetime.utcnow())
+    finally:
+        db.close()
+
+def submit_import_job(db: Session, user_id: int, paths: List[str]) -> Tuple[BackgroundJob, bool]:
+    """Enfileira a importação de histórico de um usuário. Se ele já tiver uma ativa, retorna ela sem enfileirar."""
+    job, coalesced = _create_job(db, "import", f"import:{user_id}", {"files": paths}, user_id)
+    if not coalesced:
+        future = get_executor().submit(run_import_job, job.id)
+        future.add_done_callback(lambda _: _after_user_write(user_id))
+    return job, coalesced
+
+def _after_user_write(user_id: int):
+    # Same as after a sync: this user's reads go to the primary and cached responses are rebuilt;
+    # the regenerated profile may have moved to another cluster, so the summaries are rebuilt too
+    mark_recent_write(user_id)
+    response_cache.invalidate_user(user_id)
+    response_cache.invalidate_clusters()
+
+def run_import_job(job_id: str):
+    """Executa no processo do pool: importa os arquivos enviados e apaga os uploads no fim"""
+    from app.services.history_import import HistoryImportService, refresh_after_import, remove_uploads
+
+    db = SessionLocal()
+    paths: List[str] = []
+    try:
+        job = db.get(BackgroundJob, job_id)
+        paths = json.loads(job.params)["files"]
+        _update_job(job_id, status="running", stage="starting", started_at=datetime.utcnow())
+
+        def progress(fraction: float, stage: str):
+            _update_job(job_id, progress=round(fraction, 3), stage=stage)
+
+        started = time.perf_counter()
+        result = HistoryImportService(db).import_files(job.requested_by, paths, progress=progress)
+        if result.get("plays_inserted"):
+            progress(0.99, "profile")
+            refresh_after_import(db, job.requested_by)
+        result["total_seconds"] = time.perf_counter() - started
+
+        _update_job(
+            job_id,
+            status="succeeded",
+            progress=1.0,
+            stage="done",
+            result=json.dumps(result),
+            finished_at=datetime.utcnow()
+        )
+    except Exception as e:
+        db.rollback()
+        import traceback
+        traceback.print_exc()
+        print(f"🚨 ERRO NO JOB DE IMPORTAÇÃO {job_id}: {e}")
+        _update_job(job_id, status="failed", error=str(e), finished_at=datetime.utcnow())
+    finally:
+        db.close()
+        remove_uploads(paths)
+
+def submit_token_refresh_job(db: Session) -> Tuple[BackgroundJob, bool]:
+    """Enfileira a renovação proativa de tokens. Se já existir uma ativa (de qualquer worker), retorna ela."""
+    job, coalesced = _create_job(db, "token_refresh", "token_refresh", {}, None)
+    if not coalesced:
+        get_executor().submit(run_token_refresh_job, job.id)
+    return job, coalesced
+
+def run_token_refresh_job(job_id: str):
+    """Executa no processo do pool: renova os tokens que estão para expirar"""
+    from app.services.tokens import token_manager
+
+    try:
+        _update_job(job_id, status="running", stage="refreshing", started_at=datetime.utcnow())
+        refreshed = token_manager.refresh_expiring()
+        if refreshed:
+            print(f"🔑 {refreshed} tokens do Spotify renovados")
+        _update_job(
+            job_id,
+            status="succeeded",
+            progress=1.0,
+            stage="done",
+            result=json.dumps({"refreshed": refreshed}),
+            finished_at=datetime.utcnow()
+        )
+    except Exception as e:
+        print(f"🚨 Erro na renovação periódica de tokens: {e}")
+        _update_job(job_id, status="failed", error=str(e), finished_at=datetime.utcnow())
+    finally:
+        _prune_finished_jobs("token_refresh", timedelta(days=1))
+
+def _prune_finished_jobs(kind: str, older_than: timedelta):
+    # Periodic jobs leave one row per run; only the recent ones are worth keeping
+    db = SessionLocal()
+    try:
+        db.query(BackgroundJob).filter(
+            BackgroundJob.kind == kind,
+            BackgroundJob.status.notin_(ACTIVE_STATUSES),
+            BackgroundJob.finished_at < datetime.utcnow() - older_than
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+async def run_periodic_clustering(interval_minutes: int):
+    while True:
+        await asyncio.sleep(interval_minutes * 60)
+        db = SessionLocal()
+        try:
+            submit_clustering_job(db, {})
+        except Exception as e:
+            print(f"🚨 Erro ao agendar atualização periódica dos clusters: {e}")
+        finally:
+            db.close()
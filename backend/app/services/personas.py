@@ -0,0 +1,78 @@
+import numpy as np
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional
+
+from app.database import insert_adding_counts
+from app.models import PersonaCount, UserProfile
+from app.services.clustering import FEATURE_COLUMNS
+
+DEFAULT_PERSONA = "Eclético / Explorador"
+
+_COLUMN = {col.replace("avg_", "", 1): i for i, col in enumerate(FEATURE_COLUMNS)}
+
+def persona_labels(features: np.ndarray) -> np.ndarray:
+    """Aplica as regras de persona a uma matriz de features (colunas em FEATURE_COLUMNS)"""
+    features = np.atleast_2d(np.asarray(features, dtype=float))
+    energy = features[:, _COLUMN["energy"]]
+    dance = features[:, _COLUMN["danceability"]]
+    acoustic = features[:, _COLUMN["acousticness"]]
+    valence = features[:, _COLUMN["valence"]]
+    instrumental = features[:, _COLUMN["instrumentalness"]]
+
+    # Checked in order of specificity - most specific rules first (np.select keeps the first match)
+    rules = [
+        (instrumental > 0.5, "Foco & Instrumental"),
+        ((energy > 0.75) & (dance > 0.6), "Rei da Pista"),
+        ((energy > 0.8) & (valence < 0.4), "Metal & Intenso"),
+        (acoustic > 0.7, "Acústico & Café"),
+        ((valence > 0.75) & (dance > 0.6), "Good Vibes"),
+        ((valence < 0.3) & (energy < 0.4), "Melancólico & Profundo"),
+        (dance > 0.8, "Não Para de Dançar"),
+    ]
+    return np.select([cond for cond, _ in rules], [name for _, name in rules], default=DEFAULT_PERSONA)
+
+def determine_music_persona(features: dict) -> str:
+    """Traduz números em nomes de 'Vibe'"""
+    row = [features.get(col.replace("avg_", "", 1)) or 0 for col in FEATURE_COLUMNS]
+    return str(persona_labels([row])[0])
+
+class PersonaService:
+    """Mantém a persona de cada perfil e a contagem de usuários por persona"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def move(self, previous: Optional[str], current: str):
+        if previous == current:
+            return
+        if previous is not None:
+            self.db.execute(
+                update(PersonaCount).where(PersonaCount.persona == previous).values(
+                    user_count=PersonaCount.user_count - 1
+                )
+            )
+        # Upsert: two profiles entering a persona nobody had yet both count, in any worker
+        self.db.execute(
+            insert_adding_counts(PersonaCount.__table__, self.db.get_bind().dialect.name, ["persona"], "user_count"),
+            {"persona": current, "user_count": 1}
+        )
+
+    def refresh_counts(self):
+        """Recalcula as contagens a partir da coluna indexada music_persona"""
+        rows = self.db.query(UserProfile.music_persona, func.count(UserProfile.id)).filter(
+            UserProfile.music_persona.isnot(None)
+        ).group_by(UserProfile.music_persona).all()
+        self.db.query(PersonaCount).delete(synchronize_session=False)
+        for persona, count in rows:
+            self.db.add(PersonaCount(persona=persona, user_count=count))
+
+    def get_distribution(self) -> List[Dict[str, Any]]:
+        counts = self.db.query(PersonaCount).filter(PersonaCount.user_count > 0).order_by(
+            PersonaCount.user_count.desc()
+        ).all()
+        total = sum(c.user_count for c in counts)
+        return [
+            {"persona": c.persona, "user_count": c.user_count, "share": c.user_count / total}
+            for c in counts
+        ]
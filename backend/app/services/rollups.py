@@ -0,0 +1,123 @@
+"""Agregados do histórico de escuta: listening_daily e listening_hourly.
+
+São atualizados na mesma transação que insere as execuções (sync e importação) e são o que
+perfis, padrões de escuta, gêneros e músicas em comum leem. O histórico bruto vira um log só
+de inserção: prune_history apaga (arquivando antes, se pedido) as execuções antigas sem
+mudar nenhuma estatística derivada.
+"""
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Tuple
+import gzip
+import os
+
+from sqlalchemy import Date, Integer, cast, delete, extract, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.database import insert_adding_counts
+from app.models import HistoryPrune, ListeningDaily, ListeningHistory, ListeningHourly
+from app.responses import dumps
+
+UNKNOWN_CONTEXT = "unknown"
+
+# Plays before the latest prune cutoff are refused: their raw rows are gone, so a second
+# copy could not be detected and would be counted twice in the rollups
+PRUNED_BEFORE = select(func.max(HistoryPrune.pruned_before))
+
+def day_of_week(played_at: datetime) -> int:
+    # Same numbering as extract('dow'): 0 = Sunday
+    return (played_at.weekday() + 1) % 7
+
+def played_day(dialect_name: str, column):
+    """Dia (date) de um timestamp, em SQL"""
+    # SQLite has no DATE type; date() yields the same 'YYYY-MM-DD' text the Date column stores
+    return func.date(column) if dialect_name == "sqlite" else cast(column, Date)
+
+class ListeningRollupService:
+    def __init__(self, db: Session):
+        self.db = db
+        self.dialect = db.get_bind().dialect.name
+
+    def record_plays(self, user_id: int, plays: Iterable[Tuple[int, datetime, Optional[str]]]):
+        """Soma execuções recém-inseridas (track_id, played_at, context_type) aos agregados"""
+        daily = Counter()
+        hourly = Counter()
+        for track_id, played_at, context_type in plays:
+            if played_at.tzinfo is not None:
+                played_at = played_at.astimezone(timezone.utc).replace(tzinfo=None)
+            daily[(track_id, played_at.date())] += 1
+            hourly[(day_of_week(played_at), played_at.hour, context_type or UNKNOWN_CONTEXT)] += 1
+
+        if daily:
+            self.db.execute(
+                insert_adding_counts(ListeningDaily.__table__, self.dialect, ["user_id", "track_id", "day"], "play_count"),
+                [
+                    {"user_id": user_id, "track_id": track_id, "day": day, "play_count": count}
+                    for (track_id, day), count in daily.items()
+                ]
+            )
+        if hourly:
+            self.db.execute(
+                insert_adding_counts(
+                    ListeningHourly.__table__, self.dialect, ["user_id", "day_of_week", "hour", "context_type"], "play_count"
+                ),
+                [
+                    {"user_id": user_id, "day_of_week": dow, "hour": hour, "context_type": context, "play_count": count}
+                    for (dow, hour, context), count in hourly.items()
+                ]
+            )
+
+    def rebuild(self, user_id: Optional[int] = None):
+        """Recalcula os agregados a partir do histórico bruto (carga inicial). Depois de um prune, perde o que foi apagado."""
+        history_filter = [] if user_id is None else [ListeningHistory.user_id == user_id]
+        self.db.execute(delete(ListeningDaily).where(*([] if user_id is None else [ListeningDaily.user_id == user_id])))
+        self.db.execute(delete(ListeningHourly).where(*([] if user_id is None else [ListeningHourly.user_id == user_id])))
+
+        day = played_day(self.dialect, ListeningHistory.played_at)
+        self.db.execute(insert(ListeningDaily).from_select(
+            ["user_id", "track_id", "day", "play_count"],
+            select(ListeningHistory.user_id, ListeningHistory.track_id, day, func.count()).where(*history_filter).group_by(
+                ListeningHistory.user_id, ListeningHistory.track_id, day
+            )
+        ))
+
+        dow = cast(extract("dow", ListeningHistory.played_at), Integer)
+        hour = cast(extract("hour", ListeningHistory.played_at), Integer)
+        context = func.coalesce(ListeningHistory.context_type, UNKNOWN_CONTEXT)
+        self.db.execute(insert(ListeningHourly).from_select(
+            ["user_id", "day_of_week", "hour", "context_type", "play_count"],
+            select(ListeningHistory.user_id, dow, hour, context, func.count()).where(*history_filter).group_by(
+                ListeningHistory.user_id, dow, hour, context
+            )
+        ))
+
+def prune_history(db: Session, before: datetime, archive_dir: Optional[str] = None, chunk_size: int = 10000) -> HistoryPrune:
+    """Apaga do histórico bruto as execuções anteriores a `before`, arquivando-as antes (NDJSON gzip) se pedido"""
+    old = [ListeningHistory.played_at < before]
+    # Plays inserted while this runs (old imports) are above this id: kept, never deleted unarchived
+    max_id = db.scalar(select(func.max(ListeningHistory.id)).where(*old))
+    archive_path = None
+    deleted = 0
+
+    if max_id is not None:
+        old.append(ListeningHistory.id <= max_id)
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+            archive_path = os.path.join(
+                archive_dir, f"listening_history-before-{before:%Y%m%d}-{datetime.utcnow():%Y%m%d%H%M%S}.ndjson.gz"
+            )
+            columns = list(ListeningHistory.__table__.columns)
+            keys = [column.name for column in columns]
+            result = db.execute(
+                select(*columns).where(*old).order_by(ListeningHistory.id),
+                execution_options={"stream_results": True, "yield_per": chunk_size}
+            )
+            with gzip.open(archive_path, "wb") as f:
+                for rows in result.partitions():
+                    f.write(b"".join(dumps(dict(zip(keys, row))) + b"\n" for row in rows))
+        deleted = db.execute(delete(ListeningHistory).where(*old)).rowcount
+
+    prune = HistoryPrune(pruned_before=before, deleted_rows=deleted, archive_path=archive_path)
+    db.add(prune)
+    db.commit()
+    return prune
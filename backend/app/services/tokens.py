@@ -0,0 +1,145 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import TYPE_CHECKING, List, Optional
+import asyncio
+import threading
+import time
+
+from app.config import settings
+from app.database import SessionLocal
+from app.metrics import record_spotify_call
+from app.models import User
+from app.services.jobs import submit_token_refresh_job
+from app.utils import invalidate_principal
+
+if TYPE_CHECKING:
+    from spotipy.oauth2 import SpotifyOAuth
+
+USER_LOCK_STRIPES = 64
+
+class TokenRefreshError(Exception):
+    pass
+
+class SpotifyTokenManager:
+    """Renova tokens do Spotify antes de expirarem, uma renovação por usuário por vez"""
+
+    def __init__(self):
+        self._oauth: Optional["SpotifyOAuth"] = None
+        self._oauth_lock = threading.Lock()
+        # A fixed set of striped locks: memory stays bounded however many users ever refresh
+        self._user_locks: List[threading.Lock] = [threading.Lock() for _ in range(USER_LOCK_STRIPES)]
+
+    @property
+    def oauth(self) -> "SpotifyOAuth":
+        # One client for the whole process; tokens are never cached by spotipy itself
+        if self._oauth is None:
+            with self._oauth_lock:
+                if self._oauth is None:
+                    from spotipy.cache_handler import MemoryCacheHandler
+
+                    from app.spotify import spotify_oauth
+
+                    self._oauth = spotify_oauth(cache_handler=MemoryCacheHandler())
+        return self._oauth
+
+    def _lock_for(self, user_id: int) -> threading.Lock:
+        return self._user_locks[user_id % USER_LOCK_STRIPES]
+
+    @staticmethod
+    def expires_soon(expires_at: Optional[datetime], margin_seconds: Optional[int] = None) -> bool:
+        if expires_at is None:
+            return True
+        margin = settings.spotify_token_refresh_margin_seconds if margin_seconds is None else margin_seconds
+        return expires_at <= datetime.utcnow() + timedelta(seconds=margin)
+
+    def refresh(self, user_id: int, force: bool = False) -> User:
+        """Renova o token do usuário (single-flight) e retorna a linha atualizada, desanexada"""
+        # The thread lock keeps this process to one refresh per user; the row lock (PostgreSQL)
+        # does the same across web workers and the job process
+        with self._lock_for(user_id):
+            db = SessionLocal()
+            try:
+                user = db.query(User).filter(User.id == user_id).with_for_update().first()
+                if user is None or not user.refresh_token:
+                    raise TokenRefreshError("Refresh token não disponível")
+
+                # Whoever waited on the lock finds the token another caller just renewed
+                if not force and not self.expires_soon(user.token_expires_at):
+                    db.expunge(user)
+                    return user
+
+                started = time.perf_counter()
+                try:
+                    token_info = self.oauth.refresh_access_token(user.refresh_token)
+                finally:
+                    record_spotify_call("POST oauth/token", time.perf_counter() - started, "refresh")
+                user.access_token = token_info['access_token']
+                user.token_expires_at = datetime.utcnow() + timedelta(seconds=token_info['expires_in'])
+                if token_info.get('refresh_token'):
+                    user.refresh_token = token_info['refresh_token']
+                db.commit()
+                db.refresh(user)
+                db.expunge(user)
+            except TokenRefreshError:
+                raise
+            except Exception as e:
+                db.rollback()
+                raise TokenRefreshError(str(e)) from e
+            finally:
+                db.close()
+
+        invalidate_principal(user_id)
+        return user
+
+    def ensure_fresh(self, user: User, force: bool = False):
+        """Garante um token válido no objeto do usuário; só bloqueia se o refresh em segundo plano falhou"""
+        if not force and (not user.refresh_token or not self.expires_soon(user.token_expires_at, margin_seconds=0)):
+            return
+        fresh = self.refresh(user.id, force=force)
+        # Mirror the committed values without marking the caller's session dirty
+        for field in ("access_token", "refresh_token", "token_expires_at"):
+            set_committed_value(user, field, getattr(fresh, field))
+
+    def refresh_expiring(self) -> int:
+        """Renova os tokens que expiram dentro da margem, só de usuários ativos nos últimos dias"""
+        now = datetime.utcnow()
+        cutoff = now + timedelta(seconds=settings.spotify_token_refresh_margin_seconds)
+        active_since = now - timedelta(days=settings.spotify_token_refresh_active_days)
+        db = SessionLocal()
+        try:
+            user_ids = [
+                user_id for (user_id,) in db.query(User.id).filter(
+                    User.refresh_token.isnot(None),
+                    User.token_expires_at.isnot(None),
+                    User.token_expires_at <= cutoff,
+                    User.last_active_at >= active_since
+                ).order_by(User.token_expires_at).limit(settings.spotify_token_refresh_batch_size).all()
+            ]
+        finally:
+            db.close()
+
+        def refresh_one(user_id: int) -> bool:
+            try:
+                self.refresh(user_id)
+                return True
+            except TokenRefreshError as e:
+                print(f"⚠️ Não foi possível renovar o token do usuário {user_id}: {e}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=max(1, settings.spotify_token_refresh_concurrency)) as pool:
+            return sum(pool.map(refresh_one, user_ids))
+
+token_manager = SpotifyTokenManager()
+
+async def run_token_refresh(interval_seconds: int):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        # Every web worker runs this loop; the job's coalescing key leaves one refresh running at a time
+        db = SessionLocal()
+        try:
+            await asyncio.to_thread(submit_token_refresh_job, db)
+        except Exception as e:
+            print(f"🚨 Erro ao agendar a renovação periódica de tokens: {e}")
+        finally:
+            db.close()
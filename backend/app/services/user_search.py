@@ -0,0 +1,180 @@
+"""Busca de usuários por nome: exatos primeiro, depois prefixos, depois substrings.
+
+No PostgreSQL cada etapa é uma varredura de índice com LIMIT (ix_users_display_name_prefix
+e o GiST de trigramas da migração 0002); substrings vêm por similaridade. No SQLite
+(desenvolvimento e benchmarks) um índice de trigramas é mantido em memória por processo
+e as substrings vêm por ordem de cadastro.
+"""
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
+import bisect
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import User
+
+# Shorter queries have no trigram to look up, so they only match prefixes
+MIN_SUBSTRING_LENGTH = 3
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class UserSearchIndex:
+    """Nomes em minúsculas ordenados (prefixos por bisect) e ids por trigrama (substrings)"""
+
+    def __init__(self):
+        self._entries: List[Tuple[str, int]] = []
+        self._names = {}
+        # Posting lists stay sorted by id, so substring matches come out in signup order
+        self._postings = defaultdict(lambda: array("q"))
+        self.max_user_id = 0
+        self.built_at = self.refreshed_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, user_id: int, display_name: Optional[str]):
+        """Insere ou renomeia um usuário"""
+        self.remove(user_id)
+        self.max_user_id = max(self.max_user_id, user_id)
+        if not display_name:
+            return
+        key = display_name.lower()
+        self._names[user_id] = key
+        bisect.insort(self._entries, (key, user_id))
+        for gram in _trigrams(key):
+            posting = self._postings[gram]
+            if not posting or posting[-1] < user_id:
+                posting.append(user_id)
+            else:
+                posting.insert(bisect.bisect_left(posting, user_id), user_id)
+
+    def remove(self, user_id: int):
+        key = self._names.pop(user_id, None)
+        if key is None:
+            return
+        del self._entries[bisect.bisect_left(self._entries, (key, user_id))]
+        for gram in _trigrams(key):
+            posting = self._postings[gram]
+            del posting[bisect.bisect_left(posting, user_id)]
+
+    def extend(self, rows: Iterable[Tuple[int, Optional[str]]]):
+        """Acrescenta usuários novos (id, display_name) em ordem de id; ids já vistos são ignorados"""
+        rows = [(user_id, name) for user_id, name in rows if user_id > self.max_user_id]
+        if len(rows) < 64:
+            for user_id, name in rows:
+                self.add(user_id, name)
+            return
+        # Bulk load: ids only grow, so postings are appended in order and the names sorted once
+        for user_id, name in rows:
+            if name:
+                key = name.lower()
+                self._names[user_id] = key
+                self._entries.append((key, user_id))
+                for gram in _trigrams(key):
+                    self._postings[gram].append(user_id)
+        self._entries.sort()
+        self.max_user_id = rows[-1][0]
+
+    def search(self, needle: str, exclude_user_id: int, limit: int) -> List[int]:
+        """Ids em ordem de relevância; `needle` já em minúsculas"""
+        ids = []
+        start = bisect.bisect_left(self._entries, (needle,))
+        for key, user_id in self._entries[start:start + limit + 1]:
+            if not key.startswith(needle) or len(ids) == limit:
+                break
+            if user_id != exclude_user_id:
+                ids.append(user_id)
+
+        if len(ids) == limit or len(needle) < MIN_SUBSTRING_LENGTH:
+            return ids
+
+        postings = [self._postings.get(gram) for gram in _trigrams(needle)]
+        if not all(postings):
+            return ids
+        for user_id in min(postings, key=len):
+            key = self._names[user_id]
+            if needle in key and not key.startswith(needle) and user_id != exclude_user_id:
+                ids.append(user_id)
+                if len(ids) == limit:
+                    break
+        return ids
+
+_index: Optional[UserSearchIndex] = None
+# Names changed while a rebuild runs, replayed onto the new index: its rows may predate them
+_pending_renames: List[Dict[int, Optional[str]]] = []
+
+def index_user(user_id: int, display_name: Optional[str]):
+    """Atualiza o nome no índice deste processo (os outros pegam na próxima reconstrução)"""
+    for pending in _pending_renames:
+        pending[user_id] = display_name
+    # Users above max_user_id are loaded by the next search anyway
+    if _index is not None and user_id <= _index.max_user_id:
+        _index.add(user_id, display_name)
+
+async def _current_index(db: AsyncSession) -> UserSearchIndex:
+    global _index
+    index = _index
+    if index is None or time.monotonic() - index.built_at > settings.user_search_rebuild_minutes * 60:
+        pending: Dict[int, Optional[str]] = {}
+        _pending_renames.append(pending)
+        try:
+            rows = (await db.execute(select(User.id, User.display_name).order_by(User.id))).all()
+            fresh = UserSearchIndex()
+            # Searches keep using the old index while this one is built
+            await asyncio.to_thread(fresh.extend, rows)
+            for user_id, display_name in pending.items():
+                if user_id <= fresh.max_user_id:
+                    fresh.add(user_id, display_name)
+        finally:
+            _pending_renames.remove(pending)
+        _index = fresh
+        return fresh
+
+    if time.monotonic() - index.refreshed_at >= settings.user_search_refresh_seconds:
+        index.refreshed_at = time.monotonic()
+        rows = (await db.execute(
+            select(User.id, User.display_name).where(User.id > index.max_user_id).order_by(User.id)
+        )).all()
+        index.extend(rows)
+    return index
+
+async def _search_postgres(db: AsyncSession, needle: str, exclude_user_id: int, limit: int) -> List[User]:
+    name = func.lower(User.display_name)
+    by_bytes = name.collate("C")
+    prefix = f"{_escape_like(needle)}%"
+
+    users = list((await db.scalars(select(User).where(
+        by_bytes.like(prefix, escape="\\"),
+        User.id != exclude_user_id
+    ).order_by(by_bytes, User.id).limit(limit))).all())
+
+    if len(users) < limit and len(needle) >= MIN_SUBSTRING_LENGTH:
+        users += (await db.scalars(select(User).where(
+            name.like(f"%{_escape_like(needle)}%", escape="\\"),
+            ~by_bytes.like(prefix, escape="\\"),
+            User.id != exclude_user_id
+        ).order_by(name.op("<->")(needle), User.id).limit(limit - len(users)))).all()
+    return users
+
+async def search_users(db: AsyncSession, query: str, exclude_user_id: int, limit: int) -> List[User]:
+    """Usuários cujo nome contém `query` (sem diferenciar maiúsculas), exceto `exclude_user_id`"""
+    needle = query.strip().lower()
+    if not needle:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        return await _search_postgres(db, needle, exclude_user_id, limit)
+
+    ids = (await _current_index(db)).search(needle, exclude_user_id, limit)
+    if not ids:
+        return []
+    users = {user.id: user for user in (await db.scalars(select(User).where(User.id.in_(ids)))).all()}
+    return [users[user_id] for user_id in ids if user_id in users]
@@ -0,0 +1,46 @@
+"""Clientes spotipy do app.
+
+Fica fora de app.utils e app.metrics porque spotipy (e requests) pesam no import:
+só é carregado quando alguém de fato fala com o Spotify.
+"""
+import time
+
+import spotipy
+from spotipy.oauth2 import SpotifyOAuth
+
+from app.config import settings
+from app.metrics import record_spotify_call, spotify_endpoint
+
+class InstrumentedSpotify(spotipy.Spotify):
+    """Cliente spotipy que registra contagem e latência de cada chamada"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prefix = settings.spotify_api_base_url
+
+    def _internal_call(self, method, url, payload, params):
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return super()._internal_call(method, url, payload, params)
+        except spotipy.SpotifyException as e:
+            status = str(e.http_status)
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            record_spotify_call(f"{method} {spotify_endpoint(url)}", time.perf_counter() - started, status)
+
+def spotify_oauth(**kwargs) -> SpotifyOAuth:
+    """SpotifyOAuth com as credenciais do app, apontando para o servidor de contas configurado"""
+    oauth = SpotifyOAuth(
+        client_id=settings.spotify_client_id,
+        client_secret=settings.spotify_client_secret,
+        redirect_uri=settings.spotify_redirect_uri,
+        **kwargs
+    )
+    accounts_url = settings.spotify_accounts_base_url.rstrip("/")
+    oauth.OAUTH_AUTHORIZE_URL = f"{accounts_url}/authorize"
+    oauth.OAUTH_TOKEN_URL = f"{accounts_url}/api/token"
+    return oauth
@@ -1,18 +1,50 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-import spotipy
-from spotipy.exceptions import SpotifyException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.cache import MemoryCache
 from app.config import settings
-from app.database import get_db
+from app.database import get_db, open_read_session
 from app.models import User
 
+if TYPE_CHECKING:
+    import spotipy
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+@dataclass(frozen=True)
+class Principal:
+    """Usuário autenticado sem os tokens do Spotify (seguro para manter em cache)"""
+    id: int
+    spotify_id: str
+    display_name: Optional[str] = None
+    email: Optional[str] = None
+    country: Optional[str] = None
+    followers: Optional[int] = 0
+    image_url: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+PRINCIPAL_COLUMNS = (
+    User.id, User.spotify_id, User.display_name, User.email, User.country,
+    User.followers, User.image_url, User.created_at, User.updated_at
+)
+
+# Per process: invalidation only reaches this worker, the TTL bounds staleness elsewhere
+_principal_cache = MemoryCache(settings.principal_cache_max_entries)
+
+def invalidate_principal(user_id: int):
+    _principal_cache.delete(f"principal:{user_id}")
+
+def _cache_principal(principal: Principal) -> Principal:
+    _principal_cache.set(f"principal:{principal.id}", principal, settings.principal_cache_ttl_seconds)
+    return principal
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     # Use custom expiration or default from settings
@@ -35,36 +67,86 @@ def verify_token(token: str, credentials_exception):
     except JWTError:
         raise credentials_exception
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+def get_current_user_id(token: str = Depends(oauth2_scheme)) -> int:
+    """Só valida o JWT; não acessa o banco"""
+    credentials_exception = _credentials_exception()
     user_id = verify_token(token, credentials_exception)
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
+    try:
+        return int(user_id)
+    except ValueError:
         raise credentials_exception
+
+async def get_read_db(user_id: int = Depends(get_current_user_id)):
+    """Sessão para endpoints só de leitura: réplica em round-robin, ou o primário se o usuário escreveu há pouco"""
+    async with await open_read_session(user_id) as session:
+        yield session
+
+def get_admin_user_id(user_id: int = Depends(get_current_user_id)) -> int:
+    """Só deixa passar os usuários listados em ADMIN_USER_IDS"""
+    if user_id not in settings.admin_user_ids:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Acesso restrito a administradores"
+        )
+    return user_id
+
+async def get_current_principal(user_id: int = Depends(get_current_user_id), db: AsyncSession = Depends(get_db)) -> Principal:
+    """Usuário autenticado vindo do cache; só consulta o banco (sem os tokens) quando expira"""
+    principal = _principal_cache.get(f"principal:{user_id}")
+    if principal is not None:
+        return principal
+    
+    row = (await db.execute(select(*PRINCIPAL_COLUMNS).where(User.id == user_id))).first()
+    if row is None:
+        raise _credentials_exception()
+    return _cache_principal(Principal(*row))
+
+async def get_current_user(user_id: int = Depends(get_current_user_id), db: AsyncSession = Depends(get_db)):
+    """Linha completa do usuário (com tokens), para quem precisa falar com o Spotify"""
+    user = await db.get(User, user_id)
+    if user is None:
+        raise _credentials_exception()
+    _cache_principal(Principal(*(getattr(user, column.key) for column in PRINCIPAL_COLUMNS)))
     return user
 
-def get_spotify_client(user: User) -> spotipy.Spotify:
+def get_spotify_client(user: User) -> "spotipy.Spotify":
+    from app.services.tokens import TokenRefreshError, token_manager
+    from app.spotify import InstrumentedSpotify
+
     if not user.access_token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuário não autenticado com Spotify"
         )
     
-    # Check if token expired before creating client
+    # Tokens are renewed in the background before they expire; this only blocks if that failed
+    try:
+        token_manager.ensure_fresh(user)
+    except TokenRefreshError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token do Spotify expirado. Faça login novamente."
+        )
+    
     if user.token_expires_at and user.token_expires_at <= datetime.utcnow():
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token do Spotify expirado. Faça login novamente."
         )
     
-    return spotipy.Spotify(auth=user.access_token)
+    return InstrumentedSpotify(auth=user.access_token)
+
+def refresh_spotify_token(user: User, db: AsyncSession):
+    from app.services.tokens import TokenRefreshError, token_manager
+    from app.spotify import InstrumentedSpotify
 
-def refresh_spotify_token(user: User, db: Session):
     if not user.refresh_token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -72,22 +154,10 @@ def refresh_spotify_token(user: User, db: Session):
         )
     
     try:
-        from spotipy.oauth2 import SpotifyOAuth
-        sp_oauth = SpotifyOAuth(
-            client_id=settings.spotify_client_id,
-            client_secret=settings.spotify_client_secret,
-            redirect_uri=settings.spotify_redirect_uri
-        )
-        
-        token_info = sp_oauth.refresh_access_token(user.refresh_token)
-        user.access_token = token_info['access_token']
-        user.token_expires_at = datetime.utcnow() + timedelta(seconds=token_info['expires_in'])
-        db.commit()
-        
-        return spotipy.Spotify(auth=user.access_token)
-    except Exception as e:
+        token_manager.ensure_fresh(user, force=True)
+        return InstrumentedSpotify(auth=user.access_token)
+    except TokenRefreshError as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Erro ao atualizar token: {str(e)}"
         )
-
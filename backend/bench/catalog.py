@@ -0,0 +1,171 @@
+"""Catálogo sintético (músicas, artistas, gostos dos usuários) derivado apenas de uma semente.
+
+Compartilhado pelo gerador de dados, pelo cliente Spotify falso e pelo servidor falso,
+sem depender das settings nem do banco.
+"""
+from typing import Dict, List, Optional
+from datetime import datetime
+import json
+
+import numpy as np
+import pandas as pd
+
+from bench.scales import Scale
+
+# Plays are spread over the 180 days before a fixed date, so runs are comparable
+HISTORY_END = datetime(2025, 1, 1)
+HISTORY_DAYS = 180
+
+# Tracks only present in the features CSV: the fake Spotify client serves them as new plays
+UNSYNCED_TRACK_RATIO = 0.2
+
+UNIT_FEATURES = ["danceability", "energy", "speechiness", "acousticness", "instrumentalness", "liveness", "valence"]
+
+# Feature means (UNIT_FEATURES order), tempo and genres of each taste archetype
+ARCHETYPES = [
+    ([0.80, 0.85, 0.08, 0.10, 0.05, 0.20, 0.70], 124, ["dance pop", "edm", "house"]),
+    ([0.45, 0.90, 0.10, 0.05, 0.10, 0.30, 0.30], 150, ["metal", "hard rock", "metalcore"]),
+    ([0.50, 0.30, 0.05, 0.85, 0.10, 0.15, 0.45], 95, ["folk", "mpb", "acoustic pop"]),
+    ([0.35, 0.25, 0.04, 0.60, 0.80, 0.10, 0.25], 90, ["ambient", "classical", "lo-fi"]),
+    ([0.75, 0.65, 0.10, 0.20, 0.02, 0.20, 0.85], 118, ["pagode", "samba", "funk carioca"]),
+    ([0.40, 0.30, 0.05, 0.40, 0.05, 0.12, 0.20], 80, ["indie", "sad indie", "slowcore"]),
+    ([0.70, 0.60, 0.35, 0.15, 0.01, 0.25, 0.50], 96, ["hip hop", "trap", "rap"]),
+    ([0.62, 0.62, 0.06, 0.25, 0.02, 0.18, 0.55], 112, ["pop", "sertanejo", "pop rock"]),
+]
+
+CONTEXT_TYPES = ["playlist", "album", "artist", None]
+
+def spotify_id(prefix: str, index: int) -> str:
+    """Id de 22 caracteres alfanuméricos, como os do Spotify"""
+    return f"{prefix}{index:0{22 - len(prefix)}d}"
+
+def user_spotify_id(index: int) -> str:
+    return spotify_id("bu", index)
+
+def track_spotify_id(index: int) -> str:
+    return spotify_id("bt", index)
+
+def artist_spotify_id(index: int) -> str:
+    return spotify_id("ba", index)
+
+# Tokens carry the user index so the fake Spotify server knows who is calling
+def access_token_for(index: int, generation: int = 0) -> str:
+    return f"bench-access-{index}-{generation}"
+
+def refresh_token_for(index: int) -> str:
+    return f"bench-refresh-{index}"
+
+def user_index_from_token(token: str) -> Optional[int]:
+    parts = token.split("-")
+    if len(parts) < 3 or parts[0] != "bench" or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+class SyntheticCatalog:
+    """Catálogo de músicas e artistas derivado apenas da semente (também usado pelo Spotify falso)"""
+
+    def __init__(self, scale: Scale, seed: int = 42):
+        self.scale = scale
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        n_archetypes = len(ARCHETYPES)
+
+        self.n_tracks = scale.tracks + int(scale.tracks * UNSYNCED_TRACK_RATIO)
+        self.track_archetype = rng.integers(0, n_archetypes, self.n_tracks)
+
+        means = np.array([a[0] for a in ARCHETYPES])[self.track_archetype]
+        self.unit_features = np.clip(means + rng.normal(0, 0.12, means.shape), 0.0, 1.0)
+        self.tempo = np.clip(np.array([a[1] for a in ARCHETYPES])[self.track_archetype] + rng.normal(0, 12, self.n_tracks), 60, 200)
+        self.loudness = np.clip(-4 - 10 * self.unit_features[:, UNIT_FEATURES.index("acousticness")] + rng.normal(0, 2, self.n_tracks), -30, 0)
+        self.key = rng.integers(0, 12, self.n_tracks)
+        self.mode = rng.integers(0, 2, self.n_tracks)
+        self.time_signature = rng.choice([3, 4, 4, 4, 4], self.n_tracks)
+        self.duration_ms = rng.integers(120_000, 360_000, self.n_tracks)
+        self.popularity = rng.integers(0, 100, self.n_tracks)
+
+        # Artists share their archetype with their tracks; some tracks have a featured artist
+        self.artist_archetype = np.arange(scale.artists) % n_archetypes
+        per_archetype = max(scale.artists // n_archetypes, 1)
+        self.track_artist = np.minimum(
+            self.track_archetype + n_archetypes * rng.integers(0, per_archetype, self.n_tracks), scale.artists - 1
+        )
+        has_feature = rng.random(self.n_tracks) < 0.2
+        self.track_featured_artist = np.where(has_feature, rng.integers(0, scale.artists, self.n_tracks), -1)
+        self.artist_genres = [
+            sorted(rng.choice(ARCHETYPES[a][2], size=rng.integers(1, 3), replace=False).tolist())
+            for a in self.artist_archetype
+        ]
+
+        # Popular tracks first inside each archetype, for skewed sampling
+        self._synced_by_archetype = [
+            np.flatnonzero(self.track_archetype[:scale.tracks] == a) for a in range(n_archetypes)
+        ]
+        self._unsynced_by_archetype = [
+            scale.tracks + np.flatnonzero(self.track_archetype[scale.tracks:] == a) for a in range(n_archetypes)
+        ]
+
+    def artist_ids_of(self, track: int) -> List[int]:
+        featured = int(self.track_featured_artist[track])
+        main = int(self.track_artist[track])
+        return [main] if featured < 0 or featured == main else [main, featured]
+
+    def sample_tracks(self, rng: np.random.Generator, archetypes: np.ndarray, synced: bool = True) -> np.ndarray:
+        """Uma música por arquétipo pedido, com viés para as primeiras (as mais tocadas)"""
+        pools = self._synced_by_archetype if synced else self._unsynced_by_archetype
+        result = np.empty(len(archetypes), dtype=np.int64)
+        for a, pool in enumerate(pools):
+            mask = archetypes == a
+            if not mask.any():
+                continue
+            if not len(pool):
+                pool = self._synced_by_archetype[a] if len(self._synced_by_archetype[a]) else np.arange(self.scale.tracks)
+            result[mask] = pool[(rng.random(mask.sum()) ** 2 * len(pool)).astype(np.int64)]
+        return result
+
+    def user_archetypes(self, users: np.ndarray) -> np.ndarray:
+        """Arquétipos principal e secundário de cada usuário (determinísticos por índice)"""
+        n = len(ARCHETYPES)
+        primary = (users * 2654435761 + self.seed) % n
+        secondary = (primary + 1 + (users * 40503) % (n - 1)) % n
+        return np.stack([primary, secondary], axis=1)
+
+    def sample_plays(self, rng: np.random.Generator, users: np.ndarray, plays_per_user: int, synced: bool = True) -> np.ndarray:
+        """Músicas tocadas por cada usuário: 70% do arquétipo principal, 20% do secundário, 10% qualquer"""
+        tastes = np.repeat(self.user_archetypes(users), plays_per_user, axis=0)
+        roll = rng.random(len(tastes))
+        archetypes = np.where(
+            roll < 0.7, tastes[:, 0],
+            np.where(roll < 0.9, tastes[:, 1], rng.integers(0, len(ARCHETYPES), len(tastes)))
+        )
+        return self.sample_tracks(rng, archetypes, synced)
+
+    def track_row(self, track: int) -> Dict:
+        artists = self.artist_ids_of(track)
+        features = dict(zip(UNIT_FEATURES, self.unit_features[track].tolist()))
+        return {
+            "spotify_id": track_spotify_id(track),
+            "name": f"Bench Track {track}",
+            "artists": ",".join(f"Bench Artist {a}" for a in artists),
+            "artist_ids": ",".join(artist_spotify_id(a) for a in artists),
+            "album": f"Bench Album {track // 10}",
+            "duration_ms": int(self.duration_ms[track]),
+            "popularity": int(self.popularity[track]),
+            "explicit": False,
+            "external_urls": json.dumps({"spotify": f"https://open.spotify.com/track/{track_spotify_id(track)}"}),
+            "key": int(self.key[track]),
+            "loudness": float(self.loudness[track]),
+            "mode": int(self.mode[track]),
+            "tempo": float(self.tempo[track]),
+            "time_signature": int(self.time_signature[track]),
+            **features
+        }
+
+    def features_frame(self) -> pd.DataFrame:
+        frame = pd.DataFrame(self.unit_features, columns=UNIT_FEATURES)
+        frame.insert(0, "track_id", [track_spotify_id(i) for i in range(self.n_tracks)])
+        frame["key"] = self.key
+        frame["loudness"] = self.loudness
+        frame["mode"] = self.mode
+        frame["tempo"] = self.tempo
+        frame["time_signature"] = self.time_signature
+        return frame
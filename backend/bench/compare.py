@@ -0,0 +1,61 @@
+"""Compara dois resultados de ``bench.run`` e falha se houver regressões.
+
+Uso: python -m bench.compare bench/results/antes.json bench/results/depois.json [--threshold 0.2]
+"""
+from typing import Any, Dict, List
+import argparse
+import json
+import sys
+
+def load(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path) as f:
+        return {result["name"]: result for result in json.load(f)["results"]}
+
+def compare(baseline: Dict[str, Dict[str, Any]], current: Dict[str, Dict[str, Any]], threshold: float = 0.2, min_delta_ms: float = 1.0) -> List[Dict[str, Any]]:
+    """Uma linha por benchmark presente nos dois arquivos; ``regression`` marca as que pioraram"""
+    rows = []
+    for name in sorted(set(baseline) & set(current)):
+        before, after = baseline[name], current[name]
+        delta_ms = after["median_ms"] - before["median_ms"]
+        ratio = after["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        # Tiny absolute differences are noise, whatever the ratio
+        slower = ratio > 1 + threshold and delta_ms > min_delta_ms
+        more_queries = after["queries"] > before["queries"]
+        rows.append({
+            "name": name,
+            "before_ms": before["median_ms"],
+            "after_ms": after["median_ms"],
+            "ratio": ratio,
+            "before_queries": before["queries"],
+            "after_queries": after["queries"],
+            "regression": slower or more_queries
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara duas execuções de benchmark")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.2, help="piora relativa da mediana tolerada (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    baseline, current = load(args.baseline), load(args.current)
+    rows = compare(baseline, current, args.threshold, args.min_delta_ms)
+    for row in rows:
+        marker = "❌" if row["regression"] else "  "
+        print(
+            f"{marker} {row['name']:<45} {row['before_ms']:>9.1f}ms -> {row['after_ms']:>9.1f}ms "
+            f"({row['ratio']:.2f}x)  queries {row['before_queries']:.0f} -> {row['after_queries']:.0f}"
+        )
+    for name in sorted(set(baseline) ^ set(current)):
+        print(f"   {name}: presente em apenas um dos arquivos")
+
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"🚨 {len(regressions)} regressões")
+        sys.exit(1)
+    print("✅ Sem regressões")
+
+if __name__ == "__main__":
+    main()
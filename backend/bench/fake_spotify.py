@@ -0,0 +1,132 @@
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+import time
+
+import numpy as np
+
+from bench.catalog import HISTORY_END, UNIT_FEATURES, SyntheticCatalog, artist_spotify_id, user_spotify_id
+
+AUDIO_FEATURES = UNIT_FEATURES + ["key", "loudness", "mode", "tempo", "time_signature"]
+
+class FakeSpotifyClient:
+    """Substitui o cliente spotipy nos benchmarks, respondendo a partir do catálogo sintético.
+
+    Cada chamada a ``current_user_recently_played`` devolve execuções novas (posteriores
+    às anteriores), com parte das músicas ainda fora da tabela tracks.
+    """
+
+    def __init__(self, catalog: SyntheticCatalog, user_index: int, seed: int = 0, new_track_ratio: float = 0.3, latency_ms: float = 0.0):
+        self.catalog = catalog
+        self.user_index = user_index
+        self.rng = np.random.default_rng([catalog.seed, user_index, seed])
+        self.new_track_ratio = new_track_ratio
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self._next_played_at = HISTORY_END + timedelta(days=1 + seed)
+
+    def _call(self):
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def _track(self, track: int) -> Dict[str, Any]:
+        row = self.catalog.track_row(track)
+        return {
+            "id": row["spotify_id"],
+            "name": row["name"],
+            "artists": [
+                {"id": artist_spotify_id(a), "name": f"Bench Artist {a}"} for a in self.catalog.artist_ids_of(track)
+            ],
+            "album": {"name": row["album"]},
+            "duration_ms": row["duration_ms"],
+            "popularity": row["popularity"],
+            "explicit": row["explicit"],
+            "preview_url": None,
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{row['spotify_id']}"}
+        }
+
+    def _artist(self, artist: int) -> Dict[str, Any]:
+        return {
+            "id": artist_spotify_id(artist),
+            "name": f"Bench Artist {artist}",
+            "genres": self.catalog.artist_genres[artist],
+            "popularity": int(artist % 100),
+            "followers": {"total": int(artist * 37 % 100_000)},
+            "images": [],
+            "external_urls": {"spotify": f"https://open.spotify.com/artist/{artist_spotify_id(artist)}"}
+        }
+
+    def _sample(self, n: int, synced: bool = True) -> List[int]:
+        return self.catalog.sample_plays(self.rng, np.array([self.user_index]), n, synced).tolist()
+
+    def current_user(self) -> Dict[str, Any]:
+        self._call()
+        return {
+            "id": user_spotify_id(self.user_index),
+            "display_name": f"Bench User {self.user_index}",
+            "email": f"bench{self.user_index}@example.com",
+            "country": "BR",
+            "followers": {"total": self.user_index % 500},
+            "images": []
+        }
+
+    def current_user_recently_played(self, limit: int = 50, **kwargs) -> Dict[str, Any]:
+        self._call()
+        n_new = int(round(limit * self.new_track_ratio))
+        tracks = self._sample(limit - n_new) + self._sample(n_new, synced=False)
+        self.rng.shuffle(tracks)
+        items = []
+        for track in tracks:
+            self._next_played_at += timedelta(minutes=int(self.rng.integers(2, 6)))
+            items.append({
+                "track": self._track(track),
+                "played_at": self._next_played_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "context": {"type": "playlist", "name": "Bench Playlist"}
+            })
+        # Spotify lists the most recent play first
+        return {"items": items[::-1]}
+
+    def current_user_top_tracks(self, limit: int = 20, offset: int = 0, time_range: str = "medium_term") -> Dict[str, Any]:
+        self._call()
+        tracks = list(dict.fromkeys(self._sample(4 * (limit + offset))))[offset:offset + limit]
+        return {"items": [self._track(t) for t in tracks], "total": len(tracks)}
+
+    def current_user_top_artists(self, limit: int = 20, offset: int = 0, time_range: str = "medium_term") -> Dict[str, Any]:
+        self._call()
+        artists = list(dict.fromkeys(
+            self.catalog.artist_ids_of(t)[0] for t in self._sample(4 * (limit + offset))
+        ))[offset:offset + limit]
+        return {"items": [self._artist(a) for a in artists], "total": len(artists)}
+
+    def artists(self, artists: List[str]) -> Dict[str, Any]:
+        self._call()
+        found = []
+        for spotify_id in artists:
+            index = int(spotify_id[2:]) if spotify_id.startswith("ba") and spotify_id[2:].isdigit() else None
+            found.append(self._artist(index) if index is not None and index < self.catalog.scale.artists else None)
+        return {"artists": found}
+
+
+    def tracks(self, tracks: List[str], market: Optional[str] = None) -> Dict[str, Any]:
+        self._call()
+        found = []
+        for spotify_id in tracks:
+            index = int(spotify_id[2:]) if spotify_id.startswith("bt") and spotify_id[2:].isdigit() else None
+            found.append(self._track(index) if index is not None and index < self.catalog.n_tracks else None)
+        return {"tracks": found}
+
+    def audio_features(self, tracks: List[str]) -> List[Optional[Dict[str, Any]]]:
+        self._call()
+        found = []
+        for spotify_id in tracks:
+            index = int(spotify_id[2:]) if spotify_id.startswith("bt") and spotify_id[2:].isdigit() else None
+            if index is None or index >= self.catalog.n_tracks:
+                found.append(None)
+                continue
+            row = self.catalog.track_row(index)
+            found.append({
+                "id": spotify_id,
+                "duration_ms": row["duration_ms"],
+                **{name: row[name] for name in AUDIO_FEATURES}
+            })
+        return found
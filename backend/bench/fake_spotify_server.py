@@ -0,0 +1,164 @@
+"""Servidor falso da Web API do Spotify para testes de carga.
+
+Uso (a partir de backend/):
+
+    python -m bench.fake_spotify_server --port 8090 --scale 1k --latency-ms 80 --rate-limit 0.01
+
+e no backend: SPOTIFY_API_BASE_URL=http://localhost:8090/v1/ e
+SPOTIFY_ACCOUNTS_BASE_URL=http://localhost:8090. Os tokens são os gerados por
+bench.synthetic (``bench-access-<usuário>-<n>``); as respostas vêm do mesmo
+catálogo sintético.
+"""
+from dataclasses import dataclass, fields
+from typing import Dict, Optional
+import argparse
+import asyncio
+import itertools
+import os
+import random
+
+from fastapi import FastAPI, Form, Request
+from fastapi.responses import JSONResponse
+
+from bench.catalog import SyntheticCatalog, access_token_for, user_index_from_token
+from bench.fake_spotify import FakeSpotifyClient
+from bench.scales import SCALES
+
+@dataclass
+class FakeSpotifyConfig:
+    scale: str = "1k"
+    seed: int = 42
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    rate_limit: float = 0.0  # fraction of API calls answered with 429
+    retry_after_seconds: int = 1
+    token_expires_in: int = 3600
+
+    @classmethod
+    def from_env(cls) -> "FakeSpotifyConfig":
+        """Lê FAKE_SPOTIFY_<CAMPO> do ambiente"""
+        values = {}
+        for field in fields(cls):
+            raw = os.environ.get(f"FAKE_SPOTIFY_{field.name.upper()}")
+            if raw is not None:
+                values[field.name] = type(field.default)(raw)
+        return cls(**values)
+
+    def to_env(self) -> Dict[str, str]:
+        return {f"FAKE_SPOTIFY_{field.name.upper()}": str(getattr(self, field.name)) for field in fields(self)}
+
+def _error(status_code: int, message: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse({"error": {"status": status_code, "message": message}}, status_code=status_code, headers=headers)
+
+def create_app(config: FakeSpotifyConfig) -> FastAPI:
+    catalog = SyntheticCatalog(SCALES[config.scale], config.seed)
+    clients: Dict[int, FakeSpotifyClient] = {}
+    token_generations = itertools.count(1)
+    rng = random.Random(config.seed)
+    stats = {"requests": 0, "rate_limited": 0, "token_refreshes": 0}
+
+    app = FastAPI(title="Fake Spotify Web API")
+
+    @app.middleware("http")
+    async def simulate_network(request: Request, call_next):
+        stats["requests"] += 1
+        if request.url.path.startswith("/v1/"):
+            if config.rate_limit and rng.random() < config.rate_limit:
+                stats["rate_limited"] += 1
+                return _error(429, "API rate limit exceeded", {"Retry-After": str(config.retry_after_seconds)})
+            if _user_index(request) is None:
+                return _error(401, "Invalid access token")
+        delay = config.latency_ms + (rng.uniform(-config.jitter_ms, config.jitter_ms) if config.jitter_ms else 0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        return await call_next(request)
+
+    def _user_index(request: Request) -> Optional[int]:
+        auth = request.headers.get("authorization", "")
+        return user_index_from_token(auth[7:]) if auth.startswith("Bearer ") else None
+
+    def client_for(request: Request) -> FakeSpotifyClient:
+        index = _user_index(request)
+        if index not in clients:
+            clients[index] = FakeSpotifyClient(catalog, index, seed=config.seed)
+        return clients[index]
+
+    @app.get("/v1/me")
+    async def current_user(request: Request):
+        return client_for(request).current_user()
+
+    @app.get("/v1/me/player/recently-played")
+    async def recently_played(request: Request, limit: int = 50):
+        return client_for(request).current_user_recently_played(limit=limit)
+
+    @app.get("/v1/me/top/tracks")
+    async def top_tracks(request: Request, limit: int = 20, offset: int = 0, time_range: str = "medium_term"):
+        return client_for(request).current_user_top_tracks(limit=limit, offset=offset, time_range=time_range)
+
+    @app.get("/v1/me/top/artists")
+    async def top_artists(request: Request, limit: int = 20, offset: int = 0, time_range: str = "medium_term"):
+        return client_for(request).current_user_top_artists(limit=limit, offset=offset, time_range=time_range)
+
+    @app.get("/v1/artists")
+    async def artists(request: Request, ids: str):
+        return client_for(request).artists(ids.split(","))
+
+    @app.get("/v1/tracks")
+    async def tracks(request: Request, ids: str):
+        return client_for(request).tracks(ids.split(","))
+
+    @app.get("/v1/audio-features")
+    async def audio_features(request: Request, ids: str):
+        return {"audio_features": client_for(request).audio_features(ids.split(","))}
+
+    @app.post("/api/token")
+    async def token(grant_type: str = Form(...), refresh_token: Optional[str] = Form(None), code: Optional[str] = Form(None)):
+        # Refresh tokens look like bench-refresh-<index>; authorization codes are the bare index
+        if grant_type == "refresh_token" and refresh_token and refresh_token.startswith("bench-refresh-"):
+            index = refresh_token.rsplit("-", 1)[-1]
+        elif grant_type == "authorization_code" and code:
+            index = code
+        else:
+            return JSONResponse({"error": "invalid_grant"}, status_code=400)
+        if not index.isdigit():
+            return JSONResponse({"error": "invalid_grant"}, status_code=400)
+
+        stats["token_refreshes"] += 1
+        return {
+            "access_token": access_token_for(int(index), next(token_generations)),
+            "token_type": "Bearer",
+            "expires_in": config.token_expires_in,
+            "refresh_token": f"bench-refresh-{index}",
+            "scope": "user-read-recently-played user-top-read user-read-private user-read-email"
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        return {**stats, "users": len(clients)}
+
+    return app
+
+def app_from_env() -> FastAPI:
+    """Fábrica para ``uvicorn bench.fake_spotify_server:app_from_env --factory``"""
+    return create_app(FakeSpotifyConfig.from_env())
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Servidor falso da Web API do Spotify")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="1k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fração das chamadas respondidas com 429")
+    parser.add_argument("--retry-after-seconds", type=int, default=1)
+    parser.add_argument("--token-expires-in", type=int, default=3600)
+    args = parser.parse_args()
+
+    config = FakeSpotifyConfig(**{field.name: getattr(args, field.name) for field in fields(FakeSpotifyConfig)})
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Teste de carga do POST /users/me/sync contra o servidor falso do Spotify.
+
+Uso (a partir de backend/, com o banco gerado por bench.synthetic e DATABASE_URL/SECRET_KEY no ambiente):
+
+    python -m bench.synthetic --scale 10k --database-url $DATABASE_URL --reset
+    python -m bench.load_sync --spawn --users 2000 --concurrency 500 --latency-ms 80 --rate-limit 0.01
+
+Com --spawn o driver sobe o servidor falso e a API (uvicorn) apontada para ele; sem
+--spawn, use --api-url e --fake-url de servidores já rodando. Relata vazão, latências
+(p50/p99) e comandos SQL por sincronização (lidos do /metrics da API).
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench.run import summarize
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_SAMPLE = re.compile(r"^(\w+)(\{[^}]*\})? ([0-9.eE+-]+)$")
+
+def metric_totals(text: str, names: List[str]) -> Dict[str, float]:
+    """Soma as séries de cada métrica no formato de exposição do /metrics"""
+    totals = {name: 0.0 for name in names}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match and match.group(1) in totals:
+            totals[match.group(1)] += float(match.group(3))
+    return totals
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+def _wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Processo encerrou antes de responder em {url}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Tempo esgotado esperando {url}")
+
+@contextmanager
+def spawned_servers(args) -> Iterator[None]:
+    """Sobe o servidor falso e a API como subprocessos uvicorn"""
+    from bench.fake_spotify_server import FakeSpotifyConfig
+
+    config = FakeSpotifyConfig(
+        scale=args.scale, seed=args.seed, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        rate_limit=args.rate_limit, retry_after_seconds=args.retry_after_seconds
+    )
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    processes = []
+    try:
+        fake = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "bench.fake_spotify_server:app_from_env", "--factory",
+             "--port", str(args.fake_port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env={**os.environ, **config.to_env()}
+        )
+        processes.append(fake)
+        _wait_until_ready(f"{fake_url}/stats", fake)
+
+        api = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.api_port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env={
+                **os.environ,
+                "SPOTIFY_API_BASE_URL": f"{fake_url}/v1/",
+                "SPOTIFY_ACCOUNTS_BASE_URL": fake_url,
+                "CLUSTERING_REFRESH_INTERVAL_MINUTES": "0",
+                "WEB_CONCURRENCY": str(args.workers)
+            }
+        )
+        processes.append(api)
+        _wait_until_ready(f"http://127.0.0.1:{args.api_port}/health", api)
+        args.api_url, args.fake_url = f"http://127.0.0.1:{args.api_port}", fake_url
+        yield
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+def load_users(limit: int, expire_tokens: bool) -> List[int]:
+    """Ids dos usuários sintéticos; com expire_tokens, força a renovação no primeiro sync"""
+    from app.database import SessionLocal
+    from app.models import User
+
+    db = SessionLocal()
+    try:
+        user_ids = [
+            user_id for (user_id,) in db.query(User.id).filter(User.spotify_id.like("bu%")).order_by(User.id).limit(limit)
+        ]
+        if expire_tokens and user_ids:
+            db.query(User).filter(User.id.in_(user_ids)).update(
+                {User.token_expires_at: datetime.utcnow() - timedelta(minutes=1)}, synchronize_session=False
+            )
+            db.commit()
+        return user_ids
+    finally:
+        db.close()
+
+async def run_load(api_url: str, user_ids: List[int], syncs_per_user: int, concurrency: int, timeout: float) -> Dict:
+    from app.utils import create_access_token
+
+    tokens = {user_id: create_access_token({"sub": str(user_id)}) for user_id in user_ids}
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    async with httpx.AsyncClient(
+        base_url=api_url, timeout=timeout, limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    ) as client:
+        async def sync(user_id: int):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/users/me/sync", headers={"Authorization": f"Bearer {tokens[user_id]}"})
+                    outcome = str(response.status_code)
+                except httpx.HTTPError as e:
+                    outcome = type(e).__name__
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[outcome] = statuses.get(outcome, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sync(user_id) for _ in range(syncs_per_user) for user_id in user_ids))
+        elapsed = time.perf_counter() - started
+
+    return {"latencies_ms": latencies, "statuses": statuses, "elapsed_seconds": elapsed}
+
+def main():
+    from bench.scales import SCALES
+
+    parser = argparse.ArgumentParser(description="Teste de carga do sync contra o Spotify falso")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--syncs-per-user", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--expire-tokens", action="store_true", help="marca os tokens como vencidos para exercitar a renovação")
+    parser.add_argument("--api-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--fake-url", help="servidor falso, para ler /stats (opcional sem --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="sobe o servidor falso e a API automaticamente")
+    parser.add_argument("--api-port", type=int, default=8000)
+    parser.add_argument("--fake-port", type=int, default=8090)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="1k", help="catálogo do servidor falso (igual ao do banco)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--retry-after-seconds", type=int, default=1)
+    parser.add_argument("--output", help="JSON no formato do bench.run, comparável com bench.compare")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        print("⚠️ Com mais de um worker, o /metrics reflete só o processo que responder; os comandos SQL ficam subestimados")
+
+    user_ids = load_users(args.users, args.expire_tokens)
+    if not user_ids:
+        parser.error("Nenhum usuário sintético no banco; rode bench.synthetic antes")
+
+    metric_names = ["db_statements_total", "spotify_requests_total"]
+    with (spawned_servers(args) if args.spawn else _no_servers()):
+        before = metric_totals(httpx.get(f"{args.api_url}/metrics").text, metric_names)
+        outcome = asyncio.run(run_load(args.api_url, user_ids, args.syncs_per_user, args.concurrency, args.timeout))
+        after = metric_totals(httpx.get(f"{args.api_url}/metrics").text, metric_names)
+        fake_stats = httpx.get(f"{args.fake_url}/stats").json() if args.fake_url else None
+
+    latencies = sorted(outcome["latencies_ms"])
+    total = len(latencies)
+    succeeded = outcome["statuses"].get("200", 0)
+    statements = after["db_statements_total"] - before["db_statements_total"]
+    spotify_calls = after["spotify_requests_total"] - before["spotify_requests_total"]
+    result = summarize(
+        "POST /users/me/sync", "load", latencies, [statements / max(total, 1)],
+        p50_ms=percentile(latencies, 0.50),
+        p99_ms=percentile(latencies, 0.99),
+        throughput_rps=total / outcome["elapsed_seconds"],
+        succeeded=succeeded,
+        statuses=outcome["statuses"],
+        spotify_calls_per_sync=spotify_calls / max(total, 1)
+    )
+
+    print(f"🚀 {total} syncs ({succeeded} ok) em {outcome['elapsed_seconds']:.1f}s: {result['throughput_rps']:.1f} req/s")
+    print(f"⏱️ p50 {result['p50_ms']:.0f}ms, p99 {result['p99_ms']:.0f}ms, máx {result['max_ms']:.0f}ms")
+    print(f"🗄️ {result['queries']:.1f} comandos SQL e {result['spotify_calls_per_sync']:.1f} chamadas ao Spotify por sync")
+    print(f"📊 Status: {outcome['statuses']}")
+    if fake_stats:
+        print(f"🎧 Spotify falso: {fake_stats}")
+
+    if args.output:
+        report = {
+            "meta": {
+                "users": len(user_ids),
+                "syncs_per_user": args.syncs_per_user,
+                "concurrency": args.concurrency,
+                "workers": args.workers,
+                "latency_ms": args.latency_ms,
+                "rate_limit": args.rate_limit,
+                "expire_tokens": args.expire_tokens,
+                "fake_spotify": fake_stats,
+                "created_at": datetime.utcnow().isoformat() + "Z"
+            },
+            "results": [result]
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Resultados salvos em {args.output}")
+
+@contextmanager
+def _no_servers() -> Iterator[None]:
+    yield
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+from dataclasses import dataclass
+from typing import Dict
+
+@dataclass(frozen=True)
+class Scale:
+    users: int
+    tracks: int
+    artists: int
+    plays_per_user: int = 50
+
+# Named after the number of users
+SCALES: Dict[str, Scale] = {
+    "1k": Scale(users=1_000, tracks=10_000, artists=2_000),
+    "10k": Scale(users=10_000, tracks=50_000, artists=10_000),
+    "100k": Scale(users=100_000, tracks=200_000, artists=40_000),
+}
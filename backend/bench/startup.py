@@ -0,0 +1,83 @@
+"""Tempo de cold start: import do app e boot de um worker uvicorn até o /health responder.
+
+Uso (a partir de backend/, com DATABASE_URL/SECRET_KEY no ambiente):
+
+    python -m bench.startup --repeat 5 --output bench/results/startup.json
+
+Cada medida roda num processo novo. Também lista quais módulos pesados (pandas,
+scikit-learn, spotipy) o import do app carregou, que deveriam ser nenhum.
+"""
+from datetime import datetime
+from typing import Dict, List
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from bench.load_sync import BACKEND_DIR, _wait_until_ready
+from bench.run import summarize
+
+HEAVY_MODULES = ["pandas", "sklearn", "scipy", "joblib", "spotipy", "requests"]
+
+_IMPORT_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import app.main
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "heavy": [name for name in {HEAVY_MODULES!r} if name in sys.modules]
+}}))
+"""
+
+def measure_import() -> Dict:
+    output = subprocess.run(
+        [sys.executable, "-c", _IMPORT_PROBE], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure_boot(port: int) -> float:
+    """Segundos entre iniciar o uvicorn e o primeiro /health respondido"""
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "CLUSTERING_REFRESH_INTERVAL_MINUTES": "0", "SPOTIFY_TOKEN_REFRESH_INTERVAL_SECONDS": "0"},
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        _wait_until_ready(f"http://127.0.0.1:{port}/health", process)
+        return time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o cold start do app")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="JSON no formato do bench.run, comparável com bench.compare")
+    args = parser.parse_args()
+
+    imports: List[Dict] = [measure_import() for _ in range(args.repeat)]
+    boots = [measure_boot(args.port) for _ in range(args.repeat)]
+    heavy = sorted({name for run in imports for name in run["heavy"]})
+
+    results = [
+        summarize("import app.main", "startup", [run["seconds"] * 1000 for run in imports], [0], heavy_modules=heavy),
+        summarize("uvicorn boot até /health", "startup", [seconds * 1000 for seconds in boots], [0])
+    ]
+    for result in results:
+        print(f"⏱️ {result['name']}: mediana {result['median_ms']:.0f}ms, máx {result['max_ms']:.0f}ms")
+    if heavy:
+        print(f"⚠️ Módulos pesados carregados no import: {', '.join(heavy)}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"meta": {"repeat": args.repeat, "created_at": datetime.utcnow().isoformat() + "Z"}, "results": results}, f, indent=2)
+        print(f"✅ Resultados salvos em {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Gerador determinístico de dados sintéticos para benchmarks.
+
+Uso (a partir de backend/):
+
+    python -m bench.synthetic --scale 1k --database-url sqlite:///bench/data/bench-1k.db --reset
+
+Preenche usuários, artistas, músicas, histórico de execuções (e seus agregados) e perfis, e escreve o
+CSV de audio features no formato lido por ``get_tracks_dataset``. A mesma semente
+gera sempre os mesmos dados.
+"""
+from collections import Counter
+from dataclasses import asdict
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from app.database import Base
+from app.models import Artist, ListeningHistory, Track, User, UserProfile
+from app.services.clustering import FEATURE_COLUMNS
+from app.services.personas import persona_labels
+from app.services.rollups import ListeningRollupService
+from bench.catalog import (
+    CONTEXT_TYPES, HISTORY_DAYS, HISTORY_END, UNIT_FEATURES, SyntheticCatalog,
+    access_token_for, artist_spotify_id, refresh_token_for, track_spotify_id, user_spotify_id
+)
+from bench.scales import SCALES, Scale
+
+def _insert_batches(conn, table, rows: List[Dict], batch_size: int):
+    for start in range(0, len(rows), batch_size):
+        conn.execute(insert(table), rows[start:start + batch_size])
+
+def _profile_rows(catalog: SyntheticCatalog, user_ids: np.ndarray, play_users: np.ndarray, play_tracks: np.ndarray) -> List[Dict]:
+    """Perfis calculados como o AnalysisService faz (médias sobre as músicas distintas de cada usuário)"""
+    # Rows of play_users index into user_ids
+    distinct = np.unique(np.stack([play_users, play_tracks], axis=1), axis=0)
+    counts = np.bincount(distinct[:, 0], minlength=len(user_ids)).astype(float)
+    counts[counts == 0] = 1
+
+    def mean_of(values: np.ndarray) -> np.ndarray:
+        return np.bincount(distinct[:, 0], weights=values[distinct[:, 1]], minlength=len(user_ids)) / counts
+
+    averages = {f"avg_{name}": mean_of(catalog.unit_features[:, i]) for i, name in enumerate(UNIT_FEATURES)}
+    averages["avg_tempo"] = mean_of(catalog.tempo)
+    avg_duration = mean_of(catalog.duration_ms.astype(float))
+    personas = persona_labels(np.column_stack([averages[col] for col in FEATURE_COLUMNS]))
+
+    order = np.argsort(play_users, kind="stable")
+    boundaries = np.searchsorted(play_users[order], np.arange(len(user_ids) + 1))
+    rows = []
+    for i, user_id in enumerate(user_ids.tolist()):
+        tracks = play_tracks[order[boundaries[i]:boundaries[i + 1]]].tolist()
+        track_counts = Counter(tracks)
+        artist_counts = Counter()
+        genre_counts = Counter()
+        for track, n in track_counts.items():
+            for artist in catalog.artist_ids_of(track):
+                artist_counts[f"Bench Artist {artist}"] += n
+                genre_counts.update({g: n for g in catalog.artist_genres[artist]})
+        rows.append({
+            "user_id": user_id,
+            "top_genres": json.dumps([g for g, _ in genre_counts.most_common(10)]),
+            "top_artists": json.dumps([{"name": a, "play_count": c} for a, c in artist_counts.most_common(20)]),
+            "top_tracks": json.dumps([
+                {"id": track_spotify_id(t), "name": f"Bench Track {t}", "artists": catalog.track_row(t)["artists"], "play_count": c}
+                for t, c in track_counts.most_common(20)
+            ]),
+            **{col: float(values[i]) for col, values in averages.items()},
+            "version": 1,
+            "total_tracks_played": len(tracks),
+            "unique_artists": len(artist_counts),
+            "unique_genres": min(len(genre_counts), 10),
+            "avg_session_duration": float(avg_duration[i]),
+            "pending_cluster_fit": True,
+            "music_persona": str(personas[i])
+        })
+    return rows
+
+def generate(
+    database_url: str,
+    scale: Scale,
+    seed: int = 42,
+    features_path: Optional[str] = None,
+    reset: bool = False,
+    batch_size: int = 10_000
+) -> Dict[str, int]:
+    """Preenche o banco indicado e retorna quantas linhas foram criadas por tabela"""
+    engine = create_engine(database_url)
+    if reset:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    with engine.connect() as conn:
+        if conn.execute(select(func.count(User.id))).scalar():
+            raise RuntimeError("O banco já tem usuários; use reset=True (--reset) para recriá-lo")
+
+    catalog = SyntheticCatalog(scale, seed)
+    rng = np.random.default_rng(seed + 1)
+    started = time.perf_counter()
+
+    with engine.begin() as conn:
+        _insert_batches(conn, Artist.__table__, [
+            {"spotify_id": artist_spotify_id(a), "name": f"Bench Artist {a}", "genres": json.dumps(catalog.artist_genres[a])}
+            for a in range(scale.artists)
+        ], batch_size)
+        _insert_batches(conn, Track.__table__, [catalog.track_row(t) for t in range(scale.tracks)], batch_size)
+        _insert_batches(conn, User.__table__, [
+            {
+                "spotify_id": user_spotify_id(u),
+                "display_name": f"Bench User {u}",
+                "email": f"bench{u}@example.com",
+                "country": "BR",
+                "followers": int(u % 500),
+                "access_token": access_token_for(u),
+                "refresh_token": refresh_token_for(u),
+                "token_expires_at": datetime(2100, 1, 1)
+            }
+            for u in range(scale.users)
+        ], batch_size)
+
+        # Ids are assigned in insertion order on a fresh database; read them back to be safe
+        user_ids = np.array([row[0] for row in conn.execute(select(User.id).order_by(User.id))])
+        track_db_ids = np.array([row[0] for row in conn.execute(select(Track.id).order_by(Track.id))])
+
+        play_users = np.repeat(np.arange(scale.users), scale.plays_per_user)
+        play_tracks = catalog.sample_plays(rng, np.arange(scale.users), scale.plays_per_user)
+        offsets = rng.integers(0, HISTORY_DAYS * 24 * 60, len(play_users))
+        contexts = rng.integers(0, len(CONTEXT_TYPES), len(play_users))
+        for start in range(0, len(play_users), batch_size):
+            end = min(start + batch_size, len(play_users))
+            conn.execute(insert(ListeningHistory.__table__), [
+                {
+                    "user_id": int(user_ids[play_users[i]]),
+                    "track_id": int(track_db_ids[play_tracks[i]]),
+                    "played_at": HISTORY_END - timedelta(minutes=int(offsets[i])),
+                    "context_type": CONTEXT_TYPES[contexts[i]],
+                    "context_name": f"Bench {CONTEXT_TYPES[contexts[i]]}" if CONTEXT_TYPES[contexts[i]] else None
+                }
+                for i in range(start, end)
+            ])
+
+        _insert_batches(conn, UserProfile.__table__, _profile_rows(catalog, user_ids, play_users, play_tracks), batch_size)
+
+    # Rollups the app would have built incrementally, computed from the history in one pass
+    with Session(bind=engine) as session:
+        ListeningRollupService(session).rebuild()
+        session.commit()
+
+    if features_path:
+        os.makedirs(os.path.dirname(os.path.abspath(features_path)), exist_ok=True)
+        catalog.features_frame().to_csv(features_path, index=False)
+
+    engine.dispose()
+    counts = {
+        "users": scale.users,
+        "artists": scale.artists,
+        "tracks": scale.tracks,
+        "dataset_tracks": catalog.n_tracks,
+        "listening_history": scale.users * scale.plays_per_user,
+        "user_profiles": scale.users
+    }
+    print(f"✅ Dados sintéticos gerados em {time.perf_counter() - started:.1f}s: {counts}")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos determinísticos para benchmarks")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="1k")
+    parser.add_argument("--users", type=int, help="sobrescreve o número de usuários da escala")
+    parser.add_argument("--tracks", type=int, help="sobrescreve o número de músicas da escala")
+    parser.add_argument("--artists", type=int, help="sobrescreve o número de artistas da escala")
+    parser.add_argument("--plays-per-user", type=int, help="sobrescreve as execuções por usuário")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--features-csv", help="onde escrever o CSV de audio features")
+    parser.add_argument("--reset", action="store_true", help="apaga e recria todas as tabelas antes")
+    args = parser.parse_args()
+
+    overrides = {
+        key: value for key, value in {
+            "users": args.users, "tracks": args.tracks, "artists": args.artists, "plays_per_user": args.plays_per_user
+        }.items() if value is not None
+    }
+    scale = Scale(**{**asdict(SCALES[args.scale]), **overrides})
+    generate(args.database_url, scale, args.seed, args.features_csv, args.reset)
+
+if __name__ == "__main__":
+    main()
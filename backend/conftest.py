@@ -0,0 +1,100 @@
+"""Configuração dos testes (rode ``pytest`` a partir de backend/).
+
+Cada sessão usa um SQLite novo num diretório temporário: o esquema vem das migrações do
+Alembic e os dados do gerador sintético dos benchmarks (bench/synthetic.py), em escala mínima.
+"""
+import os
+import tempfile
+
+# Settings are read when app.config is imported, so the environment is fixed before any app import.
+# The database is always a throwaway file: a DATABASE_URL from the shell must never be wiped by a test run
+_TEST_DIR = tempfile.mkdtemp(prefix="soulmatch-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}",
+    "SPOTIFY_CLIENT_ID": "test-client-id",
+    "SPOTIFY_CLIENT_SECRET": "test-client-secret",
+    "SECRET_KEY": "test-secret-key",
+    "TRACKS_DATASET_PATH": os.path.join(_TEST_DIR, "features.csv"),
+    "CACHE_BACKEND": "memory",
+    "QUERY_BUDGET_MODE": "off",
+    "CLUSTERING_REFRESH_INTERVAL_MINUTES": "0",
+    "SPOTIFY_TOKEN_REFRESH_INTERVAL_SECONDS": "0"
+})
+for name in ("ASYNC_DATABASE_URL", "DB_REPLICA_URLS"):
+    os.environ.pop(name, None)
+
+from unittest import mock
+
+import pytest
+
+pytest_plugins = ["app.pytest_plugin"]
+
+from bench.scales import Scale
+
+TEST_SCALE = Scale(users=12, tracks=300, artists=40, plays_per_user=60)
+
+# Bench user index 0 is stored with id 1 on a fresh database
+TEST_USER_ID = 1
+OTHER_USER_ID = 2
+
+@pytest.fixture(scope="session")
+def catalog():
+    from bench.catalog import SyntheticCatalog
+
+    return SyntheticCatalog(TEST_SCALE)
+
+@pytest.fixture(scope="session")
+def seeded_db(catalog):
+    """Banco migrado até head, com usuários, histórico, agregados, perfis e um modelo de clusters"""
+    from alembic import command
+
+    from app.config import settings
+    from app.database import SessionLocal
+    from app.services.clustering import ClusteringService
+    from bench.synthetic import generate
+    from init_db import alembic_config
+
+    command.upgrade(alembic_config(settings.database_url), "head")
+    generate(settings.database_url, TEST_SCALE, features_path=settings.tracks_dataset_path)
+    db = SessionLocal()
+    try:
+        ClusteringService(db).perform_clustering(full_refit=True)
+    finally:
+        db.close()
+    return settings.database_url
+
+def fake_spotify_for(catalog, user_id: int, seed: int = 0):
+    from bench.fake_spotify import FakeSpotifyClient
+
+    return FakeSpotifyClient(catalog, user_index=user_id - 1, seed=seed)
+
+@pytest.fixture(scope="session")
+def auth_headers():
+    from app.utils import create_access_token
+
+    return {"Authorization": f"Bearer {create_access_token({'sub': str(TEST_USER_ID)})}"}
+
+@pytest.fixture(scope="session")
+def client(seeded_db, catalog, auth_headers):
+    """TestClient do app, depois de um sync (tallies de gêneros) e de uma compatibilidade calculada"""
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        with mock.patch("app.routers.users.get_spotify_client", return_value=fake_spotify_for(catalog, TEST_USER_ID)):
+            response = test_client.post("/users/me/sync", headers=auth_headers)
+            assert response.status_code == 200, response.text
+        response = test_client.post(f"/compatibility/calculate/{OTHER_USER_ID}", headers=auth_headers)
+        assert response.status_code == 200, response.text
+        yield test_client
+
+@pytest.fixture
+def cold_caches():
+    """Esvazia os caches do usuário de teste, para que a requisição faça todo o trabalho"""
+    from app.cache import response_cache
+    from app.utils import invalidate_principal
+
+    invalidate_principal(TEST_USER_ID)
+    response_cache.invalidate_user(TEST_USER_ID)
+    response_cache.invalidate_clusters()
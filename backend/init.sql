@@ -18,6 +18,7 @@ GRANT ALL PRIVILEGES ON DATABASE soulmatch_db TO soulmatch_user;
 
 -- Configurações de performance
 ALTER SYSTEM SET shared_preload_libraries = 'pg_stat_statements';
+-- Mantenha em sincronia com DB_MAX_CONNECTIONS (orçamento dos pools, veja /stats/pool)
 ALTER SYSTEM SET max_connections = 200;
 ALTER SYSTEM SET shared_buffers = '256MB';
 ALTER SYSTEM SET effective_cache_size = '1GB';
@@ -2,23 +2,45 @@
 
 import os
 import sys
-from sqlalchemy import create_engine, text
+from typing import Optional
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.exc import SQLAlchemyError
 
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BACKEND_DIR)
 
 from app.database import Base
 from app.config import settings
 
-def init_database():
+# Revision matching the tables the app used to create with create_all on import (the original
+# schema); the feature tables some of those databases also have are reconciled by 0001a
+BASELINE_REVISION = "0001"
+
+def alembic_config(database_url: str) -> Config:
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "migrations"))
+    config.set_main_option("sqlalchemy.url", database_url.replace("%", "%%"))
+    return config
+
+def init_database(database_url: Optional[str] = None):
+    database_url = database_url or settings.database_url
     try:
-        engine = create_engine(settings.database_url)
+        engine = create_engine(database_url)
+        config = alembic_config(database_url)
+        
+        tables = set(inspect(engine).get_table_names())
+        if "users" in tables and "alembic_version" not in tables:
+            # Created before migrations existed: the baseline is already applied
+            print(f"Marcando banco existente na revisão {BASELINE_REVISION}...")
+            command.stamp(config, BASELINE_REVISION)
         
-        print("Criando tabelas do banco de dados...")
-        Base.metadata.create_all(bind=engine)
+        print("Aplicando migrações do banco de dados...")
+        command.upgrade(config, "head")
         
         print("✅ Banco de dados inicializado com sucesso!")
-        print(f"📊 Tabelas criadas:")
+        print("📊 Tabelas:")
         for table_name in Base.metadata.tables.keys():
             print(f"   - {table_name}")
             
@@ -0,0 +1,133 @@
+"""Esquema inicial: exatamente as tabelas que o app criava com create_all antes das migrações
+
+Revision ID: 0001
+Revises: 
+Create Date: 2025-11-03 10:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('tracks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('spotify_id', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('artists', sa.Text(), nullable=True),
+    sa.Column('album', sa.String(), nullable=True),
+    sa.Column('duration_ms', sa.Integer(), nullable=True),
+    sa.Column('popularity', sa.Integer(), nullable=True),
+    sa.Column('explicit', sa.Boolean(), nullable=True),
+    sa.Column('preview_url', sa.String(), nullable=True),
+    sa.Column('external_urls', sa.Text(), nullable=True),
+    sa.Column('danceability', sa.Float(), nullable=True),
+    sa.Column('energy', sa.Float(), nullable=True),
+    sa.Column('key', sa.Integer(), nullable=True),
+    sa.Column('loudness', sa.Float(), nullable=True),
+    sa.Column('mode', sa.Integer(), nullable=True),
+    sa.Column('speechiness', sa.Float(), nullable=True),
+    sa.Column('acousticness', sa.Float(), nullable=True),
+    sa.Column('instrumentalness', sa.Float(), nullable=True),
+    sa.Column('liveness', sa.Float(), nullable=True),
+    sa.Column('valence', sa.Float(), nullable=True),
+    sa.Column('tempo', sa.Float(), nullable=True),
+    sa.Column('time_signature', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tracks_id', 'tracks', ['id'], unique=False)
+    op.create_index('ix_tracks_spotify_id', 'tracks', ['spotify_id'], unique=True)
+
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('spotify_id', sa.String(), nullable=False),
+    sa.Column('display_name', sa.String(), nullable=True),
+    sa.Column('email', sa.String(), nullable=True),
+    sa.Column('country', sa.String(), nullable=True),
+    sa.Column('followers', sa.Integer(), nullable=True),
+    sa.Column('image_url', sa.String(), nullable=True),
+    sa.Column('access_token', sa.Text(), nullable=True),
+    sa.Column('refresh_token', sa.Text(), nullable=True),
+    sa.Column('token_expires_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_users_id', 'users', ['id'], unique=False)
+    op.create_index('ix_users_spotify_id', 'users', ['spotify_id'], unique=True)
+
+    op.create_table('compatibility_scores',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user1_id', sa.Integer(), nullable=False),
+    sa.Column('user2_id', sa.Integer(), nullable=False),
+    sa.Column('overall_score', sa.Float(), nullable=False),
+    sa.Column('genre_similarity', sa.Float(), nullable=True),
+    sa.Column('artist_similarity', sa.Float(), nullable=True),
+    sa.Column('audio_features_similarity', sa.Float(), nullable=True),
+    sa.Column('listening_time_similarity', sa.Float(), nullable=True),
+    sa.Column('common_tracks', sa.Integer(), nullable=True),
+    sa.Column('analysis_date', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['user1_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['user2_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_compatibility_scores_id', 'compatibility_scores', ['id'], unique=False)
+
+    op.create_table('listening_history',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('track_id', sa.Integer(), nullable=False),
+    sa.Column('played_at', sa.DateTime(), nullable=False),
+    sa.Column('context_type', sa.String(), nullable=True),
+    sa.Column('context_name', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['track_id'], ['tracks.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_listening_history_id', 'listening_history', ['id'], unique=False)
+
+    op.create_table('user_profiles',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('top_genres', sa.Text(), nullable=True),
+    sa.Column('top_artists', sa.Text(), nullable=True),
+    sa.Column('top_tracks', sa.Text(), nullable=True),
+    sa.Column('avg_danceability', sa.Float(), nullable=True),
+    sa.Column('avg_energy', sa.Float(), nullable=True),
+    sa.Column('avg_valence', sa.Float(), nullable=True),
+    sa.Column('avg_acousticness', sa.Float(), nullable=True),
+    sa.Column('avg_instrumentalness', sa.Float(), nullable=True),
+    sa.Column('avg_liveness', sa.Float(), nullable=True),
+    sa.Column('avg_speechiness', sa.Float(), nullable=True),
+    sa.Column('avg_tempo', sa.Float(), nullable=True),
+    sa.Column('total_tracks_played', sa.Integer(), nullable=True),
+    sa.Column('unique_artists', sa.Integer(), nullable=True),
+    sa.Column('unique_genres', sa.Integer(), nullable=True),
+    sa.Column('avg_session_duration', sa.Float(), nullable=True),
+    sa.Column('cluster_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_user_profiles_id', 'user_profiles', ['id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_user_profiles_id', table_name='user_profiles')
+    op.drop_table('user_profiles')
+    op.drop_index('ix_listening_history_id', table_name='listening_history')
+    op.drop_table('listening_history')
+    op.drop_index('ix_compatibility_scores_id', table_name='compatibility_scores')
+    op.drop_table('compatibility_scores')
+    op.drop_index('ix_users_spotify_id', table_name='users')
+    op.drop_index('ix_users_id', table_name='users')
+    op.drop_table('users')
+    op.drop_index('ix_tracks_spotify_id', table_name='tracks')
+    op.drop_index('ix_tracks_id', table_name='tracks')
+    op.drop_table('tracks')
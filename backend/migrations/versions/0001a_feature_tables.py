@@ -0,0 +1,156 @@
+"""Tabelas e colunas das funcionalidades de clusterização, personas, gêneros e jobs
+
+Bancos criados pelo app antes das migrações são marcados na 0001 (o esquema original) por
+init_db.py, mas podem ter parte destas tabelas: versões intermediárias do app também rodavam
+create_all, que cria tabelas novas e nunca adiciona colunas. Por isso cada tabela, coluna e
+índice só é criado se ainda não existir.
+
+Revision ID: 0001a
+Revises: 0001
+Create Date: 2025-11-03 10:30:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001a'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+# (table, column) added to tables of the original schema
+NEW_COLUMNS = [
+    ('tracks', sa.Column('artist_ids', sa.Text(), nullable=True)),
+    # Existing profiles start at version 1 and wait for the next cluster fit
+    ('user_profiles', sa.Column('version', sa.Integer(), server_default='1', nullable=False)),
+    ('user_profiles', sa.Column('pending_cluster_fit', sa.Boolean(), server_default=sa.true(), nullable=True)),
+    ('user_profiles', sa.Column('music_persona', sa.String(), nullable=True)),
+]
+
+NEW_INDEXES = [
+    ('ix_listening_history_user_played_at', 'listening_history', ['user_id', 'played_at']),
+    ('ix_user_profiles_cluster_id', 'user_profiles', ['cluster_id']),
+    ('ix_user_profiles_music_persona', 'user_profiles', ['music_persona']),
+    ('ix_user_profiles_pending_cluster_fit', 'user_profiles', ['pending_cluster_fit']),
+]
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if 'artists' not in tables:
+        op.create_table('artists',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('spotify_id', sa.String(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('genres', sa.Text(), nullable=True),
+        sa.Column('fetched_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_artists_id', 'artists', ['id'], unique=False)
+        op.create_index('ix_artists_spotify_id', 'artists', ['spotify_id'], unique=True)
+
+    if 'cluster_models' not in tables:
+        op.create_table('cluster_models',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('n_clusters', sa.Integer(), nullable=False),
+        sa.Column('scaler_mean', sa.Text(), nullable=False),
+        sa.Column('scaler_scale', sa.Text(), nullable=False),
+        sa.Column('centroids', sa.Text(), nullable=False),
+        sa.Column('cluster_counts', sa.Text(), nullable=False),
+        sa.Column('inertia', sa.Float(), nullable=True),
+        sa.Column('n_samples_seen', sa.Integer(), nullable=True),
+        sa.Column('full_fit_samples', sa.Integer(), nullable=True),
+        sa.Column('k_selection', sa.String(), nullable=True),
+        sa.Column('selection_scores', sa.Text(), nullable=True),
+        sa.Column('last_full_fit_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_partial_fit_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_cluster_models_id', 'cluster_models', ['id'], unique=False)
+
+    if 'cluster_summary' not in tables:
+        op.create_table('cluster_summary',
+        sa.Column('cluster_id', sa.Integer(), nullable=False),
+        sa.Column('model_version', sa.Integer(), nullable=True),
+        sa.Column('user_count', sa.Integer(), nullable=True),
+        sa.Column('centroid', sa.Text(), nullable=True),
+        sa.Column('avg_danceability', sa.Float(), nullable=True),
+        sa.Column('avg_energy', sa.Float(), nullable=True),
+        sa.Column('avg_valence', sa.Float(), nullable=True),
+        sa.Column('avg_acousticness', sa.Float(), nullable=True),
+        sa.Column('avg_instrumentalness', sa.Float(), nullable=True),
+        sa.Column('avg_liveness', sa.Float(), nullable=True),
+        sa.Column('avg_speechiness', sa.Float(), nullable=True),
+        sa.Column('avg_tempo', sa.Float(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('cluster_id')
+        )
+
+    if 'persona_counts' not in tables:
+        op.create_table('persona_counts',
+        sa.Column('persona', sa.String(), nullable=False),
+        sa.Column('user_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('persona')
+        )
+
+    if 'background_jobs' not in tables:
+        op.create_table('background_jobs',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('progress', sa.Float(), nullable=True),
+        sa.Column('stage', sa.String(), nullable=True),
+        sa.Column('params', sa.Text(), nullable=True),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('requested_by', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['requested_by'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_background_jobs_kind', 'background_jobs', ['kind'], unique=False)
+        op.create_index('ix_background_jobs_status', 'background_jobs', ['status'], unique=False)
+
+    if 'user_genre_stats' not in tables:
+        op.create_table('user_genre_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('total_plays', sa.Integer(), nullable=True),
+        sa.Column('genre_counts', sa.Text(), nullable=True),
+        sa.Column('monthly_counts', sa.Text(), nullable=True),
+        sa.Column('entropy', sa.Float(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+        )
+
+    for table, column in NEW_COLUMNS:
+        if column.name not in {c['name'] for c in inspector.get_columns(table)}:
+            op.add_column(table, column)
+
+    for name, table, columns in NEW_INDEXES:
+        if name not in {i['name'] for i in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns, unique=False)
+
+def downgrade():
+    for name, table, _ in reversed(NEW_INDEXES):
+        op.drop_index(name, table_name=table)
+    for table, column in reversed(NEW_COLUMNS):
+        op.drop_column(table, column.name)
+    op.drop_table('user_genre_stats')
+    op.drop_index('ix_background_jobs_status', table_name='background_jobs')
+    op.drop_index('ix_background_jobs_kind', table_name='background_jobs')
+    op.drop_table('background_jobs')
+    op.drop_table('persona_counts')
+    op.drop_table('cluster_summary')
+    op.drop_index('ix_cluster_models_id', table_name='cluster_models')
+    op.drop_table('cluster_models')
+    op.drop_index('ix_artists_spotify_id', table_name='artists')
+    op.drop_index('ix_artists_id', table_name='artists')
+    op.drop_table('artists')
@@ -0,0 +1,30 @@
+"""Índices da busca de usuários por nome (pg_trgm)
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-11-10 10:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001a'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # SQLite has no trigram indexes; app/services/user_search.py keeps its own index in memory
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_users_display_name_prefix', 'users', [sa.text('lower(display_name) COLLATE "C"')], unique=False)
+    op.create_index(
+        'ix_users_display_name_trgm', 'users', [sa.text('lower(display_name) gist_trgm_ops')],
+        unique=False, postgresql_using='gist'
+    )
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_users_display_name_trgm', table_name='users')
+    op.drop_index('ix_users_display_name_prefix', table_name='users')
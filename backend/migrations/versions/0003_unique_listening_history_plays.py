@@ -0,0 +1,26 @@
+"""Execução única por (usuário, música, played_at) no histórico
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2025-11-17 10:00:00
+"""
+from alembic import op
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Plays stored twice by concurrent syncs would block the unique index; keep the oldest row
+    op.execute(
+        'DELETE FROM listening_history WHERE id NOT IN '
+        '(SELECT MIN(id) FROM listening_history GROUP BY user_id, track_id, played_at)'
+    )
+    op.create_index(
+        'ux_listening_history_user_track_played_at', 'listening_history',
+        ['user_id', 'track_id', 'played_at'], unique=True
+    )
+
+def downgrade():
+    op.drop_index('ux_listening_history_user_track_played_at', table_name='listening_history')
@@ -0,0 +1,68 @@
+"""Agregados diários e por hora do histórico de escuta; registro de limpezas do histórico
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-11-24 10:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('listening_daily',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('track_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('play_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['track_id'], ['tracks.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'track_id', 'day')
+    )
+    op.create_table('listening_hourly',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day_of_week', sa.Integer(), nullable=False),
+    sa.Column('hour', sa.Integer(), nullable=False),
+    sa.Column('context_type', sa.String(), nullable=False),
+    sa.Column('play_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day_of_week', 'hour', 'context_type')
+    )
+    op.create_table('history_prunes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('pruned_before', sa.DateTime(), nullable=False),
+    sa.Column('deleted_rows', sa.Integer(), nullable=False),
+    sa.Column('archive_path', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_history_prunes_id', 'history_prunes', ['id'], unique=False)
+
+    # Backfill from the raw history; same expressions as ListeningRollupService.rebuild
+    if op.get_bind().dialect.name == 'sqlite':
+        day = 'date(played_at)'
+        hour = "CAST(strftime('%H', played_at) AS INTEGER)"
+        day_of_week = "CAST(strftime('%w', played_at) AS INTEGER)"
+    else:
+        day = 'CAST(played_at AS DATE)'
+        hour = 'CAST(EXTRACT(hour FROM played_at) AS INTEGER)'
+        day_of_week = 'CAST(EXTRACT(dow FROM played_at) AS INTEGER)'
+    op.execute(
+        f'INSERT INTO listening_daily (user_id, track_id, day, play_count) '
+        f'SELECT user_id, track_id, {day}, COUNT(*) FROM listening_history GROUP BY user_id, track_id, {day}'
+    )
+    context = "COALESCE(context_type, 'unknown')"
+    op.execute(
+        f'INSERT INTO listening_hourly (user_id, day_of_week, hour, context_type, play_count) '
+        f'SELECT user_id, {day_of_week}, {hour}, {context}, COUNT(*) FROM listening_history '
+        f'GROUP BY user_id, {day_of_week}, {hour}, {context}'
+    )
+
+def downgrade():
+    op.drop_index('ix_history_prunes_id', table_name='history_prunes')
+    op.drop_table('history_prunes')
+    op.drop_table('listening_hourly')
+    op.drop_table('listening_daily')
@@ -0,0 +1,19 @@
+"""Marca nas contagens de gêneros os usuários com execuções ainda não somadas
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2025-12-01 10:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('user_genre_stats', sa.Column('needs_backfill', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+def downgrade():
+    op.drop_column('user_genre_stats', 'needs_backfill')
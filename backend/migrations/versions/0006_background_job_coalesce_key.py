@@ -0,0 +1,27 @@
+"""Chave de coalescência dos jobs, única entre os ativos (vale entre processos)
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2025-12-03 10:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+ACTIVE_JOB = sa.text("status IN ('queued', 'running')")
+
+def upgrade():
+    op.add_column('background_jobs', sa.Column('coalesce_key', sa.String(), nullable=True))
+    # Jobs already queued or running keep a NULL key: they never block the first keyed submission
+    op.create_index(
+        'ux_background_jobs_active_coalesce_key', 'background_jobs', ['coalesce_key'], unique=True,
+        sqlite_where=ACTIVE_JOB, postgresql_where=ACTIVE_JOB
+    )
+
+def downgrade():
+    op.drop_index('ux_background_jobs_active_coalesce_key', table_name='background_jobs')
+    op.drop_column('background_jobs', 'coalesce_key')
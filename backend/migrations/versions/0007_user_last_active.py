@@ -0,0 +1,22 @@
+"""Última atividade do usuário (login ou sync), para limitar a renovação proativa de tokens
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2025-12-08 10:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Existing users start as NULL: their tokens are renewed on demand until they log in or sync again
+    op.add_column('users', sa.Column('last_active_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_users_last_active_at', 'users', ['last_active_at'])
+
+def downgrade():
+    op.drop_index('ix_users_last_active_at', table_name='users')
+    op.drop_column('users', 'last_active_at')
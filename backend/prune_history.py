@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Apaga do histórico bruto as execuções antigas, arquivando-as antes se pedido.
+
+Perfis, padrões de escuta, gêneros e músicas em comum leem os agregados
+(listening_daily/listening_hourly), que não mudam. Uso (a partir de backend/):
+
+    python prune_history.py --older-than-days 365 --archive-dir /var/backups/soulmatch
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BACKEND_DIR)
+
+from app.database import SessionLocal
+from app.services.rollups import prune_history
+
+def main():
+    parser = argparse.ArgumentParser(description="Limpa execuções antigas do histórico de escuta")
+    parser.add_argument("--older-than-days", type=int, required=True, help="apaga execuções com mais dias que isso")
+    parser.add_argument("--archive-dir", help="grava as execuções apagadas em NDJSON gzip neste diretório")
+    args = parser.parse_args()
+    if args.older_than_days < 1:
+        parser.error("--older-than-days deve ser pelo menos 1")
+
+    # Midnight UTC, so a day's rollup row never mixes pruned and live plays
+    before = (datetime.utcnow() - timedelta(days=args.older_than_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    db = SessionLocal()
+    try:
+        prune = prune_history(db, before, args.archive_dir)
+        print(f"✅ {prune.deleted_rows} execuções anteriores a {before:%Y-%m-%d} removidas")
+        if prune.archive_path:
+            print(f"📦 Arquivo: {prune.archive_path}")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Erro ao limpar o histórico: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Clusterização: atribuição online, ajuste parcial, escolha de k e resumos dos clusters"""
+import json
+from unittest import mock
+
+import numpy as np
+import pytest
+from sqlalchemy import func
+
+# Users whose profiles these tests rewrite; none of the other tests reads them
+USER_IDS = [8, 9, 10, 11]
+
+def _summaries(db):
+    from app.models import ClusterSummary
+    from app.services.clustering import FEATURE_COLUMNS
+
+    return {
+        summary.cluster_id: [summary.user_count] + [getattr(summary, col) or 0.0 for col in FEATURE_COLUMNS]
+        for summary in db.query(ClusterSummary).order_by(ClusterSummary.cluster_id)
+    }
+
+def test_online_and_partial_fit_summaries_match_a_rebuild(seeded_db):
+    from app.database import SessionLocal
+    from app.models import UserProfile
+    from app.services.clustering import ClusteringService, profile_features
+
+    db = SessionLocal()
+    try:
+        service = ClusteringService(db)
+        profiles = db.query(UserProfile).filter(UserProfile.user_id.in_(USER_IDS)).order_by(UserProfile.user_id).all()
+        for i, profile in enumerate(profiles):
+            previous = profile_features(profile)
+            profile.avg_energy = 0.95 if i % 2 else 0.05
+            profile.avg_danceability = 1.0 - profile.avg_energy
+            # A missing feature counts as 0 in the deltas and must count as 0 in the rebuild too
+            profile.avg_tempo = None
+            profile.pending_cluster_fit = True
+            service.assign_profile(profile, previous)
+        db.commit()
+
+        result = service.perform_clustering(min_users=2)
+        assert result["mode"] == "partial"
+        incremental = _summaries(db)
+
+        service.refresh_summaries(service.get_model())
+        db.commit()
+        rebuilt = _summaries(db)
+        assert incremental.keys() == rebuilt.keys()
+        for cluster_id, values in rebuilt.items():
+            assert incremental[cluster_id] == pytest.approx(values, rel=1e-9, abs=1e-9)
+    finally:
+        db.close()
+
+def test_profiles_are_assigned_to_the_nearest_centroid(seeded_db):
+    from app.database import SessionLocal
+    from app.models import UserProfile
+    from app.services.clustering import FEATURE_COLUMNS, ClusteringService, ModelState
+
+    db = SessionLocal()
+    try:
+        service = ClusteringService(db)
+        state = ModelState.from_row(service.get_model())
+        centroids = state.centroids * state.scale + state.mean
+        for cluster_id, centroid in enumerate(centroids):
+            # Slightly off the centroid, still far closer to it than to any other
+            profile = UserProfile(**{col: float(value) * 1.001 for col, value in zip(FEATURE_COLUMNS, centroid)})
+            assert service.assign_profile(profile) == cluster_id
+            assert profile.cluster_id == cluster_id
+    finally:
+        # assign_profile also counted these profiles in the summaries
+        db.rollback()
+        db.close()
+
+def test_partial_fit_clears_pending_profiles_and_keeps_summary_counts(seeded_db):
+    from app.database import SessionLocal
+    from app.models import ClusterSummary, UserProfile
+    from app.services.clustering import ClusteringService, profile_features
+
+    db = SessionLocal()
+    try:
+        service = ClusteringService(db)
+        profiles = db.query(UserProfile).filter(UserProfile.user_id.in_(USER_IDS)).order_by(UserProfile.user_id).all()
+        for i, profile in enumerate(profiles):
+            previous = profile_features(profile)
+            # Pulls the profiles towards each other, so the fit moves centroids and some labels
+            profile.avg_energy = 0.5 + 0.01 * i
+            profile.avg_valence = 0.5 - 0.01 * i
+            profile.pending_cluster_fit = True
+            service.assign_profile(profile, previous)
+        db.commit()
+
+        result = service.perform_clustering(min_users=2)
+        assert result["mode"] == "partial"
+        assert result["profiles_assigned"] == len(profiles)
+        db.expire_all()
+        assert not db.query(UserProfile).filter(UserProfile.pending_cluster_fit.is_(True), UserProfile.avg_energy.isnot(None)).count()
+
+        members = dict(db.query(UserProfile.cluster_id, func.count(UserProfile.id)).filter(
+            UserProfile.avg_energy.isnot(None)
+        ).group_by(UserProfile.cluster_id).all())
+        summaries = dict(db.query(ClusterSummary.cluster_id, ClusterSummary.user_count).all())
+        assert {cluster_id: count for cluster_id, count in summaries.items() if count} == members
+    finally:
+        db.close()
+
+def test_stratified_sample_keeps_every_stratum():
+    from app.services.clustering import stratified_sample
+
+    strata = np.repeat([0, 1, 2], [900, 90, 10])
+    picked = stratified_sample(strata, 100)
+    counts = np.bincount(strata[picked], minlength=3)
+    assert counts.tolist() == [90, 9, 1]
+    assert len(np.unique(picked)) == len(picked)
+    assert stratified_sample(strata[:50], 100).tolist() == list(range(50))
+
+def test_select_k_finds_well_separated_groups():
+    from app.services.clustering import ClusteringService
+
+    rng = np.random.default_rng(0)
+    centers = np.array([[-10.0, 0.0], [0.0, 10.0], [10.0, 0.0]])
+    features = np.concatenate([center + rng.normal(scale=0.3, size=(60, 2)) for center in centers])
+    k, scores = ClusteringService(None).select_k(features, np.zeros(len(features), dtype=int))
+    assert k == 3
+    assert [entry["k"] for entry in scores] == list(range(2, 13))
+
+def test_auto_k_stays_in_range_and_stores_its_scores(seeded_db):
+    from app.config import settings
+    from app.database import SessionLocal
+    from app.services.clustering import ClusteringService
+
+    db = SessionLocal()
+    try:
+        with mock.patch.object(settings, "clustering_k_min", 2), mock.patch.object(settings, "clustering_k_max", 4):
+            result = ClusteringService(db).perform_clustering(full_refit=True, auto_k=True)
+        model = ClusteringService(db).get_model()
+        assert 2 <= model.n_clusters <= 4
+        assert model.k_selection == "auto"
+        stored = json.loads(model.selection_scores)
+        assert [entry["k"] for entry in stored] == [2, 3, 4]
+        assert stored == result["selection_scores"]
+        assert model.n_clusters == max(stored, key=lambda entry: (entry["score"], entry["silhouette"]))["k"]
+    finally:
+        db.close()
+
+def test_full_fit_reads_and_writes_in_chunks(seeded_db):
+    from app.config import settings
+    from app.database import SessionLocal
+    from app.models import UserProfile
+    from app.services.clustering import ClusteringService, profile_features
+
+    db = SessionLocal()
+    try:
+        service = ClusteringService(db)
+        valid = db.query(UserProfile).filter(UserProfile.avg_energy.isnot(None)).order_by(UserProfile.id).all()
+        expected_features = np.array([profile_features(profile) for profile in valid])
+        # Several read and write chunks for the twelve test users
+        with mock.patch.object(settings, "clustering_read_chunk_size", 5), \
+                mock.patch.object(settings, "clustering_write_chunk_size", 4):
+            chunks = [len(chunk_ids) for chunk_ids, _, _ in service._iter_feature_chunks(UserProfile.avg_energy.isnot(None))]
+            assert chunks == [min(5, len(valid) - start) for start in range(0, len(valid), 5)]
+            ids, _, features = service._load_feature_matrix(len(valid), UserProfile.avg_energy.isnot(None))
+            assert ids.tolist() == [profile.id for profile in valid]
+            assert np.allclose(features, expected_features)
+
+            # Asked for fewer rows than exist: the matrix stops there
+            ids, _, _ = service._load_feature_matrix(len(valid) - 3, UserProfile.avg_energy.isnot(None))
+            assert ids.tolist() == [profile.id for profile in valid[:-3]]
+
+            with mock.patch.object(service, "_write_labels", wraps=service._write_labels) as write_labels:
+                result = service.perform_clustering(full_refit=True)
+        assert result["profiles_assigned"] == len(valid)
+        written_ids, labels = write_labels.call_args.args[:2]
+        assert written_ids.tolist() == [profile.id for profile in valid]
+
+        # One bulk UPDATE per write chunk
+        with mock.patch.object(settings, "clustering_write_chunk_size", 4), \
+                mock.patch.object(db, "execute", wraps=db.execute) as execute:
+            service._write_labels(written_ids, labels)
+        assert execute.call_count == -(-len(valid) // 4)
+        db.commit()
+
+        db.expire_all()
+        stored = dict(db.query(UserProfile.id, UserProfile.cluster_id).filter(UserProfile.avg_energy.isnot(None)).all())
+        assert stored == {int(pid): int(label) for pid, label in zip(written_ids, labels)}
+        assert not db.query(UserProfile).filter(UserProfile.pending_cluster_fit.is_(True), UserProfile.avg_energy.isnot(None)).count()
+    finally:
+        db.close()
@@ -0,0 +1,52 @@
+"""ETags: 304 para a versão que o cliente já tem, e um ETag novo depois de um sync ou de uma clusterização"""
+from unittest import mock
+
+from conftest import TEST_USER_ID, fake_spotify_for
+
+def _etag(client, auth_headers, path):
+    response = client.get(path, headers=auth_headers)
+    assert response.status_code == 200
+    return response.headers["etag"]
+
+def test_matching_if_none_match_gets_a_304(client, auth_headers):
+    etag = _etag(client, auth_headers, "/users/me/profile")
+
+    response = client.get("/users/me/profile", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = client.get("/users/me/profile", headers={**auth_headers, "If-None-Match": '"something-else"'})
+    assert response.status_code == 200
+
+def test_if_none_match_uses_the_weak_comparison(client, auth_headers):
+    etag = _etag(client, auth_headers, "/analysis/audio-features-radar")
+
+    for header in (f"W/{etag}", f'"something-else", W/{etag}', "*"):
+        response = client.get("/analysis/audio-features-radar", headers={**auth_headers, "If-None-Match": header})
+        assert response.status_code == 304, header
+
+def test_sync_changes_the_profile_etag(client, auth_headers, catalog):
+    before = _etag(client, auth_headers, "/users/me/profile")
+
+    # Another seed returns plays the first sync did not store
+    with mock.patch("app.routers.users.get_spotify_client", return_value=fake_spotify_for(catalog, TEST_USER_ID, seed=1)):
+        assert client.post("/users/me/sync", headers=auth_headers).status_code == 200
+
+    after = _etag(client, auth_headers, "/users/me/profile")
+    assert after != before
+    assert client.get("/users/me/profile", headers={**auth_headers, "If-None-Match": before}).status_code == 200
+
+def test_clustering_run_changes_the_cluster_etags(client, auth_headers):
+    from app.database import SessionLocal
+    from app.services.clustering import ClusteringService
+
+    before = {path: _etag(client, auth_headers, path) for path in ("/analysis/my-profile", "/analysis/clusters")}
+    db = SessionLocal()
+    try:
+        ClusteringService(db).perform_clustering(full_refit=True)
+    finally:
+        db.close()
+
+    for path, etag in before.items():
+        assert _etag(client, auth_headers, path) != etag, path
@@ -0,0 +1,69 @@
+"""Exportação em streaming: NDJSON e CSV completos, parâmetros validados e /admin só para administradores"""
+import csv
+import io
+import json
+from unittest import mock
+
+import pytest
+from sqlalchemy import func
+
+from conftest import OTHER_USER_ID, TEST_USER_ID
+
+def _history_count(user_id=None):
+    from app.database import SessionLocal
+    from app.models import ListeningHistory
+
+    db = SessionLocal()
+    try:
+        query = db.query(func.count(ListeningHistory.id))
+        if user_id is not None:
+            query = query.filter(ListeningHistory.user_id == user_id)
+        return query.scalar()
+    finally:
+        db.close()
+
+@pytest.fixture
+def small_chunks():
+    from app.config import settings
+
+    # Several cursor partitions even for the small test history
+    with mock.patch.object(settings, "export_chunk_size", 7):
+        yield
+
+def test_ndjson_history_has_every_play_of_the_user(client, auth_headers, small_chunks):
+    response = client.get("/users/me/export?dataset=history&format=ndjson", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert "soulmatch-history-user-1.ndjson" in response.headers["content-disposition"]
+
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == _history_count(TEST_USER_ID)
+    assert {row["user_id"] for row in rows} == {TEST_USER_ID}
+    assert [row["played_at"] for row in rows] == sorted(row["played_at"] for row in rows)
+
+def test_csv_compatibility_has_a_header_and_the_users_scores(client, auth_headers, small_chunks):
+    response = client.get("/users/me/export?dataset=compatibility&format=csv", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert rows
+    assert {"user1_id", "user2_id", "overall_score"} <= set(rows[0])
+    assert all(TEST_USER_ID in (int(row["user1_id"]), int(row["user2_id"])) for row in rows)
+    assert any(OTHER_USER_ID in (int(row["user1_id"]), int(row["user2_id"])) for row in rows)
+
+@pytest.mark.parametrize("query", ["dataset=passwords", "format=xml"])
+def test_unknown_dataset_or_format_is_rejected(client, auth_headers, query):
+    assert client.get(f"/users/me/export?{query}", headers=auth_headers).status_code == 400
+
+def test_bulk_export_is_for_admins_only(client, auth_headers, small_chunks):
+    from app.config import settings
+
+    with mock.patch.object(settings, "admin_user_ids", []):
+        assert client.get("/admin/export", headers=auth_headers).status_code == 403
+
+    with mock.patch.object(settings, "admin_user_ids", [TEST_USER_ID]):
+        response = client.get("/admin/export?format=csv", headers=auth_headers)
+        assert response.status_code == 200
+        assert len(response.text.splitlines()) == _history_count() + 1
+        assert client.get("/admin/export?dataset=passwords", headers=auth_headers).status_code == 400
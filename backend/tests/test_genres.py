@@ -0,0 +1,39 @@
+"""Contagens de gêneros: execuções de artistas não resolvidos são somadas no sync seguinte"""
+from sqlalchemy import func
+
+from conftest import fake_spotify_for
+
+# A user the other tests don't sync, so its tallies start from scratch
+USER_ID = 6
+
+class UnavailableSpotify:
+    def artists(self, artists):
+        raise ConnectionError("Spotify fora do ar")
+
+def test_failed_artist_lookups_are_retried_on_the_next_sync(seeded_db, catalog):
+    from app.database import SessionLocal
+    from app.models import Artist, ListeningDaily, Track, UserGenreStats
+    from app.services.genres import GenreService
+
+    db = SessionLocal()
+    try:
+        all_plays = db.query(func.sum(ListeningDaily.play_count)).filter(ListeningDaily.user_id == USER_ID).scalar()
+        artist_id = db.query(Track.artist_ids).join(ListeningDaily, ListeningDaily.track_id == Track.id).filter(
+            ListeningDaily.user_id == USER_ID
+        ).first()[0].split(",")[0]
+        db.query(Artist).filter(Artist.spotify_id == artist_id).delete()
+        db.commit()
+
+        stats = GenreService(db).record_plays(USER_ID, [], UnavailableSpotify())
+        db.commit()
+        assert stats.needs_backfill
+        assert stats.total_plays < all_plays
+
+        stats = GenreService(db).record_plays(USER_ID, [], fake_spotify_for(catalog, USER_ID))
+        db.commit()
+        assert not stats.needs_backfill
+        assert stats.total_plays == all_plays
+        assert db.query(Artist).filter(Artist.spotify_id == artist_id).count() == 1
+        assert db.query(UserGenreStats).filter(UserGenreStats.user_id == USER_ID).one().total_plays == all_plays
+    finally:
+        db.close()
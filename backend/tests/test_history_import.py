@@ -0,0 +1,64 @@
+"""Importação do histórico estendido: gêneros e perfil refeitos depois do import"""
+import json
+from unittest import mock
+
+from fastapi import HTTPException
+from sqlalchemy import func
+
+from conftest import TEST_SCALE, fake_spotify_for
+
+# A user the other tests don't touch
+USER_ID = 7
+
+def _streaming_history(path, catalog, n_plays=40):
+    # Tracks past TEST_SCALE.tracks are not in the seeded database, so the import creates them without artist ids
+    rows = [catalog.track_row(TEST_SCALE.tracks + i % (catalog.n_tracks - TEST_SCALE.tracks)) for i in range(n_plays)]
+    with open(path, "w") as f:
+        json.dump([
+            {
+                "ts": f"2019-01-{1 + i % 28:02d}T{i % 24:02d}:00:00Z",
+                "ms_played": 180000,
+                "master_metadata_track_name": row["name"],
+                "master_metadata_album_artist_name": row["artists"],
+                "master_metadata_album_album_name": row["album"],
+                "spotify_track_uri": f"spotify:track:{row['spotify_id']}"
+            }
+            for i, row in enumerate(rows)
+        ], f)
+
+def test_import_tallies_genres_and_regenerates_the_profile(seeded_db, catalog, tmp_path):
+    from app.database import SessionLocal
+    from app.models import ListeningDaily, UserGenreStats, UserProfile
+    from app.services.history_import import HistoryImportService, refresh_after_import
+
+    path = tmp_path / "Streaming_History_Audio_2019.json"
+    _streaming_history(path, catalog)
+
+    db = SessionLocal()
+    try:
+        version = db.query(UserProfile.version).filter(UserProfile.user_id == USER_ID).scalar() or 0
+        counts = HistoryImportService(db).import_files(USER_ID, [str(path)])
+        assert counts["plays_inserted"] > 0
+        all_plays = db.query(func.sum(ListeningDaily.play_count)).filter(ListeningDaily.user_id == USER_ID).scalar()
+
+        # Spotify unavailable: the imported plays wait for the next sync
+        with mock.patch("app.utils.get_spotify_client", side_effect=HTTPException(status_code=401)):
+            refresh_after_import(db, USER_ID)
+        stats = db.query(UserGenreStats).filter(UserGenreStats.user_id == USER_ID).one()
+        assert stats.needs_backfill
+        assert stats.total_plays < all_plays
+
+        with mock.patch("app.utils.get_spotify_client", return_value=fake_spotify_for(catalog, USER_ID)):
+            refresh_after_import(db, USER_ID)
+        db.expire_all()
+        stats = db.query(UserGenreStats).filter(UserGenreStats.user_id == USER_ID).one()
+        assert not stats.needs_backfill
+        assert stats.total_plays == all_plays
+
+        profile = db.query(UserProfile).filter(UserProfile.user_id == USER_ID).one()
+        assert profile.total_tracks_played == all_plays
+        assert profile.version > version
+        assert profile.cluster_id is not None
+        assert profile.music_persona
+    finally:
+        db.close()
@@ -0,0 +1,76 @@
+"""Coalescência de jobs garantida pelo banco (vale entre workers)"""
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytest
+
+def _active_job(db, coalesce_key, heartbeat_at=None):
+    import uuid
+
+    from app.models import BackgroundJob
+
+    job = BackgroundJob(
+        id=uuid.uuid4().hex, kind="test", status="running", coalesce_key=coalesce_key,
+        heartbeat_at=heartbeat_at or datetime.utcnow()
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+@pytest.fixture
+def sessions(seeded_db):
+    from app.database import SessionLocal
+
+    first, second = SessionLocal(), SessionLocal()
+    yield first, second
+    first.close()
+    second.close()
+
+def test_the_worker_that_loses_the_race_gets_the_other_job(sessions):
+    from app.models import BackgroundJob
+    from app.services import jobs
+
+    worker_a, worker_b = sessions
+    real_find = jobs._find_active_job
+    calls = []
+
+    def find_after_the_other_insert(db, key):
+        # Worker B looks up before worker A inserts, as if the two submissions ran side by side
+        calls.append(key)
+        if len(calls) == 1:
+            _active_job(worker_a, key)
+            return None
+        return real_find(db, key)
+
+    with mock.patch.object(jobs, "_find_active_job", side_effect=find_after_the_other_insert):
+        job, coalesced = jobs._create_job(worker_b, "test", "test:race", {}, None)
+    assert coalesced
+    assert job.coalesce_key == "test:race"
+    assert worker_b.query(BackgroundJob).filter(BackgroundJob.coalesce_key == "test:race").count() == 1
+
+def test_stale_jobs_release_their_key(sessions):
+    from app.config import settings
+    from app.models import BackgroundJob
+    from app.services import jobs
+
+    db, _ = sessions
+    stale = _active_job(db, "test:stale", datetime.utcnow() - timedelta(minutes=settings.job_stale_after_minutes + 1))
+    job, coalesced = jobs._create_job(db, "test", "test:stale", {}, None)
+    assert not coalesced
+    assert job.id != stale.id
+    assert db.get(BackgroundJob, stale.id).status == "failed"
+
+def test_clustering_job_runs_in_a_spawned_worker(client, auth_headers):
+    import time
+
+    from app.services.jobs import get_executor
+
+    assert get_executor()._mp_context.get_start_method() == "spawn"
+    job = client.post("/analysis/clustering?min_users=2", headers=auth_headers).json()
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        status = client.get(f"/analysis/clustering/{job['job_id']}", headers=auth_headers).json()
+        if status["status"] in ("succeeded", "failed"):
+            break
+        time.sleep(0.2)
+    assert status["status"] == "succeeded", status
@@ -0,0 +1,31 @@
+"""/metrics: séries por template completo da rota"""
+
+def _duration_counts(text: str) -> dict:
+    counts = {}
+    for line in text.splitlines():
+        if line.startswith("http_request_duration_seconds_count{"):
+            labels, value = line.rsplit(" ", 1)
+            counts[labels] = float(value)
+    return counts
+
+def test_routes_with_the_same_path_in_different_routers_get_separate_series(client, auth_headers):
+    # Both routers declare "/me"; only the prefix tells them apart
+    before = _duration_counts(client.get("/metrics").text)
+    assert client.get("/auth/me", headers=auth_headers).status_code == 200
+    assert client.get("/users/me", headers=auth_headers).status_code == 200
+    assert client.get("/users/me", headers=auth_headers).status_code == 200
+    after = _duration_counts(client.get("/metrics").text)
+
+    def delta(route: str) -> float:
+        key = f'http_request_duration_seconds_count{{method="GET",route="{route}",status="200"}}'
+        return after.get(key, 0) - before.get(key, 0)
+
+    assert delta("/auth/me") == 1
+    assert delta("/users/me") == 2
+    assert delta("/me") == 0
+
+def test_path_parameters_are_labelled_by_template(client, auth_headers):
+    client.get("/users/2", headers=auth_headers)
+    text = client.get("/metrics").text
+    assert 'route="/users/{user_id}"' in text
+    assert 'route="/users/2"' not in text
@@ -0,0 +1,42 @@
+"""/analysis/personas: paginação validada na entrada"""
+import pytest
+
+@pytest.mark.parametrize("query", ["limit=0", "limit=-1", "limit=101", "offset=-1"])
+def test_out_of_range_paging_is_rejected(client, auth_headers, query):
+    response = client.get(f"/analysis/personas?persona=any&{query}", headers=auth_headers)
+    assert response.status_code == 422
+
+def test_limit_bounds_the_page(client, auth_headers):
+    from app.database import SessionLocal
+    from app.models import UserProfile
+
+    db = SessionLocal()
+    try:
+        persona = db.query(UserProfile.music_persona).filter(UserProfile.music_persona.isnot(None)).first()[0]
+    finally:
+        db.close()
+    response = client.get("/analysis/personas", params={"persona": persona, "limit": 1}, headers=auth_headers)
+    assert response.status_code == 200
+    assert len(response.json()["users"]) == 1
+
+def test_moves_into_a_new_persona_are_counted_from_every_session(seeded_db):
+    from app.database import SessionLocal
+    from app.models import PersonaCount
+    from app.services.personas import PersonaService
+
+    first, second = SessionLocal(), SessionLocal()
+    try:
+        for db in (first, second):
+            PersonaService(db).move(None, "Persona de Teste")
+            db.commit()
+        PersonaService(first).move("Persona de Teste", "Outra Persona de Teste")
+        first.commit()
+        counts = dict(first.query(PersonaCount.persona, PersonaCount.user_count).filter(
+            PersonaCount.persona.in_(["Persona de Teste", "Outra Persona de Teste"])
+        ).all())
+        assert counts == {"Persona de Teste": 1, "Outra Persona de Teste": 1}
+    finally:
+        first.query(PersonaCount).filter(PersonaCount.persona.in_(["Persona de Teste", "Outra Persona de Teste"])).delete()
+        first.commit()
+        first.close()
+        second.close()
@@ -0,0 +1,33 @@
+"""Orçamentos de queries (@query_budget): toda rota declara um e as leituras principais o respeitam"""
+import pytest
+
+from conftest import OTHER_USER_ID
+
+MAIN_GETS = [
+    "/users/me",
+    "/users/me/profile",
+    "/users/search?query=bench",
+    f"/users/{OTHER_USER_ID}",
+    "/analysis/my-profile",
+    "/analysis/clusters",
+    "/analysis/listening-patterns",
+    "/analysis/personas",
+    "/analysis/genre-analysis",
+    "/analysis/audio-features-radar",
+    "/compatibility/scores",
+    "/compatibility/top-matches",
+    f"/compatibility/with/{OTHER_USER_ID}",
+    "/compatibility/similar-users",
+    "/stats/pool",
+    "/metrics"
+]
+
+def test_every_route_declares_a_budget(assert_all_routes_budgeted):
+    from app.main import app
+
+    assert_all_routes_budgeted(app)
+
+@pytest.mark.parametrize("path", MAIN_GETS)
+def test_main_gets_stay_within_budget(client, auth_headers, within_route_budget, cold_caches, path):
+    response = within_route_budget(client, "GET", path, headers=auth_headers)
+    assert response.status_code == 200, response.text
@@ -0,0 +1,83 @@
+"""Leituras em réplicas: round-robin, volta ao primário e janela de read-your-writes"""
+import asyncio
+import sqlite3
+import time
+from unittest import mock
+
+import pytest
+from sqlalchemy import text
+
+# Users the other tests don't read as, so their read-your-writes marks start empty
+USER_ID = 9
+OTHER_USER_ID = 10
+
+def _replica_file(path, name):
+    # Each replica answers with its own name, so a test can tell which one served the read
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE replica (name TEXT)")
+        conn.execute("INSERT INTO replica VALUES (?)", (name,))
+    return f"sqlite+aiosqlite:///{path}"
+
+def _served_by(urls):
+    """Roda as leituras com ReplicaSessions apontando para urls e devolve quem atendeu cada uma"""
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    from app import database
+
+    async def read_as(user_ids):
+        engines = [create_async_engine(url) for url in urls]
+        sessions = [async_sessionmaker(engine, class_=AsyncSession) for engine in engines]
+        served = []
+        try:
+            with mock.patch.object(database, "ReplicaSessions", sessions):
+                for user_id in user_ids:
+                    if user_id is None:
+                        database.mark_recent_write(USER_ID)
+                        continue
+                    async with await database.open_read_session(user_id) as db:
+                        try:
+                            served.append(await db.scalar(text("SELECT name FROM replica")))
+                        except OperationalError:
+                            served.append("primary")
+        finally:
+            for engine in engines:
+                await engine.dispose()
+        return served
+
+    return read_as
+
+@pytest.fixture
+def replicas(seeded_db, tmp_path):
+    from app import database
+
+    urls = [_replica_file(tmp_path / f"replica_{name}.db", name) for name in ("a", "b")]
+    # Fresh health and read-your-writes state for each test
+    with mock.patch.dict(database._replica_down_until, clear=True), \
+            mock.patch.object(database, "_recent_writes", database.MemoryCache()):
+        yield urls
+
+def test_reads_alternate_between_replicas(replicas):
+    served = asyncio.run(_served_by(replicas)([USER_ID] * 4))
+    assert sorted(served) == ["a", "a", "b", "b"]
+    assert served[0] != served[1] and served[1] != served[2]
+
+def test_an_unreachable_replica_falls_back_to_the_primary(replicas, tmp_path):
+    from app import database
+
+    down = f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}"
+    assert asyncio.run(_served_by([down])([USER_ID])) == ["primary"]
+    assert database._replica_down_until[0] > time.monotonic()
+
+    # The dead replica is skipped while it cools down; the healthy one keeps serving
+    assert asyncio.run(_served_by([down, replicas[0]])([USER_ID] * 2)) == ["a", "a"]
+
+def test_a_users_reads_stay_on_the_primary_after_their_write(replicas):
+    from app.config import settings
+
+    with mock.patch.object(settings, "read_your_writes_seconds", 1):
+        read_as = _served_by(replicas[:1])
+        # None marks a write by USER_ID between the reads
+        assert asyncio.run(read_as([USER_ID, None, USER_ID, OTHER_USER_ID])) == ["a", "primary", "a"]
+        time.sleep(1.1)
+        assert asyncio.run(read_as([USER_ID])) == ["a"]
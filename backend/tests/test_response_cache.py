@@ -0,0 +1,28 @@
+"""Cache de respostas: uma escrita feita por outro worker não deixa servir um corpo antigo"""
+from conftest import TEST_USER_ID
+
+def test_profile_version_from_the_database_keys_the_cached_body(client, auth_headers):
+    from app.database import SessionLocal
+    from app.models import UserProfile
+
+    first = client.get("/analysis/audio-features-radar", headers=auth_headers)
+    assert first.status_code == 200
+
+    # What a sync on another worker leaves behind: a new profile version, but this worker's
+    # in-memory generation counters were never bumped
+    db = SessionLocal()
+    try:
+        profile = db.query(UserProfile).filter(UserProfile.user_id == TEST_USER_ID).one()
+        energy = profile.avg_energy
+        profile.avg_energy = 0.123
+        profile.version += 1
+        db.commit()
+
+        second = client.get("/analysis/audio-features-radar", headers=auth_headers)
+        assert second.headers["etag"] != first.headers["etag"]
+        assert second.json()["values"][1] == 0.123
+    finally:
+        profile.avg_energy = energy
+        profile.version += 1
+        db.commit()
+        db.close()
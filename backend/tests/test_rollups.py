@@ -0,0 +1,77 @@
+"""Agregados de escuta: somar execuções no sync dá o mesmo que recalcular, e o prune não muda estatísticas"""
+from datetime import datetime
+
+from sqlalchemy import func
+
+from conftest import TEST_USER_ID
+
+# A user no other test syncs or imports for
+USER_ID = 12
+
+def _rollups(db, user_id=None):
+    from app.models import ListeningDaily, ListeningHourly
+
+    daily = db.query(ListeningDaily.user_id, ListeningDaily.track_id, ListeningDaily.day, ListeningDaily.play_count)
+    hourly = db.query(
+        ListeningHourly.user_id, ListeningHourly.day_of_week, ListeningHourly.hour,
+        ListeningHourly.context_type, ListeningHourly.play_count
+    )
+    if user_id is not None:
+        daily = daily.filter(ListeningDaily.user_id == user_id)
+        hourly = hourly.filter(ListeningHourly.user_id == user_id)
+    return sorted(map(tuple, daily.all())), sorted(map(tuple, hourly.all()))
+
+def test_incremental_rollups_match_a_rebuild(seeded_db):
+    from app.database import SessionLocal
+    from app.models import ListeningDaily, ListeningHistory, ListeningHourly
+    from app.services.rollups import ListeningRollupService
+
+    db = SessionLocal()
+    try:
+        plays = db.query(ListeningHistory.track_id, ListeningHistory.played_at, ListeningHistory.context_type).filter(
+            ListeningHistory.user_id == USER_ID
+        ).order_by(ListeningHistory.id).all()
+        assert plays
+
+        db.query(ListeningDaily).filter(ListeningDaily.user_id == USER_ID).delete()
+        db.query(ListeningHourly).filter(ListeningHourly.user_id == USER_ID).delete()
+        # Sync-sized pages, so the same day/hour is incremented across calls
+        service = ListeningRollupService(db)
+        for start in range(0, len(plays), 25):
+            service.record_plays(USER_ID, plays[start:start + 25])
+        db.commit()
+        incremental = _rollups(db, USER_ID)
+
+        service.rebuild(USER_ID)
+        db.commit()
+        assert _rollups(db, USER_ID) == incremental
+    finally:
+        db.close()
+
+def test_prune_leaves_derived_stats_unchanged(client, auth_headers, cold_caches):
+    from app.cache import response_cache
+    from app.database import SessionLocal
+    from app.models import HistoryPrune, ListeningHistory
+    from app.services.rollups import prune_history
+
+    cutoff = datetime(2024, 10, 1)
+    patterns = client.get("/analysis/listening-patterns", headers=auth_headers).json()
+    db = SessionLocal()
+    try:
+        rollups = _rollups(db)
+        old_plays = db.query(func.count(ListeningHistory.id)).filter(ListeningHistory.played_at < cutoff).scalar()
+        assert old_plays
+
+        prune = prune_history(db, cutoff, chunk_size=50)
+        assert prune.deleted_rows == old_plays
+        assert not db.query(ListeningHistory).filter(ListeningHistory.played_at < cutoff).count()
+        assert _rollups(db) == rollups
+
+        # Rebuilt from the rollups, not served from the cache filled above
+        response_cache.invalidate_user(TEST_USER_ID)
+        assert client.get("/analysis/listening-patterns", headers=auth_headers).json() == patterns
+    finally:
+        # Later syncs and imports may bring plays older than the cutoff
+        db.query(HistoryPrune).delete()
+        db.commit()
+        db.close()
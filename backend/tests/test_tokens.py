@@ -0,0 +1,66 @@
+"""Renovação proativa de tokens: só usuários ativos, e um job por vez entre os workers"""
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytest
+
+# Users the other tests don't authenticate with
+ACTIVE_USER_ID = 3
+IDLE_USER_ID = 4
+
+@pytest.fixture
+def expiring_tokens(seeded_db):
+    from app.database import SessionLocal
+    from app.models import User
+
+    db = SessionLocal()
+    now = datetime.utcnow()
+    users = {user.id: user for user in db.query(User).filter(User.id.in_([ACTIVE_USER_ID, IDLE_USER_ID]))}
+    saved = {user_id: (user.token_expires_at, user.last_active_at) for user_id, user in users.items()}
+    users[ACTIVE_USER_ID].last_active_at = now - timedelta(days=1)
+    users[IDLE_USER_ID].last_active_at = now - timedelta(days=90)
+    for user in users.values():
+        user.token_expires_at = now + timedelta(seconds=10)
+    db.commit()
+    yield {user_id: user.refresh_token for user_id, user in users.items()}
+    for user_id, (expires_at, last_active_at) in saved.items():
+        users[user_id].token_expires_at = expires_at
+        users[user_id].last_active_at = last_active_at
+    db.commit()
+    db.close()
+
+def test_only_recently_active_users_are_refreshed(expiring_tokens):
+    from app.database import SessionLocal
+    from app.models import User
+    from app.services.tokens import token_manager
+
+    oauth = mock.Mock()
+    oauth.refresh_access_token.side_effect = lambda refresh_token: {"access_token": f"new-{refresh_token}", "expires_in": 3600}
+    with mock.patch.object(token_manager, "_oauth", oauth):
+        assert token_manager.refresh_expiring() == 1
+
+    oauth.refresh_access_token.assert_called_once_with(expiring_tokens[ACTIVE_USER_ID])
+    db = SessionLocal()
+    try:
+        assert db.get(User, ACTIVE_USER_ID).access_token == f"new-{expiring_tokens[ACTIVE_USER_ID]}"
+        assert db.get(User, IDLE_USER_ID).token_expires_at <= datetime.utcnow() + timedelta(seconds=10)
+    finally:
+        db.close()
+
+def test_one_refresh_job_runs_across_workers(seeded_db):
+    from app.database import SessionLocal
+    from app.services import jobs
+
+    db = SessionLocal()
+    try:
+        with mock.patch.object(jobs, "get_executor") as get_executor:
+            first, coalesced = jobs.submit_token_refresh_job(db)
+            assert not coalesced
+            # Another worker's loop ticks while the first refresh is still queued
+            second, coalesced = jobs.submit_token_refresh_job(db)
+        assert coalesced
+        assert second.id == first.id
+        get_executor.return_value.submit.assert_called_once_with(jobs.run_token_refresh_job, first.id)
+    finally:
+        jobs._update_job(first.id, status="succeeded", finished_at=datetime.utcnow())
+        db.close()
@@ -0,0 +1,54 @@
+"""Busca de usuários: exatos, depois prefixos, depois substrings; renomeações durante a reconstrução"""
+import asyncio
+import time
+from unittest import mock
+
+NAMES = {1: "Joana", 2: "Ana Clara", 3: "ana", 4: "Anabel", 5: "Mariana", 6: "Banana Split", 7: None}
+
+def _index():
+    from app.services.user_search import UserSearchIndex
+
+    index = UserSearchIndex()
+    index.extend(sorted(NAMES.items()))
+    return index
+
+def test_exact_then_prefix_then_substring():
+    assert _index().search("ana", exclude_user_id=0, limit=10) == [3, 2, 4, 1, 5, 6]
+
+def test_short_queries_only_match_prefixes():
+    assert _index().search("an", exclude_user_id=0, limit=10) == [3, 2, 4]
+
+def test_limit_and_excluded_user():
+    assert _index().search("ana", exclude_user_id=3, limit=3) == [2, 4, 1]
+
+def test_added_and_renamed_users_are_found_by_their_new_name():
+    index = _index()
+    index.add(8, "Anastácia")
+    index.add(4, "Beatriz")
+    assert index.search("ana", exclude_user_id=0, limit=10) == [3, 2, 8, 1, 5, 6]
+    assert index.search("bea", exclude_user_id=0, limit=10) == [4]
+    assert len(index) == 7
+
+def test_rename_during_a_rebuild_reaches_the_new_index(seeded_db):
+    from app.database import AsyncSessionLocal
+    from app.services import user_search
+
+    stale = user_search.UserSearchIndex()
+    stale.built_at = time.monotonic() - 3600 * 24
+    real_extend = user_search.UserSearchIndex.extend
+
+    def extend_while_renaming(index, rows):
+        # The login that renames the user commits after the rebuild read its rows
+        user_search.index_user(5, "Renomeado Durante a Reconstrução")
+        real_extend(index, rows)
+
+    async def rebuild():
+        async with AsyncSessionLocal() as db:
+            return await user_search._current_index(db)
+
+    with mock.patch.object(user_search, "_index", stale), \
+            mock.patch.object(user_search.UserSearchIndex, "extend", extend_while_renaming):
+        fresh = asyncio.run(rebuild())
+    assert fresh is not stale
+    assert fresh.search("renomeado", exclude_user_id=0, limit=10) == [5]
+    assert not user_search._pending_renames
@@ -14,6 +14,22 @@ interface DashboardStats {
   musicPersona?: string;
 }
 
+const CLUSTERING_POLL_INTERVAL_MS = 1500;
+const CLUSTERING_POLL_TIMEOUT_MS = 120000;
+
+// POST /analysis/clustering only queues the job (202); wait for it before reloading the cluster
+const waitForClusteringJob = async (jobId: string): Promise<string> => {
+  const deadline = Date.now() + CLUSTERING_POLL_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    const { data } = await analysisAPI.getClusteringJob(jobId);
+    if (data.status === 'succeeded' || data.status === 'failed') {
+      return data.status;
+    }
+    await new Promise(resolve => setTimeout(resolve, CLUSTERING_POLL_INTERVAL_MS));
+  }
+  return 'timeout';
+};
+
 const Dashboard: React.FC = () => {
   const { user } = useAuth();
   const navigate = useNavigate();
@@ -59,8 +75,13 @@ const Dashboard: React.FC = () => {
     try {
       setIsSyncing(true);
       await userAPI.syncData();
-      await analysisAPI.performClustering(1);
-      toast.success('Dados sincronizados com sucesso!');
+      const { data: job } = await analysisAPI.performClustering(1);
+      const jobStatus = await waitForClusteringJob(job.job_id);
+      if (jobStatus === 'succeeded') {
+        toast.success('Dados sincronizados com sucesso!');
+      } else {
+        toast.error('Dados sincronizados, mas a clusterização não terminou');
+      }
       await loadDashboardData();
     } catch (error) {
       console.error('Erro ao sincronizar dados:', error);
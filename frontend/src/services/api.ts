@@ -75,7 +75,11 @@ export const analysisAPI = {
   getClusterAnalysis: () => api.get('/analysis/clusters'),
   performClustering: (minUsers = 10) => 
     api.post(`/analysis/clustering?min_users=${minUsers}`),
+  getClusteringJob: (jobId: string) =>
+    api.get(`/analysis/clustering/${jobId}`),
   getListeningPatterns: () => api.get('/analysis/listening-patterns'),
   getGenreAnalysis: () => api.get('/analysis/genre-analysis'),
+  getPersonas: (persona?: string, limit = 20, offset = 0) =>
+    api.get('/analysis/personas', { params: { persona, limit, offset } }),
   getAudioFeaturesRadar: () => api.get('/analysis/audio-features-radar'),
 };